@@ -0,0 +1,171 @@
+import sys
+import time
+import json
+import random
+import argparse
+import tracemalloc
+from robostat.rulesets.xsumo import XSRuleset, XMRuleset
+from robostat.rulesets.rescue import RescueRuleset
+from robostat.rulesets.haastattelu import HaastatteluRuleset
+from benchmarks.synth import RESCUE_MAX_TIME, DANCE_INTERVIEW, DANCE_PERFORMANCE, random_scores
+
+# Ruleset.encode/decode/validate -mikrobenchmarkit kaikille säännöstöille.
+# Ajetaan joko `python -m benchmarks.codec` tai `pytest -m benchmark`.
+
+CASES = {
+    "xs": XSRuleset(),
+    "xm": XMRuleset(),
+    "rescue1": RescueRuleset.by_difficulty(1, max_time=RESCUE_MAX_TIME),
+    "rescue2": RescueRuleset.by_difficulty(2, max_time=RESCUE_MAX_TIME),
+    "rescue3": RescueRuleset.by_difficulty(3, max_time=RESCUE_MAX_TIME),
+    "dance.interview": DANCE_INTERVIEW,
+    "dance.performance": DANCE_PERFORMANCE,
+    "haastattelu": HaastatteluRuleset()
+}
+
+# Lukittu tallennusmuoto: (tapaus, blob hexinä, str(decode(blob))).
+# Jos nämä muuttuu, vanhojen tietokantojen pisteet ei enää lue oikein.
+GOLDEN = [
+    ("xs", "5703014c01570057", "W|1+0|1+3|0+3"),
+    ("xs", "4c01004c", "L|0+0"),
+    ("xm", "5401020003", "T|3"),
+    ("xm", "57020203000101", "W|3|1"),
+    ("rescue1", "022e4603000000010148484648", "30p, 09:18"),
+    ("rescue2", "00cb480301030200010302020101020000030002024853464853", "165p, 03:23"),
+    ("rescue3", "022546030002020100000102000100030203020102020102000101465353534848",
+        "185p, 09:09"),
+    ("dance.interview", "0102010000000203020000", "11p"),
+    ("dance.performance", "0402010303020101010101020302030201", "33p"),
+    ("haastattelu", "01", "True"),
+    ("haastattelu", "00", "False")
+]
+
+# -> [(score, ...)], validate ottaa yhden tuplen kerrallaan
+def sample_scores(name, n, seed=0):
+    rnd = random.Random(seed)
+    ruleset = CASES[name]
+
+    if isinstance(ruleset, HaastatteluRuleset):
+        return [(rnd.random() < 0.5,) for _ in range(n)]
+
+    return [random_scores(ruleset, rnd) for _ in range(n)]
+
+def check_golden(name, blob, expected):
+    ruleset = CASES[name]
+    data = bytes.fromhex(blob)
+    score = ruleset.decode(data)
+
+    if str(score) != expected:
+        raise AssertionError("%s: decode(%s) = %s, expected %s" % (name, blob, score, expected))
+
+    if bytes(ruleset.encode(score)) != data:
+        raise AssertionError("%s: encode(decode(%s)) = %s" % (name, blob,
+            bytes(ruleset.encode(score)).hex()))
+
+def check_roundtrip(name, scores):
+    ruleset = CASES[name]
+
+    for ss in scores:
+        for s in ss:
+            data = bytes(ruleset.encode(s))
+            again = bytes(ruleset.encode(ruleset.decode(data)))
+            if again != data:
+                raise AssertionError("%s: roundtrip %s != %s" % (name, data.hex(), again.hex()))
+
+def ops_per_sec(f, args, min_time):
+    n = 0
+    start = time.perf_counter()
+
+    while True:
+        for a in args:
+            f(*a)
+        n += len(args)
+
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return n / elapsed
+
+# -> (keskimääräinen huippumuisti kutsun aikana, kutsun jälkeen jäljelle jäävä muisti)
+def bytes_per_call(f, args):
+    peak = retained = 0
+    results = []
+
+    tracemalloc.start()
+    try:
+        for a in args:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            # tulos pidetään elossa, jotta se lasketaan jäljelle jääväksi
+            results.append(f(*a))
+            cur, pk = tracemalloc.get_traced_memory()
+            peak += pk - base
+            retained += cur - base
+    finally:
+        tracemalloc.stop()
+
+    return peak / len(args), retained / len(args)
+
+def bench_case(name, n=200, min_time=0.2, seed=0):
+    ruleset = CASES[name]
+    scores = sample_scores(name, n, seed)
+    check_roundtrip(name, scores)
+
+    singles = [(s,) for ss in scores for s in ss]
+    blobs = [(bytes(ruleset.encode(s)),) for s, in singles]
+
+    ret = {}
+    for op, f, args in (
+            ("encode", ruleset.encode, singles),
+            ("decode", ruleset.decode, blobs),
+            ("validate", ruleset.validate, scores)):
+        peak, retained = bytes_per_call(f, args)
+        ret[op] = {
+            "ops": ops_per_sec(f, args, min_time),
+            "bytes_peak": peak,
+            "bytes_retained": retained
+        }
+
+    ret["size"] = sum(len(b) for b, in blobs) / len(blobs)
+    return ret
+
+def run(cases=None, n=200, min_time=0.2, seed=0):
+    if cases is None:
+        cases = list(CASES)
+
+    for name, blob, expected in GOLDEN:
+        if name in cases:
+            check_golden(name, blob, expected)
+
+    return dict((name, bench_case(name, n=n, min_time=min_time, seed=seed)) for name in cases)
+
+def format_results(results):
+    lines = ["%-20s %-9s %12s %12s %12s" % ("case", "op", "ops/s", "peak B", "retained B")]
+
+    for name, res in results.items():
+        for op in ("encode", "decode", "validate"):
+            r = res[op]
+            lines.append("%-20s %-9s %12.0f %12.0f %12.0f" % (name, op, r["ops"],
+                r["bytes_peak"], r["bytes_retained"]))
+
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Codec micro-benchmarks")
+    parser.add_argument("cases", nargs="*", metavar="case",
+            help="Cases to run (default: all): %s" % ", ".join(CASES))
+    parser.add_argument("-n", type=int, default=200, help="Sample scores per case")
+    parser.add_argument("-t", "--time", type=float, default=0.2, help="Seconds per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    for c in args.cases:
+        if c not in CASES:
+            parser.error("unknown case: %s" % c)
+
+    results = run(args.cases or None, n=args.n, min_time=args.time, seed=args.seed)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        print(format_results(results))
@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+import json
+import platform
+import tempfile
+import sqlite3
+import statistics
+import contextlib
+import sqlalchemy as sa
+from sqlalchemy.orm import sessionmaker
+from robostat.registry import load_init
+from robostat.tournament import decode_block_scores
+from benchmarks.synth import Synth, RULESETS, create_db, write_init
+
+# Koko putki synteettisellä turnauksella: tietokannan täyttö, dekoodaus, jokainen
+# ranking ja show-komennot. Tulokset on json-muodossa, jotta eri versioita voi verrata.
+
+FORMAT_VERSION = 2
+
+SHOW_COMMANDS = [
+    ("blocks",),
+    ("teams",),
+    ("block", "xs.0"),
+    ("scores", "xs.0"),
+    ("ranking", "xs.0.score"),
+    ("ranking", "rescue1")
+]
+
+def timeit(f, repeat):
+    times = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+
+    return {
+        "min": min(times),
+        "median": statistics.median(times),
+        "repeat": repeat
+    }
+
+def _with_session(Session, f):
+    def ret():
+        db = Session()
+        try:
+            f(db)
+        finally:
+            db.close()
+    return ret
+
+# Kuten erillinen `rsx show` -ajo: init ajetaan joka kerta uudestaan
+# (käännetty koodi tulee silti välimuistista)
+def _show(args, db_path, init_path):
+    from click.testing import CliRunner
+    from robostat.rsx.common import init_registry
+    from robostat.rsx.show import show_command
+
+    runner = CliRunner()
+
+    def ret():
+        init_registry.discard(init_path)
+        res = runner.invoke(show_command, ["-d", db_path, "-i", init_path, *args])
+        if res.exit_code != 0:
+            raise RuntimeError("show %s failed: %s" % (" ".join(args), res.output))
+
+    return ret
+
+def run(teams=60, blocks=2, repeat=3, played=1.0, seed=0, workdir=None, log=None):
+    if log is None:
+        log = lambda mes: None
+
+    with contextlib.ExitStack() as stack:
+        if workdir is None:
+            workdir = stack.enter_context(tempfile.TemporaryDirectory(prefix="robostat-bench-"))
+
+        db_path = os.path.join(workdir, "bench.db")
+        init_path = os.path.join(workdir, "bench_init.py")
+
+        if os.path.exists(db_path):
+            os.unlink(db_path)
+
+        synth = Synth(teams=teams, blocks=blocks, played=played, seed=seed)
+        engine = create_db(db_path)
+        Session = sessionmaker(bind=engine)
+        write_init(init_path, blocks)
+        results = {}
+
+        # nämä muuttaa tietokantaa, joten ne ajetaan vain kerran
+        # ORM:n add_all synteettisellä datalla, ei rsx importia (joka vaatii pttt:n)
+        log("populate")
+        results["populate"] = timeit(_with_session(Session, synth.populate), 1)
+        log("judge")
+        results["judge"] = timeit(_with_session(Session, synth.judge), 1)
+
+        tournament = load_init(init_path).tournament
+
+        for prefix in RULESETS:
+            log("decode %s" % prefix)
+            bs = [tournament.blocks[b] for b in synth.block_ids(prefix)]
+            results["decode.%s" % prefix] = timeit(_with_session(Session,
+                lambda db: decode_block_scores(db, *bs)), repeat)
+
+        for id, ranking in tournament.rankings.items():
+            log("ranking %s" % id)
+            results["ranking.%s" % id] = timeit(_with_session(Session, ranking), repeat)
+
+        for args in SHOW_COMMANDS:
+            log("show %s" % " ".join(args))
+            results["show.%s" % ".".join(args)] = timeit(_show(args, db_path, init_path), repeat)
+
+        engine.dispose()
+
+    return {
+        "format": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "sqlalchemy": sa.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "params": {
+            "teams": teams,
+            "blocks": blocks,
+            "repeat": repeat,
+            "played": played,
+            "seed": seed
+        },
+        "results": results
+    }
+
+# -> [(nimi, vanha, uusi, uusi/vanha)], mediaaneista
+def compare(old, new):
+    ret = []
+
+    for name, res in new["results"].items():
+        if name in old["results"]:
+            o, n = old["results"][name]["median"], res["median"]
+            ret.append((name, o, n, n/o if o else None))
+
+    return ret
+
+if __name__ == "__main__":
+    json.dump(run(log=lambda mes: print(mes, file=sys.stderr)), sys.stdout, indent=2)
@@ -0,0 +1,275 @@
+import random
+import itertools
+import sqlalchemy as sa
+import robostat
+import robostat.db as model
+from robostat.tournament import MultiBlockAggregate, aggregate_scores, sort_ranking, decode_block_scores,\
+        tiebreak_weights, combine_tiebreaks
+from robostat.rulesets.xsumo import XSRuleset, XMRuleset, XSumoScore, XSRoundScore, XMRoundScore,\
+        XSumoResult, XSumoScoreRank, XSumoWinsRank, calc_results
+from robostat.rulesets.rescue import RescueRuleset, RescueResult, RescueMaxRank,\
+        RescueObstacleCategory, RescueMultiObstacleCategory, RescueMultiObstacleScore
+from robostat.rulesets.tanssi import get_dance_rulesets
+from robostat.rankings import MaxRank
+from robostat.replay import Replay
+from robostat.ruleset import IntCategory
+
+# Synteettinen turnaus benchmarkeja varten.
+# Jokaisesta säännöstöstä tehdään `blocks` lohkoa, ja rankingit on samaa tyyliä kuin
+# tests/init1.py:ssä.
+
+RESCUE_MAX_TIME = 600
+DANCE_INTERVIEW, DANCE_PERFORMANCE = get_dance_rulesets(2019)
+
+# lohkon id:n etuliite -> (säännöstö, ottelun kesto sekunteina)
+RULESETS = {
+    "xs": (XSRuleset(), 5*60),
+    "xm": (XMRuleset(), 5*60),
+    "rescue1": (RescueRuleset.by_difficulty(1, max_time=RESCUE_MAX_TIME), 10*60),
+    "rescue2": (RescueRuleset.by_difficulty(2, max_time=RESCUE_MAX_TIME), 10*60),
+    "rescue3": (RescueRuleset.by_difficulty(3, max_time=RESCUE_MAX_TIME), 10*60),
+    "dance.interview": (DANCE_INTERVIEW, 15*60),
+    "dance.performance": (DANCE_PERFORMANCE, 10*60)
+}
+
+XSUMO = ("xs", "xm")
+
+def block_id(prefix, i):
+    return "%s.%d" % (prefix, i)
+
+#####
+# Satunnaiset validit pisteet
+
+XS_ROUNDS = [
+    # (ensimmäinen, tulos1, tulos2)
+    (0, "W", "L"), (0, "L", "W"), (0, "T", "T"), (0, "L", "L"),
+    (1, "W", "L"), (1, "L", "W"), (1, "T", "T"), (1, "L", "L"),
+    (None, "L", "L")
+]
+
+XM_RESULTS = [(3, 0), (0, 3), (1, 0), (0, 1), (2, 2)]
+
+def random_xsumo_pair(ruleset, rnd):
+    rounds1, rounds2 = [], []
+
+    for _ in range(rnd.randint(1, 3)):
+        if isinstance(ruleset, XSRuleset):
+            first, r1, r2 = rnd.choice(XS_ROUNDS)
+            rounds1.append(XSRoundScore(first == 0, XSumoResult(r1)))
+            rounds2.append(XSRoundScore(first == 1, XSumoResult(r2)))
+        else:
+            results = [rnd.choice(XM_RESULTS) for _ in range(rnd.randint(1, 6))]
+            rounds1.append(XMRoundScore([r for r,_ in results]))
+            rounds2.append(XMRoundScore([r for _,r in results]))
+
+    s1, s2 = XSumoScore(rounds=rounds1), XSumoScore(rounds=rounds2)
+    calc_results(s1, s2)
+    return s1, s2
+
+def _random_cat(cat, rnd):
+    if isinstance(cat, RescueObstacleCategory):
+        return rnd.choice((RescueResult.FAIL, RescueResult.SUCCESS_1, RescueResult.SUCCESS_2))
+    if isinstance(cat, RescueMultiObstacleCategory):
+        return RescueMultiObstacleScore(*(rnd.randint(0, 3) for _ in range(3)))
+    if isinstance(cat, IntCategory):
+        return rnd.randint(0, RESCUE_MAX_TIME)
+    # tanssi
+    return rnd.randint(0, cat.max)
+
+def random_score(ruleset, rnd):
+    ret = ruleset.create_score()
+
+    for k, cat in ret.__cats__:
+        setattr(ret, k, _random_cat(cat, rnd))
+
+    return ret
+
+def random_scores(ruleset, rnd):
+    if isinstance(ruleset, (XSRuleset, XMRuleset)):
+        return random_xsumo_pair(ruleset, rnd)
+    return (random_score(ruleset, rnd),)
+
+#####
+# Aikataulut: [(ts_sched, arena, [joukkueiden indeksit])]
+
+def round_robin(n):
+    # ympyrämenetelmä, jokainen kierros on yksi aikaväli
+    idx = list(range(n + n%2))
+
+    for _ in range(len(idx)-1):
+        yield [(idx[i], idx[-1-i]) for i in range(len(idx)//2)
+                if idx[i] < n and idx[-1-i] < n]
+        idx.insert(1, idx.pop())
+
+def schedule(prefix, i, n_teams, start, arenas):
+    _, duration = RULESETS[prefix]
+    bid = block_id(prefix, i)
+
+    if prefix in XSUMO:
+        games = list(itertools.chain.from_iterable(round_robin(n_teams)))
+    else:
+        games = [(t,) for t in range(n_teams)]
+
+    return [(
+        start + (k // arenas) * duration,
+        "%s.%d" % (bid, k % arenas),
+        teams
+    ) for k, teams in enumerate(games)]
+
+#####
+# Tietokanta
+
+class Synth:
+
+    def __init__(self, teams=60, blocks=2, judges=10, arenas=4, played=1.0, seed=0):
+        self.teams = teams
+        self.blocks = blocks
+        self.judges = judges
+        self.arenas = arenas
+        self.played = played
+        self.seed = seed
+
+    def block_ids(self, prefix=None):
+        return [block_id(p, i) for p in RULESETS if prefix in (None, p)
+                for i in range(self.blocks)]
+
+    # Lisää joukkueet, tuomarit ja aikataulut
+    def populate(self, db):
+        rnd = random.Random(self.seed)
+
+        # joka 20. joukkue on shadow, kuten `rsx import` tekee ::-alkuisille nimille
+        teams = [model.Team(name="%sTeam %d" % ("::" if i%20 == 19 else "", i),
+            is_shadow=int(i%20 == 19)) for i in range(self.teams)]
+        judges = [model.Judge(name="Judge %d" % i) for i in range(self.judges)]
+        db.add_all(teams)
+        db.add_all(judges)
+        db.flush()
+
+        day = 8*60*60
+        events = []
+
+        for prefix in RULESETS:
+            for i in range(self.blocks):
+                for ts, arena, ts_teams in schedule(prefix, i, self.teams, day, self.arenas):
+                    events.append(model.Event(
+                        block_id=block_id(prefix, i),
+                        ts_sched=ts,
+                        arena=arena,
+                        teams_part=[model.EventTeam(team_id=teams[t].id) for t in ts_teams],
+                        judgings=[model.EventJudging(judge_id=rnd.choice(judges).id)]
+                    ))
+                day += 24*60*60
+
+        db.add_all(events)
+
+        for prefix in XSUMO:
+            for i in range(self.blocks):
+                db.add_all(model.Tiebreak(ranking_id="%s.tb" % block_id(prefix, i),
+                    team_id=t.id, weight=rnd.randint(0, 3)) for t in teams)
+
+        db.commit()
+        return len(events)
+
+    # Täyttää pisteet (triggerit on jo luoneet tyhjät rivit)
+    def judge(self, db):
+        rnd = random.Random(self.seed + 1)
+        n = 0
+
+        for prefix, (ruleset, _) in RULESETS.items():
+            for i in range(self.blocks):
+                scores = db.query(model.Score)\
+                        .join(model.Score.event)\
+                        .filter(model.Event.block_id == block_id(prefix, i))\
+                        .add_columns(model.Event.ts_sched)\
+                        .order_by(model.Score.event_id, model.Score.team_id)\
+                        .all()
+
+                judgings = dict(((j.event_id, j.judge_id), j) for j in db.query(model.EventJudging)\
+                        .join(model.EventJudging.event)\
+                        .filter(model.Event.block_id == block_id(prefix, i)))
+
+                for event_id, ss in itertools.groupby(scores, lambda s: s[0].event_id):
+                    if rnd.random() >= self.played:
+                        continue
+
+                    new_scores = random_scores(ruleset, rnd)
+                    ruleset.validate(*new_scores)
+
+                    for (s, ts_sched), score in zip(ss, new_scores):
+                        s.data = bytes(ruleset.encode(score))
+                        judgings[(s.event_id, s.judge_id)].ts = ts_sched + 60
+                    n += 1
+
+        db.commit()
+        return n
+
+def create_db(path):
+    engine = sa.create_engine("sqlite:///%s" % path)
+    model.Base.metadata.create_all(engine)
+    return engine
+
+#####
+# Init-tiedosto.
+# Benchmark ajetaan oikean init-tiedoston kautta, jotta `rsx show -i` toimii samalla tavalla.
+
+INIT_TEMPLATE = """\
+from benchmarks.synth import define
+define(blocks=%d)
+"""
+
+def write_init(path, blocks):
+    with open(path, "w") as f:
+        f.write(INIT_TEMPLATE % blocks)
+
+def define(blocks, tournament=None):
+    if tournament is None:
+        tournament = robostat.get_default_tournament()
+
+    for prefix, (ruleset, _) in RULESETS.items():
+        for i in range(blocks):
+            tournament.block(block_id(prefix, i), ruleset=ruleset)
+
+    for prefix in XSUMO:
+        for i in range(blocks):
+            _define_xsumo(tournament, tournament.blocks[block_id(prefix, i)])
+
+    for prefix in RULESETS:
+        if prefix not in XSUMO:
+            _define_best(tournament, prefix,
+                    [tournament.blocks[block_id(prefix, i)] for i in range(blocks)])
+
+    return tournament
+
+def _define_xsumo(tournament, block):
+    @tournament.ranking("%s.score" % block.id, replay=Replay(XSumoScoreRank, block))
+    def rank_score(db, limit=None):
+        ranks = aggregate_scores(block.decode_scores(db), XSumoScoreRank.from_scores)
+        return sort_ranking(ranks.items(), limit=limit)
+
+    @tournament.ranking("%s.wins" % block.id, replay=Replay(XSumoWinsRank, block))
+    def rank_wins(db, limit=None):
+        ranks = aggregate_scores(block.decode_scores(db), XSumoWinsRank.from_scores)
+        return sort_ranking(ranks.items(), limit=limit)
+
+    @tournament.ranking("%s.tb" % block.id)
+    def rank_tb(db, limit=None):
+        ranks = aggregate_scores(block.decode_scores(db), XSumoScoreRank.from_scores)
+        tiebreaks, = tiebreak_weights(db, "%s.tb" % block.id)
+        return sort_ranking(combine_tiebreaks(ranks, tiebreaks).items(), limit=limit)
+
+# Parhaan suorituksen mukaan, kuten rescue1 ja rescue1.weighted init1:ssä.
+# Tanssille ei ole omaa rank-luokkaa, mutta MaxRank kelpaa mille tahansa
+# vertailtavalle pisteelle.
+def _define_best(tournament, prefix, blocks):
+    rank = RescueMaxRank if isinstance(RULESETS[prefix][0], RescueRuleset) else MaxRank
+
+    @tournament.ranking(prefix, replay=Replay(rank, *blocks))
+    def rank_best(db, limit=None):
+        ranks = aggregate_scores(decode_block_scores(db, *blocks), rank.from_scores)
+        return sort_ranking(ranks.items(), limit=limit)
+
+    @tournament.ranking("%s.weighted" % prefix)
+    def rank_weighted(db, limit=None):
+        aggregate = MultiBlockAggregate(*((b, i+1, rank.from_scores) for i, b in enumerate(blocks)))
+        ranks = aggregate(db)
+        return sort_ranking(ranks.items(), limit=limit)
@@ -1,4 +1,5 @@
 from contextlib import contextmanager
+from contextvars import ContextVar
 from pkgutil import extend_path
 from .tournament import Tournament
 
@@ -6,17 +7,26 @@ from .tournament import Tournament
 # tämä siksi, että mm. robostat-web voi erottaa omaan pakettiin
 __path__ = extend_path(__path__, __name__)
 
-default_tournament = Tournament()
+# Oletusturnaus on kontekstikohtainen, joten eri säikeet ja asyncio-tehtävät voivat
+# ladata eri turnauksia yhtä aikaa
+_default_tournament = ContextVar("default_tournament", default=Tournament())
+
+def get_default_tournament():
+    return _default_tournament.get()
 
 @contextmanager
 def replace_default_tournament(tournament):
-    global default_tournament
-    old_default = default_tournament
-    default_tournament = tournament
+    token = _default_tournament.set(tournament)
     try:
         yield
     finally:
-        default_tournament = old_default
+        _default_tournament.reset(token)
+
+# robostat.default_tournament toimii kuten ennenkin
+def __getattr__(name):
+    if name == "default_tournament":
+        return get_default_tournament()
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
 
-block = lambda *args, **kwargs: default_tournament.block(*args, **kwargs)
-ranking = lambda *args, **kwargs: default_tournament.ranking(*args, **kwargs)
+block = lambda *args, **kwargs: get_default_tournament().block(*args, **kwargs)
+ranking = lambda *args, **kwargs: get_default_tournament().ranking(*args, **kwargs)
@@ -0,0 +1,365 @@
+import math
+import threading
+import collections
+import robostat.db as model
+from robostat.tournament import judged_scores_query, scores_fingerprint
+from robostat.rulesets.xsumo import XSumoRuleset, XSumoScoreRank
+from robostat.rulesets.rescue import RescueRuleset, RescueRank
+
+# Varmat sijoitukset: onko joukkue varmasti top-n:ssä (CLINCHED), varmasti sen
+# ulkopuolella (ELIMINATED) vai vielä auki (OPEN).
+# Tasapisteissä joukkueet jakavat parhaan sijan (competition ranking), joten joukkue on
+# top-n:ssä jos sen edellä on alle n joukkuetta. Tiebreakeja ei huomioida.
+#
+# Rescue: suoritukset ovat toisistaan riippumattomia ja sijoitus tulee parhaasta
+# suorituksesta, joten jokaisen joukkueen paras ja huonoin mahdollinen lopputulos ovat
+# saavutettavissa yhtä aikaa ja vastaus on tarkka.
+#
+# XSumo: ottelun tulos vaikuttaa molempiin joukkueisiin. Joukkueelle lasketaan huonoin
+# (häviää kaikki, 0p) ja paras (voittaa kaikki, maksimipisteet) lopputulos, ja muiden
+# keskinäiset ottelut jaetaan max-flow'lla (kuten baseball elimination): riittävätkö
+# ottelut nostamaan n joukkuetta edelle / voiko ne jakaa niin ettei kukaan nouse edelle.
+# Tasapelit ja pisteet tekevät tarkasta vastauksesta NP-vaikean, joten muille annetaan
+# aina enemmän liikkumavaraa kuin säännöt sallivat. Tila on siis aina oikein, mutta
+# joukkue voi jäädä auki hieman tarpeettoman pitkään.
+
+CLINCHED = "clinched"
+ELIMINATED = "eliminated"
+OPEN = "open"
+
+# Dinic, verkko on matala (lähde -> pari -> joukkue -> nielu) joten rekursio riittää
+def max_flow(num_nodes, edges, source, sink):
+    graph = [[] for _ in range(num_nodes)]
+    to, cap = [], []
+
+    for u, v, c in edges:
+        graph[u].append(len(to))
+        to.append(v)
+        cap.append(c)
+        graph[v].append(len(to))
+        to.append(u)
+        cap.append(0)
+
+    def dfs(u, f, level, it):
+        if u == sink:
+            return f
+        while it[u] < len(graph[u]):
+            e = graph[u][it[u]]
+            v = to[e]
+            if cap[e] and level[v] == level[u] + 1:
+                pushed = dfs(v, min(f, cap[e]), level, it)
+                if pushed:
+                    cap[e] -= pushed
+                    cap[e^1] += pushed
+                    return pushed
+            it[u] += 1
+        return 0
+
+    ret = 0
+    while True:
+        level = [-1] * num_nodes
+        level[source] = 0
+        queue = collections.deque([source])
+        while queue:
+            u = queue.popleft()
+            for e in graph[u]:
+                if cap[e] and level[to[e]] < 0:
+                    level[to[e]] = level[u] + 1
+                    queue.append(to[e])
+
+        if level[sink] < 0:
+            return ret
+
+        it = [0] * num_nodes
+        while True:
+            f = dfs(source, math.inf, level, it)
+            if not f:
+                break
+            ret += f
+
+# Otteluparit {(a, b): lkm} jaetaan pareista joukkueille, joiden kapasiteetti on caps[joukkue]
+def _assign(pairs, caps):
+    teams = list(caps)
+    index = dict((t, i) for i,t in enumerate(teams, start=2))
+    edges = []
+
+    for i, ((a, b), count) in enumerate(pairs.items(), start=2+len(teams)):
+        edges.append((0, i, count))
+        for t in (a, b):
+            if t in index:
+                edges.append((i, index[t], count))
+
+    edges.extend((index[t], 1, c) for t,c in caps.items() if c)
+    return max_flow(2 + len(teams) + len(pairs), edges, 0, 1)
+
+#####
+# XSumo
+
+class _XSumoState:
+
+    def __init__(self, matches, ruleset, rank):
+        self.fields = rank.sort_fields
+        self.base = {}
+        # {(a, b): lkm}, a < b
+        self.pairs = collections.Counter()
+        self.remaining = collections.Counter()
+        rounds = 0
+
+        for (event_id, _), scores in matches.items():
+            if len(scores) != 2:
+                raise ValueError("Event %d is not a match between two teams" % event_id)
+
+            (a, sa_), (b, sb) = sorted(scores.items())
+            for t in (a, b):
+                self.base.setdefault(t, [0, 0, 0])
+
+            if sa_ is None or sb is None:
+                self.pairs[a, b] += 1
+                self.remaining[a] += 1
+                self.remaining[b] += 1
+                continue
+
+            for t, s in ((a, sa_), (b, sb)):
+                self.base[t][0] += int(s)
+                self.base[t][1] += str(s.result) == "W"
+                self.base[t][2] += str(s.result) == "T"
+                rounds = max(rounds, len(s.rounds))
+
+        # kierrosten määrä pelatuista jos sitä ei ole annettu
+        self.max_points = ruleset.max_match_points(rounds or None)
+        if self.max_points is None:
+            self.max_points = math.inf
+
+    def key(self, score, wins, ties):
+        v = {"score": score, "wins": wins, "ties": ties}
+        return tuple(v[f] for f in self.fields)
+
+    def _points(self, team, matches):
+        # 0*inf on nan
+        return self.base[team][0] + (matches * self.max_points if matches else 0)
+
+    def _against(self, a, b):
+        return self.pairs.get((min(a, b), max(a, b)), 0)
+
+    def _others(self, team, exclude=()):
+        return dict(((a, b), c) for (a, b), c in self.pairs.items()
+                if team not in (a, b) and a not in exclude and b not in exclude)
+
+    # Voiko n joukkuetta nousta joukkueen edelle kun se häviää kaikki?
+    # Muille annetaan maksimipisteet ja tasapelit kaikista otteluista joita ne eivät voita.
+    def clinched(self, team, n):
+        s, w, t = self.base[team]
+        worst = self.key(s, w, t)
+        above = 0
+        demands = {}
+
+        for j, (sj, wj, tj) in self.base.items():
+            if j == team:
+                continue
+
+            free = self._against(team, j)
+            m = self.remaining[j] - free
+            points = self._points(j, self.remaining[j])
+            # voittoja tarvitaan muilta vähintään
+            d = next((x for x in range(m+1) if self.key(points, wj+free+x, tj+m-x) > worst), None)
+
+            if d == 0:
+                above += 1
+            elif d is not None:
+                demands[j] = d
+
+        need = n - above
+        if need <= 0:
+            return False
+        if need > len(demands):
+            return True
+
+        flow = _assign(self._others(team), demands)
+        return flow < sum(sorted(demands.values())[:need])
+
+    # Jääkö joukkue varmasti ulos vaikka se voittaa kaikki maksimipisteillä?
+    # Muut häviävät sille 0 pisteellä, ja niiden keskinäisistä otteluista jokainen kasvattaa
+    # ainakin toisen voittoja (voittaja saa vähintään 1p) tai tasapelejä.
+    def eliminated(self, team, n):
+        s, w, t = self.base[team]
+        r = self.remaining[team]
+        best = self.key(self._points(team, r), w+r, t)
+        above = set()
+        caps = {}
+
+        for j, (sj, wj, tj) in self.base.items():
+            if j == team:
+                continue
+
+            if self.key(sj, wj, tj) > best:
+                above.add(j)
+            else:
+                caps[j] = self._absorb(j, self.remaining[j] - self._against(team, j), best)
+
+        if len(above) >= n:
+            return True
+
+        pairs = self._others(team, exclude=above)
+        total = sum(pairs.values())
+        flow = _assign(pairs, caps)
+        if flow >= total:
+            return False
+
+        # loput n-1 sijaa voi antaa joukkueille, jotka ottavat kaikki ottelunsa
+        degree = collections.Counter()
+        for (a, b), c in pairs.items():
+            degree[a] += c
+            degree[b] += c
+        free = sorted(degree.values(), reverse=True)[:n-1-len(above)]
+
+        return flow + sum(free) < total
+
+    # Montako ottelua joukkue voi ottaa (voittoja + tasapelejä) nousematta yli rajan
+    def _absorb(self, team, m, limit):
+        s, w, t = self.base[team]
+        ret = 0
+
+        for x in range(m+1):
+            if self.key(s+x, w+x, t) > limit:
+                break
+            lo, hi = 0, m-x
+            while lo < hi:
+                mid = (lo+hi+1) // 2
+                if self.key(s+x, w+x, t+mid) > limit:
+                    hi = mid-1
+                else:
+                    lo = mid
+            ret = max(ret, x+lo)
+
+        return ret
+
+def xsumo_status(matches, ruleset, n, rank=XSumoScoreRank):
+    state = _XSumoState(matches, ruleset, rank)
+    ret = {}
+
+    for team in state.base:
+        if state.clinched(team, n):
+            ret[team] = CLINCHED
+        elif state.eliminated(team, n):
+            ret[team] = ELIMINATED
+        else:
+            ret[team] = OPEN
+
+    return ret
+
+#####
+# Rescue
+
+def rescue_status(matches, ruleset, n, rank=RescueRank):
+    played = {}
+    remaining = collections.Counter()
+
+    for scores in matches.values():
+        for team, score in scores.items():
+            played.setdefault(team, [])
+            if score is None:
+                remaining[team] += 1
+            else:
+                played[team].append(rank.score_key(score))
+
+    max_time = math.inf if ruleset.max_time is None else ruleset.max_time
+    worst_run = (0, -max_time)
+    best_run = (ruleset.max_score, 0)
+
+    # pelaamaton on aina huonoin, kuten AggregateRankissa
+    worst, best = {}, {}
+    for team, keys in played.items():
+        current = max(keys) if keys else None
+        if remaining[team]:
+            worst[team] = (1, worst_run if current is None else current)
+            best[team] = (1, best_run if current is None else max(best_run, current))
+        else:
+            worst[team] = best[team] = (0,) if current is None else (1, current)
+
+    ret = {}
+    for team in played:
+        if sum(best[j] > worst[team] for j in played if j != team) < n:
+            ret[team] = CLINCHED
+        elif sum(worst[j] > best[team] for j in played if j != team) >= n:
+            ret[team] = ELIMINATED
+        else:
+            ret[team] = OPEN
+
+    return ret
+
+#####
+# Välimuisti.
+# Lohkon scoret pidetään muistissa ja päivitetään tuomarointien aikaleimojen mukaan:
+# uudet tuomaroinnit haetaan event_judging.ts:n perusteella, ja jos rivimäärät tai
+# pisteiden yhteispituus eivät sen jälkeen täsmää (poistoja, aikaleimattomia muutoksia)
+# haetaan koko lohko uudestaan. Saman pituisen scoren muokkaus vanhalla aikaleimalla ei
+# näy, ks. scores_fingerprint.
+
+class Standings:
+
+    def __init__(self, block):
+        self.block = block
+        # {(event_id, judge_id): {team_id: score tai None}}
+        self.matches = {}
+        # {(event_id, judge_id, team_id): len(data)}
+        self._sizes = {}
+        self.fingerprint = None
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _scores_query(self, db):
+        return judged_scores_query(db, [self.block], model.Score.event_id, model.Score.judge_id,
+                model.Score.team_id, model.Score.data)
+
+    def _apply(self, rows):
+        decode = self.block.ruleset.decode
+        for event_id, judge_id, team_id, data in rows:
+            self.matches.setdefault((event_id, judge_id), {})[team_id] =\
+                    decode(data) if data is not None else None
+            self._sizes[event_id, judge_id, team_id] = len(data) if data is not None else 0
+
+    def _count(self):
+        return sum(len(s) for s in self.matches.values()),\
+                sum(x is not None for s in self.matches.values() for x in s.values()),\
+                sum(self._sizes.values())
+
+    def refresh(self, db):
+        # (kanta, scoreja, pisteitä, viimeisin tuomarointi, tuomaroituja, tavuja)
+        fp = (db.get_bind(), *scores_fingerprint(db, self.block))
+        if fp == self.fingerprint:
+            return False
+
+        old = self.fingerprint
+        if old is not None and old[3] is not None and fp[:2] == old[:2] and fp[3] >= old[3]:
+            # samalla sekunnilla voi tulla useampi tuomarointi, joten >=
+            self._apply(self._scores_query(db).filter(model.EventJudging.ts >= old[3]))
+        else:
+            self.matches = {}
+            self._sizes = {}
+
+        if self._count() != (*fp[1:3], fp[5]):
+            self.matches = {}
+            self._sizes = {}
+            self._apply(self._scores_query(db))
+
+        self.fingerprint = fp
+        self._memo.clear()
+        return True
+
+    def status(self, db, n, rank=None):
+        with self._lock:
+            self.refresh(db)
+            key = (n, rank)
+            if key not in self._memo:
+                self._memo[key] = self._status(n, rank)
+            return dict(self._memo[key])
+
+    def _status(self, n, rank):
+        ruleset = self.block.ruleset
+
+        if isinstance(ruleset, XSumoRuleset):
+            return xsumo_status(self.matches, ruleset, n, rank or XSumoScoreRank)
+        if isinstance(ruleset, RescueRuleset):
+            return rescue_status(self.matches, ruleset, n, rank or RescueRank)
+
+        raise TypeError("Clinch status not supported for %s" % type(ruleset).__name__)
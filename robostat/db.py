@@ -26,7 +26,10 @@ class Judge(Base):
 
 class Event(Base):
     __tablename__ = "events"
-    __table_args__ = ( sa.UniqueConstraint("ts_sched", "arena"), )
+    __table_args__ = (
+            sa.UniqueConstraint("ts_sched", "arena"),
+            sa.Index("ix_events_block_id_ts_sched", "block_id", "ts_sched")
+    )
 
     id = sa.Column(sa.Integer, primary_key=True)
     block_id = sa.Column(sa.Text, nullable=False, index=True)
@@ -55,7 +58,7 @@ class Event(Base):
 
     def get_block(self, tournament=None):
         if tournament is None:
-            tournament = robostat.default_tournament
+            tournament = robostat.get_default_tournament()
 
         return tournament.blocks[self.block_id]
 
@@ -80,7 +83,10 @@ class Event(Base):
 
 class EventTeam(Base):
     __tablename__ = "event_teams"
-    __table_args__ = ( sa.PrimaryKeyConstraint("event_id", "team_id"), )
+    __table_args__ = (
+            sa.PrimaryKeyConstraint("event_id", "team_id"),
+            sa.Index("ix_event_teams_team_id_event_id", "team_id", "event_id")
+    )
 
     event_id = sa.Column(sa.Integer, sa.ForeignKey("events.id", ondelete="CASCADE"),
             nullable=False, index=True)
@@ -97,7 +103,10 @@ class EventTeam(Base):
 
 class EventJudging(Base):
     __tablename__ = "event_judging"
-    __table_args__ = ( sa.PrimaryKeyConstraint("event_id", "judge_id"), )
+    __table_args__ = (
+            sa.PrimaryKeyConstraint("event_id", "judge_id"),
+            sa.Index("ix_event_judging_judge_id_ts", "judge_id", "ts")
+    )
 
     event_id = sa.Column(sa.Integer, sa.ForeignKey("events.id", ondelete="CASCADE"),
             nullable=False, index=True)
@@ -140,7 +149,8 @@ class Score(Base):
 
     # Tässä ei cascadea koska event_teams ja event_judging cascadet poistaa tän
     event_id = sa.Column(sa.Integer, sa.ForeignKey("events.id"), nullable=False, index=True)
-    team_id = sa.Column(sa.Integer, sa.ForeignKey("teams.id", ondelete="CASCADE"), nullable=False)
+    team_id = sa.Column(sa.Integer, sa.ForeignKey("teams.id", ondelete="CASCADE"), nullable=False,
+            index=True)
     judge_id = sa.Column(sa.Integer, sa.ForeignKey("judges.id", ondelete="CASCADE"),nullable=False)
     data = sa.Column(sa.LargeBinary) # Blob
 
@@ -154,7 +164,10 @@ class Score(Base):
 
 class Tiebreak(Base):
     __tablename__ = "tiebreaks"
-    __table_args__ = ( sa.PrimaryKeyConstraint("ranking_id", "team_id"), )
+    __table_args__ = (
+            sa.PrimaryKeyConstraint("ranking_id", "team_id"),
+            sa.Index("ix_tiebreaks_ranking_id_weight", "ranking_id", "weight")
+    )
 
     ranking_id = sa.Column(sa.String, nullable=False, index=True)
     team_id = sa.Column(sa.Integer, sa.ForeignKey("teams.id", ondelete="CASCADE"), nullable=False)
@@ -162,6 +175,10 @@ class Tiebreak(Base):
 
     team = relationship("Team", viewonly=True)
 
+# ks. robostat.migrate
+schema_version = sa.Table("schema_version", Base.metadata,
+        sa.Column("version", sa.Integer, nullable=False))
+
 listen(Base.metadata, "after_create", sa.DDL("""
     CREATE TRIGGER t_insert_team_scores
     AFTER INSERT ON event_teams
@@ -0,0 +1,217 @@
+import re
+import collections
+import contextlib
+from sqlalchemy.engine import Engine
+from sqlalchemy.event import listen, remove
+from robostat.tournament import span_path, add_listener, remove_listener
+
+# Kyselysuunnitelmien tarkistus (vain sqlite).
+# capture() kerää kaikki kyselyt jotka ajetaan sen sisällä, ja reports() ajaa jokaiselle
+# EXPLAIN QUERY PLANin ja merkitsee täydet taulujen läpikäynnit, väliaikaiset B-puut
+# ja korreloidut alikyselyt. Täysille läpikäynneille ehdotetaan indeksiä niiden
+# sarakkeiden perusteella, joilla taulua kyselyssä rajataan.
+
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT")
+
+# vanhemmat sqlitet kirjoittaa "SCAN TABLE x"
+_scan = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?$")
+_temp_btree = re.compile(r"^USE TEMP B-TREE FOR (.*)$")
+_correlated = re.compile(r"^CORRELATED .*SUBQUERY")
+_materialized = re.compile(r"^(?:MATERIALIZE|CO-ROUTINE) (?:SUBQUERY )?(\w+)")
+
+class CapturedQuery:
+
+    def __init__(self, engine, statement, parameters):
+        self.engine = engine
+        self.statement = statement
+        self.parameters = parameters
+        self.count = 0
+        self.paths = []
+
+# Kuuntelijana vain jotta tournamentin jaksot (span_path) ovat päällä,
+# kyselyt otetaan suoraan enginen eventistä koska EXPLAIN tarvitsee yhteyden
+class Capture:
+
+    def __init__(self):
+        self.queries = collections.OrderedDict()
+
+    def span_start(self, path):
+        pass
+
+    def span_end(self, path, elapsed, items):
+        pass
+
+    def query(self, path, statement, parameters, elapsed):
+        pass
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if executemany or not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return
+
+        key = (conn.engine, statement)
+        q = self.queries.get(key)
+        if q is None:
+            q = self.queries[key] = CapturedQuery(conn.engine, statement, parameters)
+
+        q.count += 1
+        path = span_path()
+        if path not in q.paths:
+            q.paths.append(path)
+
+    def reports(self):
+        ret = []
+        by_engine = collections.OrderedDict()
+
+        for q in self.queries.values():
+            by_engine.setdefault(q.engine, []).append(q)
+
+        for engine, qs in by_engine.items():
+            if engine.dialect.name != "sqlite":
+                raise ValueError("EXPLAIN QUERY PLAN is only supported on sqlite")
+
+            raw = engine.raw_connection()
+            try:
+                indexes = index_columns(raw)
+                for q in qs:
+                    ret.append(QueryReport(q, explain(raw, q.statement, q.parameters), indexes))
+            finally:
+                raw.close()
+
+        return ret
+
+@contextlib.contextmanager
+def capture():
+    ret = Capture()
+    add_listener(ret)
+    listen(Engine, "before_cursor_execute", ret._before_cursor_execute)
+    try:
+        yield ret
+    finally:
+        remove(Engine, "before_cursor_execute", ret._before_cursor_execute)
+        remove_listener(ret)
+
+# -> [(id, parent, detail)]
+def explain(raw, statement, parameters=()):
+    cursor = raw.cursor()
+    try:
+        cursor.execute("EXPLAIN QUERY PLAN %s" % statement, parameters)
+        return [(r[0], r[1], r[-1]) for r in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+# -> {taulu: [(sarakkeet, ...)]}, mukana myös primary keyt ja uniikit rajoitteet
+def index_columns(raw):
+    cursor = raw.cursor()
+    ret = collections.defaultdict(list)
+
+    try:
+        tables = [r[0] for r in cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+
+        for t in tables:
+            for idx in cursor.execute("PRAGMA index_list('%s')" % t).fetchall():
+                cols = cursor.execute("PRAGMA index_info('%s')" % idx[1]).fetchall()
+                ret[t].append(tuple(c[2] for c in sorted(cols)))
+    finally:
+        cursor.close()
+
+    return ret
+
+def _aliases(statement):
+    return dict((alias, table) for table, alias
+            in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)\s+AS\s+(\w+)", statement, flags=re.IGNORECASE))
+
+# Sarakkeet joilla taulua (tai sen aliasta) rajataan kyselyssä: (yhtäsuuruudet, muut)
+def _filter_columns(statement, name):
+    eq, rng = [], []
+
+    for col, op in re.findall(r"\b%s\.(\w+)\s*(=|!=|<>|<=|>=|<|>|\bIN\b|\bIS\b)" % re.escape(name),
+            statement, flags=re.IGNORECASE):
+        dest = eq if op.upper() in ("=", "IN", "IS") else rng
+        if col not in eq and col not in rng:
+            dest.append(col)
+
+    return eq, rng
+
+class QueryReport:
+
+    def __init__(self, query, plan, indexes={}):
+        self.statement = query.statement
+        self.parameters = query.parameters
+        self.count = query.count
+        self.paths = query.paths
+        self.plan = plan
+        self.indexes = indexes
+        self.issues = []
+        self.suggestions = []
+        self._analyze()
+
+    @property
+    def ok(self):
+        return not self.issues
+
+    # -> [(taulu, alias)], alikyselyjen välitulokset pois lukien
+    def scans(self):
+        materialized = set(m.group(1) for m in (_materialized.match(d) for _,_,d in self.plan) if m)
+        return [m.groups() for m in (_scan.match(d) for _,_,d in self.plan)
+                if m and m.group(1) not in materialized]
+
+    def _analyze(self):
+        aliases = _aliases(self.statement)
+
+        for table, alias in self.scans():
+            self.issues.append("Full table scan: %s" % table)
+            self._suggest(table, alias or table)
+
+        for _, _, detail in self.plan:
+            m = _temp_btree.match(detail)
+            if m:
+                self.issues.append("Temp B-tree for %s" % m.group(1))
+                if m.group(1) == "ORDER BY":
+                    # järjestys tulee yleensä yhden taulun sarakkeista
+                    for name in collections.OrderedDict.fromkeys(
+                            re.findall(r"\b(\w+)\.\w+", self._order_by())):
+                        self._suggest(aliases.get(name, name), name, order=True)
+            elif _correlated.match(detail):
+                self.issues.append("Correlated subquery")
+
+    def _order_by(self):
+        m = re.search(r"\bORDER BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|\)|$)", self.statement,
+                flags=re.IGNORECASE | re.DOTALL)
+        return m.group(1) if m else ""
+
+    def _suggest(self, table, name, order=False):
+        eq, rng = _filter_columns(self.statement, name)
+        order_cols = [c for c in re.findall(r"\b%s\.(\w+)" % re.escape(name), self._order_by())
+                if c not in eq]
+
+        # yhtäsuuruudet ensin, sitten järjestys tai yksi välirajaus
+        if order:
+            cols = eq + order_cols
+        elif eq or rng:
+            cols = eq + (rng[:1] or order_cols)
+        else:
+            return
+
+        if not cols or any(idx[:len(cols)] == tuple(cols) for idx in self.indexes.get(table, ())):
+            return
+
+        sug = "CREATE INDEX ix_%s_%s ON %s(%s)" % (table, "_".join(cols), table, ", ".join(cols))
+        if sug not in self.suggestions:
+            self.suggestions.append(sug)
+
+# pytest-apuri:
+#     with capture() as c:
+#         ...
+#     assert_indexed(c, "scores", "events")
+def assert_indexed(capture, *tables):
+    __tracebackhide__ = True
+
+    for r in capture.reports():
+        scanned = [t for t,_ in r.scans() if not tables or t in tables]
+        if scanned:
+            raise AssertionError("Full scan of %s in:\n%s\nPlan:\n%s" % (
+                ", ".join(scanned),
+                r.statement,
+                "\n".join(d for _,_,d in r.plan)
+            ))
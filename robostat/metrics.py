@@ -0,0 +1,233 @@
+import os
+import math
+import time
+import threading
+import collections
+from sqlalchemy.orm import Session
+from sqlalchemy.event import listen, remove
+from robostat.tournament import add_listener, remove_listener
+
+# Mittarit OpenMetrics-tekstimuodossa (https://openmetrics.io).
+# Ei verkkopalvelua: tiedosto kirjoitetaan pyydettäessä tai tietyin väliajoin,
+# ja keräin lukee sen itse.
+
+class Metric:
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = collections.OrderedDict()
+
+    def labels(self, *values, **kwargs):
+        if kwargs:
+            values = tuple(kwargs[l] for l in self.labelnames)
+        if len(values) != len(self.labelnames):
+            raise ValueError("%s expects labels %s" % (self.name, self.labelnames))
+        return _Child(self, tuple(map(str, values)))
+
+    def _labelstr(self, values, extra=()):
+        pairs = [*zip(self.labelnames, values), *extra]
+        if not pairs:
+            return ""
+        return "{%s}" % ",".join('%s="%s"' % (k, _escape(v)) for k,v in pairs)
+
+class _Child:
+
+    __slots__ = "metric", "values"
+
+    def __init__(self, metric, values):
+        self.metric = metric
+        self.values = values
+
+    def inc(self, amount=1):
+        self.metric._inc(self.values, amount)
+
+    def observe(self, value):
+        self.metric._observe(self.values, value)
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _num(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(value)
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1):
+        self._inc((), amount)
+
+    def _inc(self, values, amount):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        with self._lock:
+            self._values[values] = self._values.get(values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for values, v in items:
+            yield "%s_total%s %s" % (self.name, self._labelstr(values), _num(v))
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = (*sorted(buckets), math.inf)
+
+    def observe(self, value):
+        self._observe((), value)
+
+    def _observe(self, values, value):
+        with self._lock:
+            h = self._values.get(values)
+            if h is None:
+                # [bucketit..., summa]
+                h = self._values[values] = [0] * (len(self.buckets) + 1)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    h[i] += 1
+            h[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(values, list(h)) for values, h in self._values.items()]
+        for values, h in items:
+            for b, n in zip(self.buckets, h):
+                yield "%s_bucket%s %d" % (self.name,
+                        self._labelstr(values, [("le", _num(float(b)))]), n)
+            yield "%s_count%s %d" % (self.name, self._labelstr(values), h[-2])
+            yield "%s_sum%s %s" % (self.name, self._labelstr(values), _num(h[-1]))
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = collections.OrderedDict()
+
+    def _add(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError("Duplicate metric: %s" % metric.name)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self._add(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self._add(Histogram(*args, **kwargs))
+
+    def expose(self):
+        lines = []
+
+        for m in self.metrics.values():
+            lines.append("# TYPE %s %s" % (m.name, m.type))
+            lines.append("# HELP %s %s" % (m.name, _escape(m.help)))
+            lines.extend(m.samples())
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # keräin ei saa koskaan nähdä puolikasta tiedostoa
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "w") as f:
+            f.write(self.expose())
+        os.replace(tmp, path)
+
+REGISTRY = Registry()
+
+rankings = REGISTRY.counter("robostat_rankings", "Rankings evaluated", ["ranking"])
+ranking_duration = REGISTRY.histogram("robostat_ranking_duration_seconds",
+        "Time to evaluate a ranking", ["ranking"])
+decoded_scores = REGISTRY.counter("robostat_decoded_scores", "Scores fetched for decoding")
+decode_time = REGISTRY.counter("robostat_decode_seconds", "Time spent decoding scores")
+queries = REGISTRY.counter("robostat_db_queries", "SQL statements executed")
+query_duration = REGISTRY.histogram("robostat_db_query_duration_seconds",
+        "SQL statement execution time")
+commit_duration = REGISTRY.histogram("robostat_db_commit_duration_seconds",
+        "Session commit time, including flush")
+cache = REGISTRY.counter("robostat_cache_lookups", "Cache lookups", ["cache", "result"])
+lock_wait = REGISTRY.histogram("robostat_lock_wait_seconds", "Time spent waiting for a lock",
+        ["lock"])
+
+# Tournamentin jaksot ja kyselyt mittareiksi, ks. tournament.add_listener
+class MetricsListener:
+
+    def span_start(self, path):
+        pass
+
+    def span_end(self, path, elapsed, items):
+        name = path[-1]
+
+        if name.startswith("ranking:"):
+            id = name[len("ranking:"):]
+            rankings.labels(id).inc()
+            ranking_duration.labels(id).observe(elapsed)
+        elif name == "decode":
+            decoded_scores.inc(items)
+            decode_time.inc(elapsed)
+
+    def query(self, path, statement, parameters, elapsed):
+        queries.inc()
+        query_duration.observe(elapsed)
+
+def _before_commit(session):
+    session.info["robostat.commit_start"] = time.perf_counter()
+
+def _after_commit(session):
+    start = session.info.pop("robostat.commit_start", None)
+    if start is not None:
+        commit_duration.observe(time.perf_counter() - start)
+
+_listener = None
+
+def enable():
+    global _listener
+
+    if _listener is None:
+        _listener = MetricsListener()
+        add_listener(_listener)
+        listen(Session, "before_commit", _before_commit)
+        listen(Session, "after_commit", _after_commit)
+
+def disable():
+    global _listener
+
+    if _listener is not None:
+        remove_listener(_listener)
+        remove(Session, "before_commit", _before_commit)
+        remove(Session, "after_commit", _after_commit)
+        _listener = None
+
+# Kirjoittaa tiedoston taustasäikeessä `interval` sekunnin välein ja vielä lopuksi
+class MetricsWriter(threading.Thread):
+
+    def __init__(self, path, interval, registry=REGISTRY):
+        super().__init__(name="robostat-metrics", daemon=True)
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self.registry.write(self.path)
+        except OSError:
+            # seuraavalla kerralla uudestaan
+            pass
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        self.write()
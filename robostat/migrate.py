@@ -0,0 +1,117 @@
+import contextlib
+import sqlalchemy as sa
+import robostat.db as model
+
+# Tietokannan skeemaversiot.
+# Uusi tietokanta luodaan suoraan uusimman mallin mukaan (create_all) ja leimataan
+# uusimpaan versioon, vanhat päivitetään ajamalla puuttuvat migraatiot järjestyksessä.
+# Jokainen migraatio ajetaan omassa transaktiossaan yhdessä versionumeron päivityksen
+# kanssa, joten keskeytynyt päivitys voidaan vain ajaa uudestaan. Lauseiden pitää silti
+# olla idempotentteja (IF NOT EXISTS), koska create_all on voinut jo luoda osan niistä.
+
+class Migration:
+
+    def __init__(self, version, description, statements):
+        self.version = version
+        self.description = description
+        self.statements = statements
+
+MIGRATIONS = [
+    Migration(1, "Add performance indexes", [
+        "CREATE INDEX IF NOT EXISTS ix_scores_team_id ON scores(team_id)",
+        "CREATE INDEX IF NOT EXISTS ix_events_block_id_ts_sched ON events(block_id, ts_sched)",
+        "CREATE INDEX IF NOT EXISTS ix_event_judging_judge_id_ts ON event_judging(judge_id, ts)",
+        "CREATE INDEX IF NOT EXISTS ix_tiebreaks_ranking_id_weight ON tiebreaks(ranking_id, weight)"
+    ]),
+    # Tournament.team_history: joukkueen eventit suoraan indeksistä
+    Migration(2, "Add team history index", [
+        "CREATE INDEX IF NOT EXISTS ix_event_teams_team_id_event_id"
+            " ON event_teams(team_id, event_id)"
+    ])
+]
+
+LATEST = MIGRATIONS[-1].version
+
+class MigrationError(Exception):
+    pass
+
+@contextlib.contextmanager
+def _transaction(engine):
+    if engine.dialect.name != "sqlite":
+        with engine.begin() as conn:
+            yield lambda sql, *args: conn.execute(sa.text(sql), *args)
+        return
+
+    # pysqlite ei aloita transaktiota DDL-lauseille, joten BEGIN itse.
+    # IMMEDIATE ottaa kirjoituslukon heti, jottei käynnissä oleva kisa kirjoita väliin.
+    raw = engine.raw_connection()
+    conn = raw.connection
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn.execute
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.isolation_level = isolation_level
+        raw.close()
+
+_create_table = "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"
+
+def get_version(engine):
+    with engine.connect() as conn:
+        if not engine.dialect.has_table(conn, model.schema_version.name):
+            return 0
+        return conn.execute(sa.select([sa.func.max(model.schema_version.c.version)])).scalar() or 0
+
+def _current_version(execute):
+    execute(_create_table)
+    return execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+
+def _set_version(execute, version):
+    execute(_create_table)
+    execute("DELETE FROM schema_version")
+    execute("INSERT INTO schema_version(version) VALUES (%d)" % version)
+
+def stamp(engine, version=LATEST):
+    with _transaction(engine) as execute:
+        _set_version(execute, version)
+
+def pending(engine, target=LATEST):
+    version = get_version(engine)
+
+    if version > LATEST:
+        raise MigrationError("Database schema version %d is newer than supported (%d)"
+                % (version, LATEST))
+
+    return [m for m in MIGRATIONS if version < m.version <= target]
+
+def migrate(engine, target=LATEST, log=None):
+    ret = []
+
+    for m in pending(engine, target):
+        with _transaction(engine) as execute:
+            # toinen prosessi on voinut ehtiä ensin, joten versio tarkistetaan lukon sisällä
+            if _current_version(execute) >= m.version:
+                continue
+
+            if log is not None:
+                log(m)
+
+            try:
+                for sql in m.statements:
+                    execute(sql)
+            except Exception as e:
+                raise MigrationError("Migration %d (%s) failed: %s" % (m.version, m.description, e))\
+                        from e
+
+            _set_version(execute, m.version)
+
+        ret.append(m)
+
+    return ret
@@ -0,0 +1,86 @@
+import functools
+from robostat.util import noneflt
+
+# Yhteinen pohja rankeille jotka valitsevat joukkueen suorituksista yhden (esim. paras)
+# ja järjestävät sen mukaan. Sumon rankit laskee eri tavalla, ks. XSumoRank.
+#
+# Rankkeja pidetään välimuistissa tuhansittain, joten:
+#   * __slots__, ei __dict__iä
+#   * vertailuavain lasketaan kerran (sort_key) eikä jokaisessa vertailussa
+#   * johdetut listat ja str lasketaan vasta tarvittaessa ja vain kerran
+#   * pickle tallentaa vain (best, all), loput lasketaan uudestaan
+@functools.total_ordering
+class AggregateRank:
+
+    __slots__ = "best", "all", "sort_key", "_other_scores", "_played_scores", "_str"
+
+    def __init__(self, best, all):
+        self.best = best
+        self.all = all
+        # pelaamaton on aina huonoin
+        self.sort_key = (0,) if best is None else (1, self.score_key(best))
+        self._other_scores = None
+        self._played_scores = None
+        self._str = None
+
+    # Yksittäisen suorituksen vertailuavain, ylikirjoita jos scorejen vertailu on kallista
+    @staticmethod
+    def score_key(score):
+        return score
+
+    @staticmethod
+    def aggregate(scores):
+        raise NotImplementedError
+
+    @classmethod
+    def from_scores(cls, scores):
+        return cls(cls.aggregate(scores), scores)
+
+    # Uusi rank, jossa yksi pelaamaton suoritus on pelattu (ks. robostat.replay)
+    def with_score(self, score):
+        all = list(self.all)
+        # index() vertaisi scoreja Noneen
+        all[next(i for i,s in enumerate(all) if s is None)] = score
+        return self.from_scores(all)
+
+    def __reduce__(self):
+        return self.__class__, (self.best, self.all)
+
+    def __str__(self):
+        if self._str is None:
+            self._str = "%s [%s]" % (
+                str(self.best),
+                ", ".join(map(str, self.other_scores))
+            )
+        return self._str
+
+    def __repr__(self):
+        return str(self)
+
+    def __eq__(self, other):
+        return self.sort_key == other.sort_key
+
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+    @property
+    def other_scores(self):
+        if self._other_scores is None:
+            if self.best is None:
+                self._other_scores = [None] * (len(self.all)-1)
+            else:
+                self._other_scores = [s for s in self.all if s is not self.best]
+        return self._other_scores
+
+    @property
+    def played_scores(self):
+        if self._played_scores is None:
+            self._played_scores = [s for s in self.all if s is not None]
+        return self._played_scores
+
+# Paras suoritus, kelpaa kaikille scoreille joita voi vertailla suoraan
+class MaxRank(AggregateRank):
+
+    __slots__ = ()
+
+    aggregate = staticmethod(noneflt(functools.partial(max, default=None)))
@@ -0,0 +1,160 @@
+import os
+import sys
+import time
+import hashlib
+import marshal
+import struct
+import threading
+import importlib.util
+import robostat
+from robostat import metrics
+
+class LoadedInit:
+
+    def __init__(self, fname, ctx, tournament, mtime):
+        self.fname = fname
+        self.ctx = ctx
+        self.tournament = tournament
+        self.mtime = mtime
+
+# Käännetty init-tiedosto tallennetaan __pycache__-hakemistoon tiedoston viereen.
+# Välimuisti on voimassa jos mtime ja koko täsmää, tai jos ne ei täsmää mutta
+# lähdekoodin hash täsmää (esim. tiedosto kopioitu tai checkoutattu uudestaan).
+# header: magic, mtime_ns, size, sha256(source)
+_CACHE_HEADER = struct.Struct("<4sQQ32s")
+
+def _cache_path(fname):
+    tag = sys.implementation.cache_tag
+    if tag is None:
+        return None
+
+    dirname, basename = os.path.split(fname)
+    return os.path.join(dirname, "__pycache__", "%s.%s.rsxc" % (basename, tag))
+
+def _read_cache(cache):
+    try:
+        with open(cache, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None, None
+
+    if len(data) < _CACHE_HEADER.size:
+        return None, None
+
+    header = _CACHE_HEADER.unpack_from(data)
+    if header[0] != importlib.util.MAGIC_NUMBER:
+        return None, None
+
+    return header, data[_CACHE_HEADER.size:]
+
+def _write_cache(cache, st, digest, code):
+    tmp = "%s.%d.tmp" % (cache, os.getpid())
+
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        with open(tmp, "wb") as f:
+            f.write(_CACHE_HEADER.pack(importlib.util.MAGIC_NUMBER, st.st_mtime_ns,
+                st.st_size, digest))
+            f.write(marshal.dumps(code))
+        os.replace(tmp, cache)
+    except OSError:
+        # ei haittaa jos hakemistoon ei voi kirjoittaa, käännetään vaan joka kerta
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+
+def compile_init(fname):
+    st = os.stat(fname)
+    cache = _cache_path(fname)
+    header, body = _read_cache(cache) if cache is not None else (None, None)
+
+    if header is not None and header[1:3] == (st.st_mtime_ns, st.st_size):
+        try:
+            code = marshal.loads(body)
+        except (EOFError, ValueError, TypeError):
+            header = None
+        else:
+            metrics.cache.labels("compile", "hit").inc()
+            return code
+
+    with open(fname, "rb") as f:
+        source = f.read()
+
+    digest = hashlib.sha256(source).digest()
+
+    if header is not None and header[3] == digest:
+        try:
+            code = marshal.loads(body)
+        except (EOFError, ValueError, TypeError):
+            pass
+        else:
+            # päivitetään mtime ettei hashia tarvitse laskea ensi kerralla
+            _write_cache(cache, st, digest, code)
+            metrics.cache.labels("compile", "hit").inc()
+            return code
+
+    metrics.cache.labels("compile", "miss").inc()
+    code = compile(source, fname, "exec")
+
+    if cache is not None:
+        _write_cache(cache, st, digest, code)
+
+    return code
+
+# HUOM: tää ajaa koodia, vaarallinen
+def load_init(fname):
+    mtime = os.stat(fname).st_mtime_ns
+    code = compile_init(fname)
+
+    ctx = {}
+    tournament = robostat.Tournament()
+    with robostat.replace_default_tournament(tournament):
+        exec(code, ctx)
+
+    return LoadedInit(fname, ctx, tournament, mtime)
+
+# Pitää kirjaa ladatuista init-tiedostoista, jotta samassa prosessissa voi olla useampi
+# turnaus rinnakkain. Tiedosto ladataan uudestaan jos se on muuttunut.
+class TournamentRegistry:
+
+    def __init__(self, loader=load_init):
+        self.loader = loader
+        self._inits = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, fname):
+        path = os.path.abspath(fname)
+        mtime = os.stat(path).st_mtime_ns
+
+        ret = self._inits.get(path)
+        if ret is not None and ret.mtime == mtime:
+            metrics.cache.labels("init", "hit").inc()
+            return ret
+
+        with self._lock:
+            lock = self._locks.setdefault(path, threading.Lock())
+
+        # eri tiedostot voi ladata yhtä aikaa, samaa tiedostoa ei ladata kahdesti
+        start = time.perf_counter()
+        with lock:
+            metrics.lock_wait.labels("init").observe(time.perf_counter() - start)
+            ret = self._inits.get(path)
+            if ret is None or ret.mtime != mtime:
+                metrics.cache.labels("init", "miss").inc()
+                ret = self.loader(path)
+                self._inits[path] = ret
+            else:
+                metrics.cache.labels("init", "hit").inc()
+
+        return ret
+
+    def __getitem__(self, fname):
+        return self.get(fname).tournament
+
+    def discard(self, fname):
+        self._inits.pop(os.path.abspath(fname), None)
+
+    def __iter__(self):
+        return iter(list(self._inits.values()))
@@ -0,0 +1,153 @@
+import bisect
+import math
+import threading
+import collections
+import robostat.db as model
+from robostat.tournament import judged_scores_query, scores_fingerprint, rank_key, span
+
+# Rankingin historia tuomarointien aikaleimojen mukaan.
+# Lohkojen scoret haetaan yhdellä kyselyllä ts-järjestyksessä ja sovelletaan yksi kerrallaan
+# joukkueiden rankeihin (rank.with_score), joten koko päivän historia on yksi läpikäynti
+# eikä rankingia lasketa jokaiselle aikaleimalle uudestaan.
+# Lähtötilanteessa kaikki joukkueen suoritukset ovat pelaamattomia, kuten rankingissa
+# ennen tuomarointeja. Pisteet joilla ei ole aikaleimaa ovat mukana alusta asti.
+#
+# as_of() aloittaa lähimmästä tallennetusta välitilasta (checkpoint joka n:nnen scoren
+# jälkeen), joten mikä tahansa hetki lasketaan enintään n scoren päästä.
+# Sijoitukset ovat competition-sijoituksia (tasatulokset jakavat parhaan sijan).
+# Historia lasketaan uudestaan kun scores_fingerprint muuttuu, joten pisteitä muokatessa
+# tuomaroinnin ts pitää päivittää (ks. scores_fingerprint).
+
+RankChange = collections.namedtuple("RankChange", "ts team_id old new")
+
+class _Positions:
+
+    def __init__(self, ranks):
+        self.order = sorted((rank_key(r), t) for t,r in ranks.items())
+        self.keys = dict((t, k) for k,t in self.order)
+        self.pos = {}
+        for k, t in self.order:
+            self.pos[t] = len(self.order) - bisect.bisect_right(self.order, (k, math.inf)) + 1
+
+    # -> {team_id: vanha sijoitus} muuttuneille
+    def update(self, team, key):
+        old = self.keys[team]
+        if key == old:
+            return {}
+
+        order = self.order
+        del order[bisect.bisect_left(order, (old, team))]
+        bisect.insort(order, (key, team))
+        self.keys[team] = key
+
+        # väliin jäävät [min, max) siirtyvät yhden sijan
+        lo, hi, d = (old, key, 1) if key > old else (key, old, -1)
+        ret = {team: self.pos[team]}
+        for _, t in order[bisect.bisect_left(order, (lo,)):bisect.bisect_left(order, (hi,))]:
+            if t != team:
+                ret[t] = self.pos[t]
+                self.pos[t] += d
+
+        self.pos[team] = len(order) - bisect.bisect_right(order, (key, math.inf)) + 1
+        return ret
+
+class Replay:
+
+    def __init__(self, rank, *blocks, checkpoint=256):
+        self.rank = rank
+        self.blocks = blocks
+        self.checkpoint = checkpoint
+        self.fingerprint = None
+        self._lock = threading.Lock()
+
+    def _load(self, db):
+        # sama ranking voi olla käytössä useammalla kannalla (esim. testit)
+        fp = (db.get_bind(), *scores_fingerprint(db, *self.blocks))
+        if fp == self.fingerprint:
+            return
+
+        with span("replay:%s" % ",".join(b.id for b in self.blocks)):
+            rows = judged_scores_query(db, self.blocks,
+                        model.EventJudging.ts, model.Score.team_id, model.Event.block_id,
+                        model.Score.data)\
+                    .order_by(model.EventJudging.ts, model.Score.event_id, model.Score.judge_id,
+                        model.Score.team_id)\
+                    .all()
+
+            blocks = dict((b.id, b) for b in self.blocks)
+            counts = collections.Counter(team_id for _,team_id,_,_ in rows)
+            start = dict((t, self.rank.from_scores([None]*c)) for t,c in counts.items())
+            # [(ts, team_id, score)]
+            stream = []
+
+            for ts, team_id, block_id, data in rows:
+                if data is None:
+                    continue
+                score = blocks[block_id].ruleset.decode(data)
+                if ts is None:
+                    start[team_id] = start[team_id].with_score(score)
+                else:
+                    stream.append((ts, team_id, score))
+
+            ranks = dict(start)
+            checkpoints = []
+            for i, (_, team_id, score) in enumerate(stream):
+                if i % self.checkpoint == 0:
+                    checkpoints.append(dict(ranks))
+                ranks[team_id] = ranks[team_id].with_score(score)
+
+        self.start = start
+        self.stream = stream
+        self.ts = [ts for ts,_,_ in stream]
+        self.checkpoints = checkpoints
+        self.fingerprint = fp
+
+    # -> {team_id: rank} hetkellä ts (ts mukaanlukien)
+    def ranks_as_of(self, db, ts):
+        with self._lock:
+            self._load(db)
+            end = bisect.bisect_right(self.ts, ts)
+            if not end:
+                return dict(self.start)
+
+            c = (end-1) // self.checkpoint
+            ranks = dict(self.checkpoints[c])
+            for _, team_id, score in self.stream[c*self.checkpoint:end]:
+                ranks[team_id] = ranks[team_id].with_score(score)
+
+            return ranks
+
+    # -> [(team, rank)] kuten rankingit
+    def as_of(self, db, ts):
+        ranks = self.ranks_as_of(db, ts)
+        teams = dict((t.id, t) for t in db.query(model.Team).filter(model.Team.id.in_(list(ranks))))
+        return sorted(((teams[t], r) for t,r in ranks.items()),
+                key=lambda x: rank_key(x[1]), reverse=True)
+
+    # -> ([(team_id, sijoitus)] alussa, [RankChange]) ts-järjestyksessä.
+    # Saman aikaleiman scoret yhdistetään, joten välivaiheita ei näy.
+    def changes(self, db):
+        with self._lock:
+            self._load(db)
+            ranks = dict(self.start)
+            stream = self.stream
+
+        positions = _Positions(ranks)
+        initial = sorted(positions.pos.items(), key=lambda x: (x[1], x[0]))
+        ret = []
+        i = 0
+
+        while i < len(stream):
+            ts = stream[i][0]
+            old = {}
+            while i < len(stream) and stream[i][0] == ts:
+                _, team_id, score = stream[i]
+                ranks[team_id] = ranks[team_id].with_score(score)
+                for t, p in positions.update(team_id, rank_key(ranks[team_id])).items():
+                    old.setdefault(t, p)
+                i += 1
+
+            ret.extend(RankChange(ts, t, p, positions.pos[t])
+                    for t,p in sorted(old.items()) if positions.pos[t] != p)
+
+        return initial, ret
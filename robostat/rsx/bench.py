@@ -0,0 +1,49 @@
+import json
+import click
+from tabulate import tabulate
+from robostat.rsx.common import RsxError
+
+# benchmarks-paketti ei asennu robostatin mukana, joten komento toimii vain
+# lähdekoodihakemistosta ajettuna (tai jos benchmarks on muuten PYTHONPATHissa)
+def _import_benchmarks():
+    try:
+        from benchmarks import e2e
+    except ImportError:
+        raise RsxError("benchmarks package not found, run rsx bench from a source checkout")
+    return e2e
+
+def print_comparison(rows):
+    click.echo(tabulate([(
+        name,
+        "%.4f" % old,
+        "%.4f" % new,
+        "" if ratio is None else click.style("%.2fx" % ratio,
+            fg="red" if ratio > 1.1 else ("green" if ratio < 0.9 else None))
+    ) for name, old, new, ratio in rows], headers=["Benchmark", "Old", "New", "Ratio"]), err=True)
+
+@click.command("bench", help="Run end-to-end benchmarks on a synthetic tournament. "
+        "Requires a source checkout: the benchmarks package is not installed with robostat.")
+@click.option("-n", "--teams", default=60, type=click.IntRange(min=2))
+@click.option("-m", "--blocks", default=2, type=click.IntRange(min=1),
+        help="Blocks per ruleset")
+@click.option("-r", "--repeat", default=3, type=click.IntRange(min=1))
+@click.option("--played", default=1.0, type=click.FloatRange(0, 1),
+        help="Fraction of events with scores")
+@click.option("--seed", default=0)
+@click.option("--keep", type=click.Path(file_okay=False, exists=True),
+        help="Write the generated database and init file here instead of a temporary directory")
+@click.option("-o", "--output", type=click.File("w"), default="-")
+@click.option("--compare", type=click.File("r"), help="Compare with an earlier result file")
+def bench_command(output, compare, keep, **kwargs):
+    e2e = _import_benchmarks()
+    old = json.load(compare) if compare is not None else None
+
+    res = e2e.run(workdir=keep, log=lambda mes: click.echo("... %s" % mes, err=True), **kwargs)
+
+    json.dump(res, output, indent=2)
+    output.write("\n")
+
+    if old is not None:
+        if old.get("params") != res["params"]:
+            click.secho("Warning: comparing runs with different parameters", fg="yellow", err=True)
+        print_comparison(e2e.compare(old, res))
@@ -1,10 +1,12 @@
+import os
 import sys
 import click
 from sqlalchemy import create_engine
+from sqlalchemy.pool import SingletonThreadPool
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
-import robostat
 import robostat.db as model
+from robostat.registry import TournamentRegistry
 from robostat.util import lazy
 
 def ee(mes):
@@ -62,6 +64,26 @@ class SQLAParam:
             self.engine.echo = "debug"
         elif verbosity >= 1:
             self.engine.echo = True
+        else:
+            # rsx serve käyttää samaa engineä monelle komennolle
+            self.engine.echo = False
+
+# rsx serve asettaa tämän, jolloin enginet ja niiden yhteydet jää henkiin komentojen välillä
+engine_cache = None
+
+def get_engine(url, **kwargs):
+    if engine_cache is None:
+        return create_engine(url, **kwargs)
+
+    key = (url, tuple(sorted(kwargs.items())))
+
+    if key not in engine_cache:
+        if url.startswith("sqlite") and "poolclass" not in kwargs:
+            # serve ajaa komennot yhdessä säikeessä, joten sama yhteys kelpaa kaikille
+            kwargs = dict(kwargs, poolclass=SingletonThreadPool)
+        engine_cache[key] = create_engine(url, **kwargs)
+
+    return engine_cache[key]
 
 class SQLAParamType(click.ParamType):
     name = "sqlalchemy"
@@ -79,7 +101,12 @@ class SQLAParamType(click.ParamType):
         if isinstance(value, SQLAParam):
             return value
 
-        engine = create_engine("%s%s" % (self.prefix, value), **self.engine_args)
+        if self.prefix.startswith("sqlite") and value and value != ":memory:":
+            # rsx serve ajaa komennot asiakkaan hakemistossa, joten suhteellinen polku
+            # pitää kiinnittää ennen kuin engine haetaan välimuistista
+            value = os.path.abspath(value)
+
+        engine = get_engine("%s%s" % (self.prefix, value), **self.engine_args)
         value = SQLAParam(engine, autocommit=self.autocommit, session_args=self.session_args)
 
         if ctx is not None:
@@ -97,21 +124,18 @@ class InitParam:
         self.ctx = ctx
         self.tournament = tournament
 
+init_registry = TournamentRegistry()
+
 # HUOM: tää ajaa koodia, vaarallinen
 class InitParamType(click.ParamType):
     name = "init"
 
     def convert(self, value, param, ctx):
-        if isinstance(value, InitParamType):
+        if isinstance(value, InitParam):
             return value
 
-        # TODO joku tapa jolla tässä voi käyttää muutaki kun defaulttia
-        ctx = {}
-        tournament = robostat.Tournament()
-        with robostat.replace_default_tournament(tournament):
-            exec(open(value).read(), ctx)
-
-        return InitParam(value, ctx, tournament)
+        init = init_registry.get(value)
+        return InitParam(value, init.ctx, init.tournament)
 
 verbose_option = click.option(
     "-v", "--verbose",
@@ -132,3 +156,39 @@ init_option = click.option(
     required=True
 )
 
+
+def _forward_daemon(stdin):
+    def ret(ctx, param, value):
+        if value is None or ctx.resilient_parsing:
+            return
+
+        from robostat.rsx.daemon import forward
+
+        if "rsx.argv" not in ctx.meta:
+            raise RsxError("--daemon only works through the rsx command")
+
+        ctx.exit(forward(value, ctx.meta["rsx.argv"], stdin=stdin))
+
+    return ret
+
+# Ajaa komennon `rsx serve` -palvelimella.
+# Eager, joten initiä ei ladata eikä tietokantaa avata tässä prosessissa.
+# `rsx show --watch` ei pääty koskaan, joten sitä ei voi ajaa daemonissa eikä explainissa.
+# Komentoriviä ei jäsennetä (init-tiedosto ajettaisiin), vaan lippu etsitään sellaisenaan.
+def reject_watch(args, where):
+    args = list(args)
+    if "--" in args:
+        args = args[:args.index("--")]
+
+    if "-w" in args or "--watch" in args:
+        raise click.UsageError("--watch can't be used %s" % where)
+
+def daemon_option(stdin=False):
+    return click.option(
+        "--daemon",
+        metavar="SOCKET",
+        envvar="ROBOSTAT_DAEMON",
+        is_eager=True,
+        expose_value=False,
+        callback=_forward_daemon(stdin)
+    )
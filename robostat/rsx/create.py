@@ -1,10 +1,45 @@
 import click
 import robostat.db as model
+from robostat import migrate
 from robostat.rsx import common
 
 @click.command("create")
+@common.daemon_option()
 @common.verbose_option
 @common.db_option
 @common.init_option
 def create_command(db, **kwargs):
     model.Base.metadata.create_all(db.engine)
+    # create_all luo uusimman skeeman, joten migraatioita ei tarvitse ajaa
+    if migrate.get_version(db.engine) == 0:
+        migrate.stamp(db.engine)
+
+@click.command("migrate")
+@common.daemon_option()
+@common.verbose_option
+@common.db_option
+@click.option("--to", "target", type=click.IntRange(0, migrate.LATEST), default=migrate.LATEST,
+        help="Target schema version")
+@click.option("-n", "--dry-run", is_flag=True, help="Only list pending migrations")
+def migrate_command(db, target, dry_run, **kwargs):
+    try:
+        pending = migrate.pending(db.engine, target)
+    except migrate.MigrationError as e:
+        raise common.RsxError(str(e))
+
+    if not pending:
+        click.echo("Schema is up to date (version %d)" % migrate.get_version(db.engine))
+        return
+
+    if dry_run:
+        for m in pending:
+            click.echo("%s %s" % (common.styleid(m.version), m.description))
+        return
+
+    try:
+        migrate.migrate(db.engine, target,
+                log=lambda m: click.echo("%s %s" % (common.styleid(m.version), m.description)))
+    except migrate.MigrationError as e:
+        raise common.RsxError(str(e))
+
+    click.echo("Schema is now at version %d" % migrate.get_version(db.engine))
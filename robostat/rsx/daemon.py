@@ -0,0 +1,214 @@
+import io
+import os
+import sys
+import time
+import json
+import socket
+import threading
+import traceback
+import contextlib
+import socketserver
+import click
+from robostat import metrics
+from robostat.rsx import common
+
+# Protokolla: asiakas lähettää yhden json-rivin
+#     {"argv": [...], "cwd": ..., "env": {...}, "stdin": ..., "color": ...}
+# ja palvelin vastaa json-riveillä {"out": ...}, {"err": ...} ja lopuksi {"exit": koodi}.
+# Tuloste lähetetään sitä mukaa kun komento kirjoittaa sitä.
+
+def _strip_daemon(argv):
+    ret = []
+    it = iter(argv)
+
+    for a in it:
+        if a == "--daemon":
+            next(it, None)
+        elif not a.startswith("--daemon="):
+            ret.append(a)
+
+    return ret
+
+def forward(sock_path, argv, stdin=False):
+    req = {
+        "argv": _strip_daemon(argv),
+        "cwd": os.getcwd(),
+        "env": dict((k, v) for k, v in os.environ.items()
+            if k.startswith("ROBOSTAT_") and k != "ROBOSTAT_DAEMON"),
+        "stdin": sys.stdin.read() if stdin and not sys.stdin.isatty() else None,
+        "color": sys.stdout.isatty() or None
+    }
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(sock_path)
+    except OSError as e:
+        raise common.RsxError("Can't connect to daemon at %s: %s" % (sock_path, e))
+
+    with contextlib.closing(sock):
+        sock.sendall(json.dumps(req).encode("utf8") + b"\n")
+
+        for line in sock.makefile("r", encoding="utf8"):
+            mes = json.loads(line)
+
+            if "out" in mes:
+                click.echo(mes["out"], nl=False)
+            elif "err" in mes:
+                click.echo(mes["err"], nl=False, err=True)
+            elif "exit" in mes:
+                return mes["exit"]
+
+    raise common.RsxError("Daemon closed connection unexpectedly")
+
+class _MessageStream(io.TextIOBase):
+
+    def __init__(self, wfile, key):
+        self.wfile = wfile
+        self.key = key
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        # click kokeilee kirjoittaa bytes-olion selvittääkseen onko virta binäärinen
+        if not isinstance(s, str):
+            raise TypeError("write() argument must be str, not %s" % type(s).__name__)
+
+        if s:
+            self.wfile.write(json.dumps({self.key: s}).encode("utf8") + b"\n")
+        return len(s)
+
+    def flush(self):
+        self.wfile.flush()
+
+@contextlib.contextmanager
+def _request_env(req):
+    old_cwd = os.getcwd()
+    old_env = os.environ.copy()
+
+    try:
+        os.chdir(req.get("cwd") or old_cwd)
+        for k in [k for k in os.environ if k.startswith("ROBOSTAT_")]:
+            del os.environ[k]
+        os.environ.update(req.get("env") or {})
+        yield
+    finally:
+        os.environ.clear()
+        os.environ.update(old_env)
+        os.chdir(old_cwd)
+
+def run_request(req, out, err):
+    from robostat.rsx.main import main
+
+    argv = req["argv"]
+    if argv and argv[0] == "serve":
+        click.echo("Error: Can't run serve through the daemon\n", file=err)
+        return 1
+
+    stdin = io.StringIO(req.get("stdin") or "")
+
+    with _request_env(req),\
+            contextlib.redirect_stdout(out),\
+            contextlib.redirect_stderr(err):
+        old_stdin, sys.stdin = sys.stdin, stdin
+
+        try:
+            if argv and argv[0] == "show":
+                common.reject_watch(argv[1:], "through the daemon")
+            ret = main.main(args=argv, prog_name="rsx", standalone_mode=False,
+                    color=req.get("color"))
+            return ret if isinstance(ret, int) else 0
+        except click.ClickException as e:
+            e.show(file=err)
+            return e.exit_code
+        except click.exceptions.Exit as e:
+            return e.exit_code
+        except click.Abort:
+            click.echo("Aborted!", file=err)
+            return 1
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception:
+            err.write(traceback.format_exc())
+            return 1
+        finally:
+            sys.stdin = old_stdin
+
+class RsxRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            req = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+
+        out = _MessageStream(self.wfile, "out")
+        err = _MessageStream(self.wfile, "err")
+
+        # stdout/stderr/cwd on prosessin yhteisiä, joten komennot ajetaan yksi kerrallaan
+        start = time.perf_counter()
+        with self.server.lock:
+            metrics.lock_wait.labels("daemon").observe(time.perf_counter() - start)
+            code = run_request(req, out, err)
+
+        self.wfile.write(json.dumps({"exit": code}).encode("utf8") + b"\n")
+
+class RsxServer(socketserver.UnixStreamServer):
+
+    def __init__(self, sock_path):
+        self.lock = threading.Lock()
+        super().__init__(sock_path, RsxRequestHandler)
+
+@click.command("serve")
+@click.option("-s", "--socket", "sock_path", envvar="ROBOSTAT_DAEMON", required=True)
+@click.option("-i", "--init", "inits", multiple=True, type=click.Path(exists=True),
+        help="Preload init file")
+@click.option("--metrics-file", type=click.Path(dir_okay=False),
+        help="Write OpenMetrics text to this file periodically")
+@click.option("--metrics-interval", type=click.FloatRange(min=0.1), default=15.0)
+def serve_command(sock_path, inits, metrics_file, metrics_interval):
+    common.engine_cache = {}
+    # palvelin on pitkäikäinen, joten mittarit kerätään aina (`rsx metrics --daemon`)
+    metrics.enable()
+    writer = None
+
+    if metrics_file is not None:
+        writer = metrics.MetricsWriter(metrics_file, metrics_interval)
+        writer.start()
+
+    for fname in inits:
+        common.init_registry.get(fname)
+
+    if os.path.exists(sock_path):
+        # vanha socket jos edellinen palvelin kaatui
+        os.unlink(sock_path)
+
+    server = RsxServer(sock_path)
+    click.echo("Listening on %s" % sock_path, err=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(sock_path)
+        if writer is not None:
+            writer.stop()
+
+# Tulostaa tai kirjoittaa tämän prosessin mittarit.
+# Hyödyllinen lähinnä --daemonin kanssa, jolloin mittarit tulevat palvelimelta.
+@click.command("metrics")
+@common.daemon_option()
+@click.option("-o", "--output", type=click.Path(dir_okay=False),
+        help="Write to file (atomically) instead of stdout")
+def metrics_command(output):
+    if output is None:
+        click.echo(metrics.REGISTRY.expose(), nl=False)
+    else:
+        metrics.REGISTRY.write(output)
@@ -0,0 +1,64 @@
+import io
+import contextlib
+import click
+from robostat.explain import capture
+from robostat.rsx.common import RsxError, daemon_option, reject_watch
+
+def print_report(r, verbose):
+    header = "%s %s" % (
+        click.style("[%s]" % ("OK" if r.ok else "!!"), fg="green" if r.ok else "red", bold=True),
+        ", ".join(" > ".join(p) for p in r.paths if p) or "(no span)"
+    )
+
+    if r.count > 1:
+        header += click.style(" (executed %d times)" % r.count, fg="yellow")
+
+    click.echo(header)
+
+    if r.ok and not verbose:
+        return
+
+    click.echo(click.style(r.statement.strip(), fg="bright_black"))
+
+    for _, _, detail in r.plan:
+        click.echo("    %s" % detail)
+
+    for issue in r.issues:
+        click.secho("  - %s" % issue, fg="red")
+
+    for s in r.suggestions:
+        click.secho("  + %s" % s, fg="yellow")
+
+    click.echo()
+
+# Ajaa `rsx show` -komennon ja näyttää sen kyselyjen suunnitelmat, esim.
+#     rsx explain -d db.sqlite3 -i init.py ranking xsumo
+@click.command("explain", context_settings={
+    "ignore_unknown_options": True,
+    "allow_interspersed_args": False
+})
+@daemon_option()
+@click.option("-a", "--all", "verbose", is_flag=True, help="Show plans without issues too")
+@click.argument("show_args", nargs=-1, type=click.UNPROCESSED)
+def explain_command(verbose, show_args):
+    from robostat.rsx.show import show_command
+
+    reject_watch(show_args, "with explain")
+
+    # show:n oma tuloste piilotetaan, virheet näytetään normaalisti
+    with capture() as c, contextlib.redirect_stdout(io.StringIO()):
+        show_command.main(list(show_args), prog_name="rsx explain", standalone_mode=False)
+
+    try:
+        reports = c.reports()
+    except ValueError as e:
+        raise RsxError(str(e))
+
+    for r in reports:
+        print_report(r, verbose)
+
+    bad = sum(1 for r in reports if not r.ok)
+    click.echo("%d queries, %s" % (
+        len(reports),
+        click.style("%d with issues" % bad, fg="red") if bad else click.style("no issues", fg="green")
+    ))
@@ -1,20 +1,66 @@
+import importlib
 import click
-from robostat.rsx.create import create_command
-from robostat.rsx.timetable import import_command, export_command
-from robostat.rsx.show import show_command
-from robostat.rsx.modify import del_command, rename_command, shadow_command
-
-@click.group()
-def main():
-    pass
-
-main.add_command(create_command)
-main.add_command(import_command)
-main.add_command(export_command)
-main.add_command(show_command)
-main.add_command(del_command)
-main.add_command(rename_command)
-main.add_command(shadow_command)
+
+# Alikomennot ladataan vasta kun niitä tarvitaan, jolloin esim. `rsx show` ei importtaa
+# pttt:tä eikä `rsx import` tabulatea
+class LazyGroup(click.Group):
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = dict(lazy_commands or {})
+
+    def parse_args(self, ctx, args):
+        # --daemon välittää komentorivin sellaisenaan palvelimelle
+        ctx.meta["rsx.argv"] = list(args)
+        return super().parse_args(ctx, args)
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name not in self.commands and name in self.lazy_commands:
+            module, attr = self.lazy_commands[name].split(":")
+            self.add_command(getattr(importlib.import_module(module), attr), name)
+
+        return super().get_command(ctx, name)
+
+commands = {
+    "create": "robostat.rsx.create:create_command",
+    "migrate": "robostat.rsx.create:migrate_command",
+    "import": "robostat.rsx.timetable:import_command",
+    "export": "robostat.rsx.timetable:export_command",
+    "show": "robostat.rsx.show:show_command",
+    "del": "robostat.rsx.modify:del_command",
+    "rename": "robostat.rsx.modify:rename_command",
+    "shadow": "robostat.rsx.modify:shadow_command",
+    "serve": "robostat.rsx.daemon:serve_command",
+    "metrics": "robostat.rsx.daemon:metrics_command",
+    "bench": "robostat.rsx.bench:bench_command",
+    "explain": "robostat.rsx.explain:explain_command"
+}
+
+def print_profile(profile):
+    from tabulate import tabulate
+
+    # tabulate poistaa alusta välilyönnit, joten sisennys pisteillä
+    rows = [(". "*depth + name, st.calls, "%.2f" % (1000*st.time), st.queries,
+        "%.2f" % (1000*st.sql_time), st.items or "") for depth, name, st in profile.tree()]
+
+    other = profile.stats[()]
+    rows.append(("(total)", "", "", other.queries, "%.2f" % (1000*other.sql_time), ""))
+
+    click.echo(tabulate(rows, headers=["Span", "Calls", "Time (ms)", "Queries", "SQL (ms)",
+        "Items"]), err=True)
+
+@click.group(cls=LazyGroup, lazy_commands=commands)
+@click.option("--profile", is_flag=True,
+        help="Print query counts and timings of rankings and decoding")
+@click.pass_context
+def main(ctx, profile):
+    if profile:
+        from robostat.tournament import profile as profile_
+        p = ctx.with_resource(profile_())
+        ctx.call_on_close(lambda: print_profile(p))
 
 if __name__ == "__main__":
     main()
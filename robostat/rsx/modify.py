@@ -1,7 +1,8 @@
 import click
 from sqlalchemy.exc import IntegrityError
 from robostat import db as model
-from robostat.rsx.common import RsxError, verbose_option, db_option, ee, nameid, styleid
+from robostat.rsx.common import RsxError, verbose_option, db_option, daemon_option, ee, nameid,\
+        styleid
 from robostat.rsx.crud import add_sym, del_sym, query_selectors
 
 class Crud:
@@ -73,6 +74,7 @@ def get_cruds(attr):
     return [k for k,v in cruds.items() if hasattr(v, attr)]
 
 @click.command("del")
+@daemon_option()
 @verbose_option
 @db_option
 @click.argument("what", type=click.Choice(get_cruds("del_")))
@@ -83,6 +85,7 @@ def del_command(**kwargs):
     crud.del_(kwargs["param"])
 
 @click.command("rename")
+@daemon_option()
 @verbose_option
 @db_option
 @click.argument("what", type=click.Choice(get_cruds("rename")))
@@ -92,6 +95,7 @@ def rename_command(**kwargs):
     cruds[kwargs["what"]](kwargs["db"]).rename(kwargs["from"], kwargs["to"])
 
 @click.command("shadow")
+@daemon_option()
 @verbose_option
 @db_option
 @click.argument("selector")
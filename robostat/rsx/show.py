@@ -1,5 +1,10 @@
+import sys
+import csv
+import json
+import time
 import collections
 import functools
+import itertools
 import operator
 from base64 import b64encode
 from datetime import datetime
@@ -8,9 +13,11 @@ import sqlalchemy as sa
 from sqlalchemy.orm import subqueryload, contains_eager
 from tabulate import tabulate
 from robostat import db as model
-from robostat.tournament import hide_query_shadows
-from robostat.util import enumerate_rank
-from robostat.rsx.common import RsxError, InitParamType, db_option, verbose_option, nameid, styleid
+from robostat.tournament import hide_query_shadows, keyset, fetch_page, iter_keyset,\
+        change_token, enumerate_ranking, ranking_cursor, ranking_after, EVENT_KEY, SCORE_KEY
+from robostat.util import TIE_MODES
+from robostat.rsx.common import RsxError, InitParamType, db_option, verbose_option, daemon_option,\
+        nameid, styleid
 
 def localts(ts, fmt="%d.%m.%Y %H:%M"):
     return datetime.fromtimestamp(ts).strftime(fmt)
@@ -19,33 +26,55 @@ def table_generator(headers):
     def ret(f):
         @functools.wraps(f)
         def wrapper(self, *args, **kwargs):
-            data = list(f(self, *args, **kwargs))
-            click.echo(tabulate(data,
-                headers=headers,
-                tablefmt=self.tablefmt
-            ))
+            self.write_table(headers, f(self, *args, **kwargs))
         return wrapper
     return ret
 
-class PrettyFormatter:
+# Formatterit saavat rivit generaattorina ja kirjoittavat ne sitä mukaa kun niitä tulee.
+# Aliluokat määrittelevät miten yksittäiset solut esitetään.
+class Formatter:
 
-    def __init__(self, tablefmt):
-        self.tablefmt = tablefmt
+    def id(self, id):
+        return id
+
+    def named(self, obj):
+        return obj.name
+
+    def time(self, ts, fmt="%d.%m.%Y %H:%M"):
+        return localts(ts, fmt)
+
+    def many(self, values, inline=False):
+        return list(values)
+
+    def block_id(self, id):
+        return id
+
+    def judging(self, event, judging):
+        return "%s%s" % (self.named(judging.judge), "" if judging.is_future else " (OK)")
+
+    def not_in_init(self):
+        return "(Not in init)"
+
+    def judging_status(self, done, count):
+        return "%d/%d" % (done, count)
+
+    def rank(self, rank):
+        return rank
+
+    def score(self, score):
+        return str(score)
+
+    def write_table(self, headers, rows):
+        raise NotImplementedError
 
     @table_generator(["Id", "Time", "Teams", "Judges"])
     def print_block(self, events):
         for e in events:
             yield (
-                styleid(e.id),
-                localts(e.ts_sched),
-                "\n".join(map(nameid, e.teams)),
-                "\n".join(("%s %s" % (
-                    nameid(j.judge),
-                    ("%s (%s)" % (
-                        click.style("OK", fg="green"),
-                        localts(e.ts_sched, "%d.%m %H:%M")
-                    )) if not j.is_future else ""
-                )) for j in e.judgings)
+                self.id(e.id),
+                self.time(e.ts_sched),
+                self.many(map(self.named, e.teams)),
+                self.many(self.judging(e, j) for j in e.judgings)
             )
 
     @table_generator(["Event", "Team", "Judge", "Score", "Data"])
@@ -62,9 +91,9 @@ class PrettyFormatter:
                 data = ""
 
             yield (
-                styleid(s.event_id),
-                nameid(s.team),
-                nameid(s.judge),
+                self.id(s.event_id),
+                self.named(s.team),
+                self.named(s.judge),
                 score,
                 data
             )
@@ -73,55 +102,174 @@ class PrettyFormatter:
     def print_blocks(self, block_info):
         for id, info in block_info:
             if info.block is None:
-                name = click.style("(Not in init)", fg="red")
+                name = self.not_in_init()
             else:
                 name = info.block.name
 
             if info.start_ts is None:
                 time = ""
             else:
-                time = "%s - %s" % (localts(info.start_ts), localts(info.end_ts, "%d.%m %H:%M"))
-
-            if info.judging_count > 0:
-                if info.judging_done == info.judging_count:
-                    judging_color = "green"
-                elif info.judging_done > 0:
-                    judging_color = "white"
-                else:
-                    judging_color = "red"
-            else:
-                judging_color = "bright_black"
+                time = "%s - %s" % (self.time(info.start_ts), self.time(info.end_ts, "%d.%m %H:%M"))
 
             yield (
-                click.style(id, fg="cyan"),
+                self.block_id(id),
                 name,
                 time,
-                click.style("%d/%d" % (info.judging_done, info.judging_count), fg=judging_color)
+                self.judging_status(info.judging_done, info.judging_count)
             )
 
     @table_generator(["Rank", "Team", "Score"])
     def print_ranking(self, ranking):
-        for rank, (team, score) in enumerate_rank(ranking, key=operator.itemgetter(1)):
+        for rank, (team, score) in ranking:
             yield (
-                "#%d" % rank,
-                nameid(team),
-                score
+                self.rank(rank),
+                self.named(team),
+                self.score(score)
             )
 
     @table_generator(["Id", "Name", "Flags", "Blocks"])
     def print_teams(self, team_info):
         for team, blocks in team_info:
-            bs = ", ".join(
-                styleid(b) if isinstance(b, str) else nameid(b) for b in blocks
-            )
-
             yield (
-                styleid(team.id),
+                self.id(team.id),
                 team.name,
                 "Shadow" if team.is_shadow else "",
-                bs
+                self.many((self.id(b) if isinstance(b, str) else self.named(b) for b in blocks),
+                    inline=True)
             )
 
+class PrettyFormatter(Formatter):
+
+    # batch: montako riviä kerralla taulukoidaan, None = koko taulukko kerralla.
+    # Sarakkeiden leveys lasketaan erikseen jokaiselle erälle.
+    def __init__(self, tablefmt, batch=None):
+        self.tablefmt = tablefmt
+        self.batch = batch
+
+    def id(self, id):
+        return styleid(id)
+
+    def block_id(self, id):
+        return click.style(id, fg="cyan")
+
+    def named(self, obj):
+        return nameid(obj)
+
+    def many(self, values, inline=False):
+        return (", " if inline else "\n").join(values)
+
+    def judging(self, event, judging):
+        return "%s %s" % (
+            nameid(judging.judge),
+            ("%s (%s)" % (
+                click.style("OK", fg="green"),
+                localts(event.ts_sched, "%d.%m %H:%M")
+            )) if not judging.is_future else ""
+        )
+
+    def not_in_init(self):
+        return click.style("(Not in init)", fg="red")
+
+    def judging_status(self, done, count):
+        if count > 0:
+            if done == count:
+                color = "green"
+            elif done > 0:
+                color = "white"
+            else:
+                color = "red"
+        else:
+            color = "bright_black"
+
+        return click.style("%d/%d" % (done, count), fg=color)
+
+    def rank(self, rank):
+        # fractional-sijoitukset voi olla esim. 2.5
+        return "#%g" % rank
+
+    def score(self, score):
+        return score
+
+    def write_table(self, headers, rows):
+        if self.batch is None:
+            click.echo(tabulate(list(rows), headers=headers, tablefmt=self.tablefmt))
+            return
+
+        rows = iter(rows)
+        first = True
+
+        while True:
+            data = list(itertools.islice(rows, self.batch))
+            if not data and not first:
+                break
+
+            click.echo(tabulate(data, headers=headers if first else (), tablefmt=self.tablefmt))
+            first = False
+
+# --watch terminaalissa: taulukko piirretään kerran ja sen jälkeen kirjoitetaan
+# uudestaan vain muuttuneet rivit. Käytetään vain kun stdout on terminaali,
+# joten ohjauskoodit kirjoitetaan aina (color=True).
+class LiveFormatter(PrettyFormatter):
+
+    def __init__(self, tablefmt):
+        super().__init__(tablefmt)
+        self.lines = None
+
+    def write_table(self, headers, rows):
+        lines = tabulate(list(rows), headers=headers, tablefmt=self.tablefmt).split("\n")
+
+        if self.lines is None or len(lines) != len(self.lines):
+            if self.lines is not None:
+                # rivimäärä muuttui, tyhjennetään vanha taulukko
+                click.echo("\x1b[%dA\x1b[J" % len(self.lines), nl=False, color=True)
+            click.echo("\n".join(lines), color=True)
+        else:
+            # kursori on taulukon alapuolella, käydään muuttuneilla riveillä ja palataan
+            n = len(lines)
+            click.echo("".join(
+                "\x1b[%dA\r\x1b[2K%s\x1b[%dB\r" % (n-i, new, n-i)
+                for i, (old, new) in enumerate(zip(self.lines, lines))
+                if old != new
+            ), nl=False, color=True)
+
+        self.lines = lines
+
+class _EchoFile:
+
+    def write(self, s):
+        click.echo(s, nl=False)
+
+class CsvFormatter(Formatter):
+
+    def __init__(self, delimiter=","):
+        self.delimiter = delimiter
+
+    def many(self, values, inline=False):
+        return ", ".join(values)
+
+    def write_table(self, headers, rows):
+        writer = csv.writer(_EchoFile(), delimiter=self.delimiter, lineterminator="\n")
+        writer.writerow(headers)
+
+        for row in rows:
+            writer.writerow(row)
+
+class TsvFormatter(CsvFormatter):
+
+    def __init__(self):
+        super().__init__(delimiter="\t")
+
+class NdjsonFormatter(Formatter):
+
+    def time(self, ts, fmt=None):
+        return ts
+
+    def write_table(self, headers, rows):
+        keys = [h.lower() for h in headers]
+
+        for row in rows:
+            click.echo(json.dumps(dict(zip(keys, row)), ensure_ascii=False))
+
 class BlockInfo:
 
     def __init__(self):
@@ -134,12 +282,41 @@ class BlockInfo:
 
 class ShowOpt:
 
-    def __init__(self, db, init, fmt, param, hide_shadows):
+    def __init__(self, db, init, fmt, param, hide_shadows, limit=None, after=None,
+            ties="competition"):
         self.db = db
         self.init = init
         self.fmt = fmt
         self.param = param
         self.hide_shadows = hide_shadows
+        self.limit = limit
+        self.after = after
+        self.ties = ties
+
+    @property
+    def cursor(self):
+        if self.after is None:
+            return ()
+
+        try:
+            return tuple(int(x) for x in self.after.split(","))
+        except ValueError:
+            raise RsxError("Invalid cursor: '%s'" % self.after)
+
+# Ilman --limit rivit haetaan sivu kerrallaan, jolloin muistissa on vain yksi sivu
+# ja tulostus alkaa heti ensimmäisen sivun jälkeen
+PAGE_SIZE = 500
+
+def paginate(query, key, opt):
+    if opt.limit is None:
+        return iter_keyset(query, key, opt.cursor, page_size=PAGE_SIZE)
+
+    rows, cursor = fetch_page(keyset(query, key, opt.cursor), key, opt.limit)
+
+    if cursor is not None:
+        click.echo("Next page: --after %s" % ",".join(map(str, cursor)), err=True)
+
+    return rows
 
 def require_init(f):
     @functools.wraps(f)
@@ -163,7 +340,6 @@ def require_param(name):
 def show_block(block, opt):
     query = opt.db.query(model.Event)\
             .filter_by(block_id=block)\
-            .order_by(model.Event.ts_sched)\
             .options(
                     subqueryload(model.Event.teams_part)
                     .joinedload(model.EventTeam.team, innerjoin=True),
@@ -176,18 +352,13 @@ def show_block(block, opt):
     if opt.hide_shadows:
         query = hide_query_shadows(query)
 
-    opt.fmt.print_block(query.all())
+    opt.fmt.print_block(paginate(query, EVENT_KEY, opt))
 
 @require_param("block")
 def show_scores(block, opt):
     query = opt.db.query(model.Score)\
             .join(model.Score.event)\
             .filter(model.Event.block_id == block)\
-            .order_by(
-                    model.Score.event_id,
-                    model.Score.team_id,
-                    model.Score.judge_id
-            )\
             .options(
                     contains_eager(model.Score.event),
                     subqueryload(model.Score.team),
@@ -197,16 +368,19 @@ def show_scores(block, opt):
     if opt.hide_shadows:
         query = hide_query_shadows(query)
 
-    scores = query.all()
+    scores = paginate(query, SCORE_KEY, opt)
 
     if opt.init is not None and block in opt.init.tournament.blocks:
-        ruleset = opt.init.tournament.blocks[block].ruleset
-        for s in scores:
-            if s.has_score:
-                s.decoded_score = ruleset.decode(s.data)
+        scores = decorate_scores(scores, opt.init.tournament.blocks[block].ruleset)
 
     opt.fmt.print_scores(scores)
 
+def decorate_scores(scores, ruleset):
+    for s in scores:
+        if s.has_score:
+            s.decoded_score = ruleset.decode(s.data)
+        yield s
+
 @require_init
 def show_blocks(opt):
     block_info = collections.defaultdict(BlockInfo)
@@ -245,6 +419,18 @@ def show_blocks(opt):
 
     opt.fmt.print_blocks(sorted(block_info.items(), key=operator.itemgetter(0)))
 
+def _tuples(x):
+    return tuple(map(_tuples, x)) if isinstance(x, list) else x
+
+# Rankingin kursori on json-lista [rank_key, team_id], ks. ranking_cursor
+def _ranking_cursor(after):
+    try:
+        key, team_id = json.loads(after)
+    except (ValueError, TypeError):
+        raise RsxError("Invalid ranking cursor: '%s'" % after)
+
+    return _tuples(key), team_id
+
 @require_init
 @require_param("ranking")
 def show_ranking(ranking, opt):
@@ -253,11 +439,36 @@ def show_ranking(ranking, opt):
     except KeyError:
         raise RsxError("No such ranking: '%s'" % ranking)
 
-    ranks = ranks(opt.db)
+    after = _ranking_cursor(opt.after) if opt.after is not None else None
+
+    # sijoitukset pitää laskea koko listasta jos alku rajataan pois tai shadowit piilotetaan,
+    # pelkän top-N:n voi laskea suoraan (paitsi fractional, jossa viimeisen tasatuloksen
+    # sijoitus riippuu sen koosta)
+    if after is not None or opt.hide_shadows or opt.limit is None or opt.ties == "fractional":
+        ranks = ranks(opt.db)
+    else:
+        # +1 jotta tiedetään onko seuraavaa sivua
+        ranks = ranks(opt.db, limit=opt.limit+1)
 
     if opt.hide_shadows:
         ranks = [r for r in ranks if not r[0].is_shadow]
 
+    ranks = enumerate_ranking(ranks, opt.ties)
+
+    if after is not None:
+        ranks = ranks[len(ranks) - len(ranking_after([r for _,r in ranks], after)):]
+
+    if opt.limit is not None:
+        if len(ranks) > opt.limit:
+            try:
+                cursor = json.dumps(ranking_cursor(*ranks[opt.limit-1][1]))
+            except TypeError:
+                # rankin avainta ei voi kirjoittaa komentoriville
+                cursor = None
+            if cursor is not None:
+                click.echo("Next page: --after '%s'" % cursor, err=True)
+        ranks = ranks[:opt.limit]
+
     opt.fmt.print_ranking(ranks)
 
 def show_teams(opt):
@@ -281,7 +492,6 @@ def show_teams(opt):
         .distinct()\
         .order_by(model.Event.block_id)
 
-    teams = teams_query.all()
     team_blocks = team_blocks_query.all()
 
     block_info = collections.defaultdict(list)
@@ -296,7 +506,35 @@ def show_teams(opt):
                 if bids[i] in blocks:
                     bids[i] = blocks[bids[i]]
 
-    opt.fmt.print_teams([(t, block_info[t.id]) for t in teams])
+    opt.fmt.print_teams((t, block_info[t.id]) for t in teams_query.yield_per(PAGE_SIZE))
+
+# Pitää yhden yhteyden auki ja ajaa komennon uudestaan vain kun tietokanta on muuttunut.
+# Sessio sidotaan samaan yhteyteen, jolloin sqlite ei avaa uutta yhteyttä joka kierroksella.
+def watch(show, opt, interval):
+    engine = opt.db.session.bind
+    conn = engine.connect()
+    opt.db.session.bind = conn
+    version = None
+
+    try:
+        while True:
+            v = change_token(conn)
+
+            if v != version:
+                version = v
+                show(opt)
+                if not isinstance(opt.fmt, LiveFormatter):
+                    click.echo()
+                # rollback vapauttaa lukot ja unohtaa ladatut oliot seuraavaa kierrosta varten
+                opt.db.rollback()
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        opt.db.rollback()
+        opt.db.session.bind = engine
+        conn.close()
 
 choices = {
     "block": show_block,
@@ -307,28 +545,53 @@ choices = {
 }
 
 @click.command("show")
+@daemon_option()
 @verbose_option
 @db_option
 @click.option("-i", "--init", type=InitParamType(), envvar="ROBOSTAT_INIT")
-@click.option("-f", "--format", default="pretty", type=click.Choice(["pretty", "csv"]))
+@click.option("-f", "--format", default="pretty",
+        type=click.Choice(["pretty", "csv", "tsv", "ndjson"]))
 @click.option("--csv-delimiter", default=",")
 @click.option("--table-format", default="simple")
+@click.option("--batch", type=click.IntRange(min=1),
+        help="Print pretty tables in batches of this many rows")
 @click.option("--hide-shadows", is_flag=True)
+@click.option("--top", "--limit", "limit", type=click.IntRange(min=1))
+@click.option("--after")
+@click.option("--ties", type=click.Choice(TIE_MODES), default="competition",
+        help="How tied teams are numbered in rankings")
+@click.option("-w", "--watch", is_flag=True,
+        help="Keep running and refresh when the database changes")
+@click.option("--interval", type=click.FloatRange(min=0), default=1.0,
+        help="Seconds between change checks in --watch mode")
 @click.argument("what", type=click.Choice(list(choices)))
 @click.argument("param", required=False)
 def show_command(**kwargs):
-    if kwargs["format"] == "pretty":
-        fmt = PrettyFormatter(kwargs["table_format"])
-    else:
+    if kwargs["format"] == "pretty" and kwargs["watch"] and sys.stdout.isatty():
+        fmt = LiveFormatter(kwargs["table_format"])
+    elif kwargs["format"] == "pretty":
+        fmt = PrettyFormatter(kwargs["table_format"], batch=kwargs["batch"])
+    elif kwargs["format"] == "csv":
         fmt = CsvFormatter(kwargs["csv_delimiter"])
+    elif kwargs["format"] == "tsv":
+        fmt = TsvFormatter()
+    else:
+        fmt = NdjsonFormatter()
 
     opt = ShowOpt(
             db=kwargs["db"],
             init=kwargs["init"],
             fmt=fmt,
             param=kwargs["param"],
-            hide_shadows=kwargs["hide_shadows"]
+            hide_shadows=kwargs["hide_shadows"],
+            limit=kwargs["limit"],
+            after=kwargs["after"],
+            ties=kwargs["ties"]
     )
 
     show = choices[kwargs["what"]]
-    show(opt)
+
+    if kwargs["watch"]:
+        watch(show, opt, kwargs["interval"])
+    else:
+        show(opt)
@@ -4,10 +4,11 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import subqueryload
 from pttt.timetable import parse_timetable, create_timetable
 from robostat import db as model
-from robostat.rsx.common import RsxError, verbose_option, db_option
+from robostat.rsx.common import RsxError, verbose_option, db_option, daemon_option
 from robostat.rsx.crud import insert_missing_interactive
 
 @click.command("import")
+@daemon_option(stdin=True)
 @verbose_option
 @db_option
 @click.option("-j", "--num-judges", "j", default=1)
@@ -71,6 +72,7 @@ def import_command(db, strict, y, **kwargs):
     ))
 
 @click.command("export")
+@daemon_option()
 @verbose_option
 @db_option
 @click.option("--ids", is_flag=True)
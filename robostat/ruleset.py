@@ -52,12 +52,17 @@ class _CategoryScore:
             v.validate(getattr(self, k))
 
 # cats_sorted: list(nimi, cat)
-def cat_score(name, cats_sorted, bases=[]):
+# module: moduuli johon luokka tallennetaan nimellä name, jolloin pickle löytää sen
+# (esim. cat_score("Rescue1Score", ..., module=__name__))
+def cat_score(name, cats_sorted, bases=[], module=None):
     class Ret(_CategoryScore, *bases):
         __slots__ = [k for k,v in cats_sorted]
         __cats__ = cats_sorted
 
     Ret.__name__ = name
+    Ret.__qualname__ = name
+    if module is not None:
+        Ret.__module__ = module
     return Ret
 
 class CategoryRuleset(Ruleset):
@@ -3,6 +3,7 @@ import functools
 import collections
 from enum import Enum
 from robostat.util import noneflt
+from robostat.rankings import AggregateRank
 from robostat.ruleset import Ruleset, ValidationError, cat_score, IntCategory, CategoryRuleset
 
 WEIGHTS = {
@@ -217,58 +218,18 @@ class RescueScore:
         # isompi aika on huonompi
         return self.time > other.time
 
-# TODO: nää agregaattijutut vois kerätä johonki erilliseen yläluokkaan (AggregateRank)
-# koska ne pätee esim tanssiin jne melkein kaikkeen muuhun paitsi sumoon
 # TODO: tää nimeäminen ei ehkä oo paras jos tekee esim RescueSumRank
-@functools.total_ordering
-class RescueRank:
-
-    def __init__(self, best, all):
-        self.best = best
-        self.all = all
-
-    def __str__(self):
-        return "%s [%s]" % (
-            str(self.best),
-            ", ".join(map(str, self.other_scores))
-        )
-
-    def __repr__(self):
-        return str(self)
-
-    def __eq__(self, other):
-        if self.best is None:
-            return other.best is None
-        if other.best is None:
-            return self.best is None
-
-        return self.best == other.best
-
-    def __lt__(self, other):
-        if self.best is None:
-            return other.best is not None
-        if other.best is None:
-            return False
+class RescueRank(AggregateRank):
 
-        return self.best < other.best
+    __slots__ = ()
 
-    @property
-    def other_scores(self):
-        if self.best is None:
-            return [None] * (len(self.all)-1)
-
-        return [s for s in self.all if s is not self.best]
-
-    @property
-    def played_scores(self):
-        return [s for s in self.all if s is not None]
-
-    @classmethod
-    def from_scores(cls, scores):
-        best = cls.aggregate(scores)
-        return cls(best, scores)
+    @staticmethod
+    def score_key(score):
+        # isompi aika on huonompi
+        return int(score), -score.time
 
 class RescueMaxRank(RescueRank):
+    __slots__ = ()
     aggregate = noneflt(functools.partial(max, default=None))
 
 def make_cat(c, w):
@@ -283,16 +244,31 @@ CATS = dict((c, make_cat(c, w)) for c,w in WEIGHTS.items())
 def _get_cats(l):
     return [("time", TIME_CAT), *((c, CATS[c]) for c in l)]
 
-Rescue1Score = cat_score("Rescue1Score", _get_cats(R1_VIIVA + R1_UHRI), bases=[RescueScore])
-Rescue2Score = cat_score("Rescue2Score", _get_cats(R2_VIIVA + R2_UHRI), bases=[RescueScore])
-Rescue3Score = cat_score("Rescue3Score", _get_cats(R3_VIIVA + R3_UHRI), bases=[RescueScore])
+Rescue1Score = cat_score("Rescue1Score", _get_cats(R1_VIIVA + R1_UHRI), bases=[RescueScore],
+        module=__name__)
+Rescue2Score = cat_score("Rescue2Score", _get_cats(R2_VIIVA + R2_UHRI), bases=[RescueScore],
+        module=__name__)
+Rescue3Score = cat_score("Rescue3Score", _get_cats(R3_VIIVA + R3_UHRI), bases=[RescueScore],
+        module=__name__)
+
+# toistettavien esteiden määrä tallennetaan tavuna
+MAX_REPEAT = 0xff
 
 class RescueRuleset(CategoryRuleset):
 
-    def __init__(self, score_type, difficulty, max_time=None):
+    # max_repeat: toistettavien esteiden enimmäismäärä radalla, käytetään vain
+    # pisterajojen laskemiseen (robostat.clinch)
+    def __init__(self, score_type, difficulty, max_time=None, max_repeat=None):
         super().__init__(score_type)
         self.difficulty = difficulty
         self.max_time = max_time
+        self.max_repeat = max_repeat
+
+    @property
+    def max_score(self):
+        repeat = MAX_REPEAT if self.max_repeat is None else self.max_repeat
+        return sum(c.max * (repeat if isinstance(c, RescueMultiObstacleCategory) else 1)
+                for _,c in self.score_type.__cats__ if isinstance(c, RescueCategory))
 
     def validate(self, score):
         super().validate(score)
@@ -300,6 +276,7 @@ class RescueRuleset(CategoryRuleset):
             raise ValidationError("Time exceeds max time (%d > %d)" % (score.time, self.max_time))
 
     @classmethod
-    def by_difficulty(cls, difficulty, max_time=None):
+    def by_difficulty(cls, difficulty, max_time=None, max_repeat=None):
         score = [Rescue1Score, Rescue2Score, Rescue3Score][difficulty-1]
-        return cls(score_type=score, difficulty=difficulty, max_time=max_time)
+        return cls(score_type=score, difficulty=difficulty, max_time=max_time,
+                max_repeat=max_repeat)
@@ -102,12 +102,14 @@ def _get_cats(src):
 
 DanceInterviewScore2019 = cat_score("DanceInterviewScore2019",
         _get_cats(INTERVIEW_SCORING_2019),
-        bases=[DanceInterviewScore]
+        bases=[DanceInterviewScore],
+        module=__name__
 )
 
 DancePerformanceScore2019 = cat_score("DancePerformanceScore2019",
         _get_cats(PERFORMANCE_SCORING_2019),
-        bases=[DancePerformanceScore]
+        bases=[DancePerformanceScore],
+        module=__name__
 )
 
 class DanceRuleset(CategoryRuleset): pass
@@ -110,9 +110,25 @@ class XSumoRank:
 
         return ret
 
+    # Uusi rank, jossa yksi pelaamaton suoritus on pelattu (ks. robostat.replay)
+    def with_score(self, score):
+        ret = self.__class__()
+        ret.score = self.score + int(score)
+        ret.wins = self.wins + (str(score.result) == "W")
+        ret.ties = self.ties + (str(score.result) == "T")
+        ret.losses = self.losses + (str(score.result) == "L")
+        ret.unplayed = self.unplayed - 1
+        return ret
+
 @functools.total_ordering
 class XSumoScoreRank(XSumoRank):
 
+    sort_fields = "score", "wins", "ties"
+
+    @property
+    def sort_key(self):
+        return self.score, self.wins, self.ties
+
     def __eq__(self, other):
         return self.score == other.score and self.wins == other.wins and self.ties == other.ties
 
@@ -126,6 +142,12 @@ class XSumoScoreRank(XSumoRank):
 @functools.total_ordering
 class XSumoWinsRank(XSumoRank):
 
+    sort_fields = "wins", "ties", "score"
+
+    @property
+    def sort_key(self):
+        return self.wins, self.ties, self.score
+
     def __eq__(self, other):
         return self.wins == other.wins and self.ties == other.ties and self.score == other.score
 
@@ -138,6 +160,21 @@ class XSumoWinsRank(XSumoRank):
 
 class XSumoRuleset(Ruleset):
 
+    # Joukkueen suurin mahdollinen pistemäärä yhdestä kierroksesta, None = rajoittamaton.
+    # Käytetään vain pisterajojen laskemiseen (robostat.clinch).
+    max_round_points = None
+
+    # rounds: kierrosten määrä ottelussa jos se on kiinteä
+    def __init__(self, rounds=None):
+        self.rounds = rounds
+
+    # -> joukkueen suurin mahdollinen pistemäärä ottelusta, None = ei tiedossa
+    def max_match_points(self, rounds=None):
+        rounds = self.rounds if self.rounds is not None else rounds
+        if rounds is None or self.max_round_points is None:
+            return None
+        return rounds * self.max_round_points
+
     def create_score(self):
         return XSumoScore()
 
@@ -227,6 +264,9 @@ class XSRoundScore:
 
 class XSRuleset(XSumoRuleset):
 
+    # ensimmäinen + voitto
+    max_round_points = 1 + max(XSRoundScore.SCORING.values())
+
     def _decode_round(self, stream):
         first, res = stream.read(2)
         return XSRoundScore(bool(first), XSumoResult.by_opcode(res))
@@ -276,6 +316,10 @@ def pseudoround_result_valid(res1, res2):
 
     return False
 
+# eräpisteet tallennetaan tavuina
+PSEUDOROUND_MAX = max(r1 for r1, r2 in itertools.product(range(0x100), repeat=2)
+        if pseudoround_result_valid(r1, r2))
+
 class _XSumoPseudoroundScore:
 
     def __init__(self, results):
@@ -331,5 +375,17 @@ class XMRoundScore(_XSumoPseudoroundScore):
 
 class XMRuleset(_XSumoPseudoroundRuleset, XSumoRuleset):
 
+    # pseudorounds: pienten kierrosten enimmäismäärä kierroksessa, ilman sitä pisteillä
+    # ei ole ylärajaa
+    def __init__(self, rounds=None, pseudorounds=None):
+        super().__init__(rounds)
+        self.pseudorounds = pseudorounds
+
+    @property
+    def max_round_points(self):
+        if self.pseudorounds is None:
+            return None
+        return self.pseudorounds * PSEUDOROUND_MAX
+
     def _decode_round(self, stream):
         return XMRoundScore(self._decode_results(stream))
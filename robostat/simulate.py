@@ -0,0 +1,182 @@
+import os
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import robostat.db as model
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("robostat.simulate requires numpy (pip install robostat[fast])") from e
+
+# Monte Carlo -arvio xsumon sarjan lopputuloksesta (vaatii numpyn, robostat[fast]).
+#
+# Pelaamattomien otteluiden pisteet arvotaan kummallekin joukkueelle erikseen sen omista
+# pelatuista otteluista (tai kaikista pelatuista jos joukkue ei ole vielä pelannut), ja
+# tulos määräytyy pisteistä kuten calc_resultsissa. Pelattujen tulokset luetaan scoreista.
+# Lopputilanne järjestetään rank-luokan sort_fieldsien ja tiebreakien mukaan.
+# Tasatilanteessa joukkue saa parhaan sijan (competition ranking), kuten rsx show.
+#
+# Jokainen pisteitä vastaava score-rivi (event, tuomari) on oma ottelunsa, samoin kuin
+# XSumoRank.from_scoresissa.
+
+FIELDS = "score", "wins", "ties"
+
+class BlockState:
+
+    def __init__(self, team_ids, base, history, remaining):
+        self.team_ids = team_ids
+        # [joukkue, (score, wins, ties)]
+        self.base = base
+        # joukkueittain pelattujen otteluiden pisteet
+        self.history = history
+        # [(a, b)] indekseinä team_idsiin
+        self.remaining = remaining
+
+def block_state(db, block):
+    rows = db.query(model.Score.event_id, model.Score.judge_id, model.Score.team_id,
+                model.Score.data)\
+            .join(model.Score.event)\
+            .filter(model.Event.block_id == block.id)\
+            .order_by(model.Score.event_id, model.Score.judge_id, model.Score.team_id)\
+            .all()
+
+    matches = collections.OrderedDict()
+    for event_id, judge_id, team_id, data in rows:
+        matches.setdefault((event_id, judge_id), []).append((team_id, data))
+
+    team_ids = sorted(set(team_id for _,_,team_id,_ in rows))
+    index = dict((t, i) for i,t in enumerate(team_ids))
+    base = np.zeros((len(team_ids), len(FIELDS)), dtype=np.int64)
+    history = [[] for _ in team_ids]
+    remaining = []
+
+    for (event_id, _), teams in matches.items():
+        if len(teams) != 2:
+            raise ValueError("Event %d is not a match between two teams" % event_id)
+
+        (a, da), (b, db_) = teams
+        a, b = index[a], index[b]
+
+        if da is None or db_ is None:
+            remaining.append((a, b))
+            continue
+
+        for i, data in ((a, da), (b, db_)):
+            score = block.ruleset.decode(data)
+            history[i].append(int(score))
+            base[i, 0] += int(score)
+            base[i, 1] += str(score.result) == "W"
+            base[i, 2] += str(score.result) == "T"
+
+    return BlockState(team_ids, base, history, remaining)
+
+class SimulationResult:
+
+    def __init__(self, team_ids, positions, n):
+        self.team_ids = team_ids
+        # positions[i, p]: montako kertaa joukkue i sijoittui sijalle p+1
+        self.positions = positions
+        self.n = n
+
+    # -> {team_id: P(sija <= k)}
+    def top(self, k):
+        counts = self.positions[:, :k].sum(axis=1)
+        return dict(zip(self.team_ids, (counts / self.n).tolist()))
+
+    # -> {team_id: odotettu sija}
+    def expected_position(self):
+        pos = np.arange(1, self.positions.shape[1]+1)
+        return dict(zip(self.team_ids, (self.positions @ pos / self.n).tolist()))
+
+def _samples(history):
+    pooled = [x for h in history for x in h] or [0]
+    hs = [h or pooled for h in history]
+    # float, jotta matriisitulot menevät BLASille
+    values = np.zeros((len(hs), max(map(len, hs))))
+    for i, h in enumerate(hs):
+        values[i, :len(h)] = h
+    return values, np.array([len(h) for h in hs])
+
+# Yhdistää järjestyskentät ja tiebreakin yhdeksi kokonaisluvuksi, isompi on parempi
+def _combine_keys(fields, tiebreak):
+    cols = [fields[..., i] for i in range(fields.shape[-1])]
+    cols.append(np.broadcast_to(tiebreak, fields.shape[:-1]))
+    ret = np.zeros(fields.shape[:-1], dtype=np.int64)
+    size = 1
+
+    for c in cols:
+        lo, hi = int(c.min()), int(c.max())
+        size *= hi-lo+1
+        if size >= 2**63:
+            raise OverflowError("Rank keys don't fit in 64 bits")
+        ret = ret * (hi-lo+1) + (c-lo)
+
+    return ret
+
+# -> positions[i, p], ks. SimulationResult
+def _positions(keys):
+    n, n_teams = keys.shape
+    # sija = 1 + paremmat joukkueet
+    better = (keys[:, None, :] > keys[:, :, None]).sum(axis=2)
+    idx = np.arange(n_teams) * n_teams + better
+    return np.bincount(idx.ravel(), minlength=n_teams*n_teams).reshape(n_teams, n_teams)
+
+def _simulate_chunk(args):
+    base, values, lengths, a, b, order, tiebreak, n, seed = args
+    rng = np.random.default_rng(seed)
+    n_teams = len(base)
+
+    # ottelu x joukkue -matriisit, joilla tulokset kasataan joukkueille matriisitulona
+    ia = np.zeros((len(a), n_teams))
+    ia[np.arange(len(a)), a] = 1
+    ib = np.zeros((len(b), n_teams))
+    ib[np.arange(len(b)), b] = 1
+
+    pa = values[a, (rng.random((n, len(a))) * lengths[a]).astype(np.int64)]
+    pb = values[b, (rng.random((n, len(b))) * lengths[b]).astype(np.int64)]
+    win, loss, tie = (pa > pb).astype(float), (pa < pb).astype(float), (pa == pb).astype(float)
+
+    fields = np.empty((n, n_teams, len(FIELDS)), dtype=np.int64)
+    fields[..., 0] = base[:, 0] + (pa @ ia + pb @ ib)
+    fields[..., 1] = base[:, 1] + (win @ ia + loss @ ib)
+    fields[..., 2] = base[:, 2] + (tie @ ia + tie @ ib)
+
+    return _positions(_combine_keys(fields[..., order], tiebreak))
+
+# rank: XSumoScoreRank tai XSumoWinsRank (sort_fields), tiebreaks: {team_id: weight}.
+# workers=1 ajaa samassa prosessissa.
+def simulate(state, rank, n=10000, tiebreaks=None, workers=None, seed=None, chunk_size=2000):
+    if n < 1:
+        raise ValueError("Number of simulations must be positive: %d" % n)
+
+    tiebreaks = tiebreaks or {}
+    order = [FIELDS.index(f) for f in rank.sort_fields]
+    tiebreak = np.array([tiebreaks.get(t, 0) for t in state.team_ids], dtype=np.int64)
+    n_teams = len(state.team_ids)
+
+    if n_teams == 0:
+        return SimulationResult([], np.zeros((0, 0), dtype=np.int64), n)
+
+    if not state.remaining:
+        # tulos on jo selvä
+        positions = _positions(_combine_keys(state.base[None, :, order], tiebreak))
+        return SimulationResult(state.team_ids, positions * n, n)
+
+    values, lengths = _samples(state.history)
+    a = np.array([x for x,_ in state.remaining])
+    b = np.array([x for _,x in state.remaining])
+
+    sizes = [chunk_size] * (n // chunk_size) + ([n % chunk_size] if n % chunk_size else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    chunks = [(state.base, values, lengths, a, b, order, tiebreak, size, s)
+            for size, s in zip(sizes, seeds)]
+
+    if workers == 1:
+        results = map(_simulate_chunk, chunks)
+        return SimulationResult(state.team_ids, sum(results), n)
+
+    with ProcessPoolExecutor(
+            max_workers=workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context("fork")) as pool:
+        return SimulationResult(state.team_ids, sum(pool.map(_simulate_chunk, chunks)), n)
@@ -0,0 +1,158 @@
+import bisect
+import datetime
+import threading
+import sqlalchemy as sa
+import robostat.db as model
+from robostat.tournament import change_token
+
+# Areenojen aikataulu muistissa "nyt pelissä / seuraavaksi" -näyttöjä varten.
+# Jokaiselle areenalle järjestetty lista ts_schedeistä, joten kyselyt ovat bisectejä.
+# Rakennetaan yhdellä kyselyllä ja päivitetään vain kun change_token muuttuu, joten
+# refresh() on halpa kutsua ennen jokaista kyselyä.
+#
+# Päivät lasketaan annetulla aikavyöhykkeellä (tzinfo, esim. zoneinfo.ZoneInfo),
+# None = koneen paikallinen aika. Event.day_sched on aina UTC.
+
+class TimelineEvent:
+
+    __slots__ = "id", "block_id", "arena", "ts_sched", "teams"
+
+    def __init__(self, id, block_id, arena, ts_sched, teams):
+        self.id = id
+        self.block_id = block_id
+        self.arena = arena
+        self.ts_sched = ts_sched
+        # [(team_id, name)]
+        self.teams = teams
+
+    def __repr__(self):
+        return "<%s %s@%d %s>" % (self.block_id, self.arena, self.ts_sched,
+                ", ".join(name for _,name in self.teams))
+
+class ArenaTimeline:
+
+    def __init__(self, arena, events):
+        self.arena = arena
+        self.events = events
+        self.ts = [e.ts_sched for e in events]
+
+    # viimeisin alkanut, ts_sched <= ts
+    def at(self, ts):
+        i = bisect.bisect_right(self.ts, ts)
+        return self.events[i-1] if i else None
+
+    def after(self, ts, n=1):
+        i = bisect.bisect_right(self.ts, ts)
+        return self.events[i:i+n]
+
+    def before(self, ts, n=1):
+        i = bisect.bisect_left(self.ts, ts)
+        return self.events[max(i-n, 0):i]
+
+    # start <= ts_sched < end
+    def window(self, start, end):
+        return self.events[bisect.bisect_left(self.ts, start):bisect.bisect_left(self.ts, end)]
+
+class Timeline:
+
+    # duration: suorituksen pituus sekunteina, jolloin current() palauttaa Nonen
+    # suorituksen jälkeen. Ilman sitä suoritus kestää seuraavan alkuun (tai päivän loppuun).
+    def __init__(self, engine, tz=None, duration=None):
+        self.engine = engine
+        self.tz = tz
+        self.duration = duration
+        self.arenas = {}
+        self.token = None
+        self._lock = threading.Lock()
+        # sqliten data_version on yhteyskohtainen, joten sama yhteys pidetään auki
+        self._conn = None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def refresh(self, force=False):
+        with self._lock:
+            if self._conn is None:
+                self._conn = self.engine.connect()
+
+            token = change_token(self._conn)
+            if not force and token == self.token:
+                return False
+
+            self.arenas = self._build(self._conn)
+            self.token = token
+            return True
+
+    def _build(self, conn):
+        et = model.EventTeam.__table__
+        e = model.Event.__table__
+        t = model.Team.__table__
+
+        rows = conn.execute(
+                sa.select([e.c.id, e.c.block_id, e.c.arena, e.c.ts_sched, t.c.id, t.c.name])
+                .select_from(e
+                    .outerjoin(et, et.c.event_id == e.c.id)
+                    .outerjoin(t, t.c.id == et.c.team_id))
+                .order_by(e.c.arena, e.c.ts_sched, e.c.id, t.c.id)
+        )
+
+        events = {}
+        for id, block_id, arena, ts_sched, team_id, name in rows:
+            ev = events.get(id)
+            if ev is None:
+                ev = events[id] = TimelineEvent(id, block_id, arena, ts_sched, [])
+            if team_id is not None:
+                ev.teams.append((team_id, name))
+
+        ret = {}
+        # dict säilyttää kyselyn järjestyksen
+        for ev in events.values():
+            ret.setdefault(ev.arena, []).append(ev)
+
+        return dict((arena, ArenaTimeline(arena, evs)) for arena, evs in ret.items())
+
+    def day(self, ts):
+        return datetime.datetime.fromtimestamp(ts, self.tz).date()
+
+    # -> (alku, loppu) timestampeina
+    def day_bounds(self, day):
+        start = datetime.datetime.combine(day, datetime.time(), tzinfo=self.tz)
+        end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(),
+                tzinfo=self.tz)
+        return int(start.timestamp()), int(end.timestamp())
+
+    def _arena(self, arena):
+        ret = self.arenas.get(arena)
+        if ret is None:
+            return ArenaTimeline(arena, [])
+        return ret
+
+    def current(self, arena, now):
+        ev = self._arena(arena).at(now)
+
+        if ev is None or self.day(ev.ts_sched) != self.day(now):
+            return None
+        if self.duration is not None and now >= ev.ts_sched + self.duration:
+            return None
+
+        return ev
+
+    def next(self, arena, now, n=1):
+        return self._arena(arena).after(now, n)
+
+    # ennen nykyistä, tai ennen hetkeä now jos mikään ei ole käynnissä
+    def previous(self, arena, now, n=1):
+        cur = self.current(arena, now)
+        return self._arena(arena).before(now if cur is None else cur.ts_sched, n)
+
+    def window(self, arena, start, end):
+        return self._arena(arena).window(start, end)
+
+    # areenan koko päivän ohjelma, day on date tai timestamp
+    def schedule(self, arena, day):
+        if not isinstance(day, datetime.date):
+            day = self.day(day)
+        return self.window(arena, *self.day_bounds(day))
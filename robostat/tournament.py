@@ -1,9 +1,22 @@
+import time
+import asyncio
+import contextlib
+import contextvars
 import functools
 import collections
-from sqlalchemy.orm import joinedload
+import heapq
+import inspect
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import sqlalchemy as sa
+from sqlalchemy.engine import Engine
+from sqlalchemy.event import listen, remove
+from sqlalchemy.orm import joinedload, contains_eager, sessionmaker
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm.query import Query
 import robostat.db as model
-from robostat.util import udict
+from robostat.util import udict, rank_positions
 from robostat.ruleset import decode_scores
 
 _shadow_subquery = ~Query(model.EventTeam)\
@@ -12,6 +25,165 @@ _shadow_subquery = ~Query(model.EventTeam)\
         .filter(model.Team.is_shadow)\
         .exists()
 
+#####
+# Instrumentointi.
+# Rankingit, lohkojen dekoodaus jne. ajetaan nimettyjen jaksojen (span) sisällä, ja
+# rekisteröidyt kuuntelijat saavat tiedon jaksoista ja jokaisesta SQL-kyselystä.
+# Jakson polku on tuple sisäkkäisistä nimistä, esim. ("ranking:xsumo", "block:xsumo", "decode").
+# Ilman kuuntelijoita jakso on pelkkä tyhjä context manager.
+#
+# Kuuntelijalla on metodit
+#     span_start(path)
+#     span_end(path, elapsed, items)
+#     query(path, statement, parameters, elapsed)
+# Kuuntelijat ovat prosessin yhteisiä, polku on kontekstikohtainen.
+
+_listeners = ()
+_span_path = contextvars.ContextVar("span_path", default=())
+
+class _SpanCounter:
+    __slots__ = "items",
+
+class _NoSpan:
+
+    # ilman kuuntelijoita laskurin arvoilla ei ole väliä
+    counter = _SpanCounter()
+
+    def __enter__(self):
+        return self.counter
+
+    def __exit__(self, *exc):
+        return False
+
+_NOSPAN = _NoSpan()
+
+class _Span:
+
+    def __init__(self, name):
+        self.name = name
+        self.counter = _SpanCounter()
+        self.counter.items = 0
+
+    def __enter__(self):
+        self.path = _span_path.get() + (self.name,)
+        self.token = _span_path.set(self.path)
+        for l in _listeners:
+            l.span_start(self.path)
+        self.start = time.perf_counter()
+        return self.counter
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        _span_path.reset(self.token)
+        for l in _listeners:
+            l.span_end(self.path, elapsed, self.counter.items)
+        return False
+
+def span_path():
+    return _span_path.get()
+
+# with span("decode") as c: ...; c.items += n
+def span(name):
+    if not _listeners:
+        return _NOSPAN
+    return _Span(name)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("robostat.query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("robostat.query_start")
+    if not starts:
+        # kuuntelija lisättiin kesken kyselyn
+        return
+
+    elapsed = time.perf_counter() - starts.pop()
+    path = _span_path.get()
+    for l in _listeners:
+        l.query(path, statement, parameters, elapsed)
+
+def add_listener(listener):
+    global _listeners
+
+    if not _listeners:
+        listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+    _listeners += (listener,)
+
+def remove_listener(listener):
+    global _listeners
+
+    _listeners = tuple(l for l in _listeners if l is not listener)
+
+    if not _listeners:
+        remove(Engine, "before_cursor_execute", _before_cursor_execute)
+        remove(Engine, "after_cursor_execute", _after_cursor_execute)
+
+class ProfileStats:
+
+    __slots__ = "calls", "time", "queries", "sql_time", "items"
+
+    def __init__(self):
+        self.calls = 0
+        self.time = 0
+        self.queries = 0
+        self.sql_time = 0
+        self.items = 0
+
+# Kerää jaksoittaiset ajat ja kyselymäärät. Kyselyt lasketaan jokaiselle
+# jaksolle polussa, eli rankingin luvuissa on mukana sen lohkojen kyselyt.
+# Jaksojen ulkopuoliset kyselyt menevät polulle ().
+class Profile:
+
+    def __init__(self):
+        self.stats = collections.OrderedDict()
+        self.stats[()] = ProfileStats()
+
+    def _get(self, path):
+        ret = self.stats.get(path)
+        if ret is None:
+            ret = self.stats[path] = ProfileStats()
+        return ret
+
+    def span_start(self, path):
+        self._get(path)
+
+    def span_end(self, path, elapsed, items):
+        st = self._get(path)
+        st.calls += 1
+        st.time += elapsed
+        st.items += items
+
+    def query(self, path, statement, parameters, elapsed):
+        for i in range(len(path)+1):
+            st = self._get(path[:i])
+            st.queries += 1
+            st.sql_time += elapsed
+
+    # -> [(syvyys, nimi, stats)], lapset vanhempiensa jälkeen aloitusjärjestyksessä
+    def tree(self):
+        children = collections.defaultdict(list)
+        for path in self.stats:
+            if path:
+                children[path[:-1]].append(path)
+
+        def walk(path, depth):
+            for c in children[path]:
+                yield depth, c[-1], self.stats[c]
+                yield from walk(c, depth+1)
+
+        return list(walk((), 0))
+
+@contextlib.contextmanager
+def profile():
+    ret = Profile()
+    add_listener(ret)
+    try:
+        yield ret
+    finally:
+        remove_listener(ret)
+
 class Tournament:
 
     def __init__(self):
@@ -32,6 +204,103 @@ class Tournament:
     def add_ranking(self, ranking):
         self.rankings[ranking.id] = ranking
 
+    # Kaikki joukkueen suoritukset kaikista lohkoista kolmella kyselyllä:
+    # eventit joukkueineen, tuomaroinnit tuomareineen ja eventtien kaikki scoret.
+    # Eventtien judgings ja scores täytetään valmiiksi (ei lazy loadeja), ja jokaisella
+    # scorella on decoded_score (None jos pisteitä ei ole tai lohkoa ei tunneta).
+    # -> {block_id: [event]} lohkojen ensimmäisen eventin mukaan järjestettynä
+    def team_history(self, db, team_id):
+        with span("team:%d" % team_id):
+            team_events = db.query(model.EventTeam.event_id)\
+                    .filter(model.EventTeam.team_id == team_id)\
+                    .subquery()
+
+            events = db.query(model.Event)\
+                    .filter(model.Event.id.in_(team_events))\
+                    .options(joinedload(model.Event.teams_part)
+                            .joinedload(model.EventTeam.team, innerjoin=True))\
+                    .order_by(*EVENT_KEY)\
+                    .all()
+
+            judgings = db.query(model.EventJudging)\
+                    .filter(model.EventJudging.event_id.in_(team_events))\
+                    .options(joinedload(model.EventJudging.judge, innerjoin=True))\
+                    .all()
+
+            scores = db.query(model.Score)\
+                    .filter(model.Score.event_id.in_(team_events))\
+                    .options(joinedload(model.Score.team, innerjoin=True))\
+                    .order_by(*SCORE_KEY)\
+                    .all()
+
+            with span("decode") as c:
+                c.items = len(scores)
+                return _group_history(self.blocks, events, judgings, scores)
+
+    # Laskee rankingit rinnakkain prosessipoolissa.
+    # Workerit forkataan tästä prosessista, joten init-tiedostoa ei tarvitse ajaa uudestaan,
+    # mutta jokainen worker avaa oman (read-only) yhteyden.
+    # Palauttaa {ranking_id: [(team, RankPosition)]}
+    def evaluate_rankings(self, db_url, ids=None, workers=None, ties="competition"):
+        if ids is None:
+            ids = list(self.rankings)
+
+        with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=_init_worker,
+                initargs=(self, db_url)) as pool:
+            results = dict(pool.map(functools.partial(_evaluate_ranking, ties=ties), ids))
+
+        team_ids = set(tid for ranks in results.values() for tid,_,_ in ranks)
+        engine = _readonly_engine(db_url)
+        db = sessionmaker(bind=engine)()
+        try:
+            teams = dict((t.id, t) for t in db.query(model.Team)\
+                    .filter(model.Team.id.in_(team_ids)))
+        finally:
+            db.close()
+            # poolin yhteys jäisi muuten auki (ja seuraavien forkkien perittäväksi)
+            engine.dispose()
+
+        return dict(
+            (id, [(teams[tid], RankPosition(pos, text)) for tid, pos, text in ranks])
+            for id, ranks in results.items()
+        )
+
+def _set_query_only(connection, record):
+    with contextlib.closing(connection.cursor()) as cursor:
+        cursor.execute("PRAGMA query_only=ON;")
+
+def _readonly_engine(db_url):
+    engine = sa.create_engine(db_url)
+
+    if engine.dialect.name == "sqlite":
+        listen(engine, "connect", _set_query_only)
+
+    return engine
+
+# workerin tila (tournament, sessionmaker)
+_worker = None
+
+def _init_worker(tournament, db_url):
+    global _worker
+    _worker = tournament, sessionmaker(bind=_readonly_engine(db_url))
+
+def _evaluate_ranking(id, ties="competition"):
+    tournament, Session = _worker
+    db = Session()
+
+    try:
+        ranks = tournament.rankings[id](db)
+    finally:
+        db.close()
+
+    # rank-oliot ei välttämättä ole picklattavia (esim. cat_score-luokat),
+    # joten palautetaan vain joukkueiden id:t, sijoitukset ja tekstiesitys
+    return id, [(team.id, pos, str(rank))
+            for pos, (team, rank) in enumerate_ranking(ranks, ties)]
+
 class Block:
 
     def __init__(self, tournament, id, ruleset, *, name=None):
@@ -39,16 +308,20 @@ class Block:
         self.id = id
         self.ruleset = ruleset
         self.name = name or id
+        self._standings = None
 
-    def events_query(self, db, hide_shadows=False):
+    def events_query(self, db, hide_shadows=False, after=None):
         query = db.query(model.Event).filter_by(block_id=self.id)
 
         if hide_shadows:
             query = hide_query_shadows(query)
 
+        if after is not None:
+            query = keyset(query, EVENT_KEY, after)
+
         return query
 
-    def scores_query(self, db, hide_shadows=False):
+    def scores_query(self, db, hide_shadows=False, after=None):
         query = db.query(model.Score)\
                 .join(model.Score.event)\
                 .filter(model.Event.block_id == self.id)
@@ -60,19 +333,44 @@ class Block:
             # joinata teameihin kun team.is_shadow=0.
             query = hide_query_shadows(query)
 
+        if after is not None:
+            query = keyset(query, SCORE_KEY, after)
+
         return query
 
-    def decode_scores(self, db, hide_shadows=False):
-        scores = self.scores_query(db, hide_shadows=hide_shadows)\
+    def fetch_scores(self, db, hide_shadows=False):
+        return self.scores_query(db, hide_shadows=hide_shadows)\
                 .options(joinedload(model.Score.team, innerjoin=True))\
                 .all()
 
-        return list(decode_scores(self.ruleset, scores))
+    def decode_scores(self, db, hide_shadows=False):
+        with span("block:%s" % self.id):
+            scores = self.fetch_scores(db, hide_shadows=hide_shadows)
+            with span("decode") as c:
+                c.items = len(scores)
+                return list(decode_scores(self.ruleset, scores))
+
+    # Varmat sijoitukset top-n:ään, ks. robostat.clinch.
+    # -> {team_id: CLINCHED/ELIMINATED/OPEN}
+    def clinch_status(self, db, n, rank=None):
+        if self._standings is None:
+            # clinch tuo tämän moduulin
+            from robostat.clinch import Standings
+            self._standings = Standings(self)
+        return self._standings.status(db, n, rank)
+
+    async def fetch_scores_async(self, db, hide_shadows=False):
+        return await run_sync(db, self.fetch_scores, hide_shadows)
+
+    async def decode_scores_async(self, db, hide_shadows=False, executor=None):
+        scores = await self.fetch_scores_async(db, hide_shadows=hide_shadows)
+        return await asyncio.get_running_loop().run_in_executor(executor,
+                lambda: list(decode_scores(self.ruleset, scores)))
 
 def hide_query_shadows(query):
     return query.filter(_shadow_subquery)
 
-def scores_query(db, *blocks, hide_shadows=False):
+def scores_query(db, *blocks, hide_shadows=False, after=None):
     query = db.query(model.Score)\
             .join(model.Score.event)\
             .filter(model.Event.block_id.in_([
@@ -82,58 +380,382 @@ def scores_query(db, *blocks, hide_shadows=False):
     if hide_shadows:
         query = hide_query_shadows(query)
 
+    if after is not None:
+        query = keyset(query, SCORE_KEY, after)
+
     return query
 
-def decode_block_scores(db, *blocks, hide_shadows=False):
-    bs = dict((b.id, b) for b in blocks)
+# Tuomarin tuomaroimattomat suoritukset aikataulujärjestyksessä, joukkueet ladattuna.
+# Hakee event_judging(judge_id, ts) -indeksillä vain tuomarin avoimet rivit, joten
+# kysely ei hidastu kisan edetessä.
+# -> (myöhässä olevat, tulevat), limit koskee molempia yhteensä
+def judge_queue(db, judge_id, now=None, limit=None):
+    if now is None:
+        now = int(time.time())
+
+    query = db.query(model.EventJudging)\
+            .join(model.EventJudging.event)\
+            .filter(model.EventJudging.judge_id == judge_id)\
+            .filter(model.EventJudging.is_future)\
+            .options(contains_eager(model.EventJudging.event)
+                    .selectinload(model.Event.teams_part)
+                    .joinedload(model.EventTeam.team, innerjoin=True))\
+            .order_by(*EVENT_KEY)
+
+    if limit is not None:
+        query = query.limit(limit)
+
+    ret = query.all()
+    split = next((i for i,j in enumerate(ret) if j.event.ts_sched >= now), len(ret))
+    return ret[:split], ret[split:]
+
+# Sivutus avaimen mukaan (keyset pagination).
+# Kursori on edellisen sivun viimeisen rivin avain, () = ensimmäinen sivu.
+# ts_sched ei yksinään ole uniikki lohkon sisällä joten eventeissä mukana on myös id.
+EVENT_KEY = (model.Event.ts_sched, model.Event.id)
+SCORE_KEY = (model.Score.event_id, model.Score.team_id, model.Score.judge_id)
+
+def _keyset_after(key, after):
+    # (k1, k2, ...) > (a1, a2, ...) auki kirjoitettuna, koska vanhat sqlitet ei tue row valueita
+    (col, *cols), (val, *vals) = key, after
+
+    if not cols:
+        return col > val
+
+    return sa.or_(col > val, sa.and_(col == val, _keyset_after(cols, vals)))
+
+def keyset(query, key, after=()):
+    query = query.order_by(*key)
+
+    if after:
+        if len(after) != len(key):
+            raise ValueError("Cursor %s doesn't match key of length %d" % (after, len(key)))
+        query = query.filter(_keyset_after(key, after))
 
-    # Tää vois olla myös selectinload tjsp
-    scores = scores_query(db, *blocks, hide_shadows=hide_shadows)\
+    return query
+
+def keyset_cursor(obj, key):
+    return tuple(getattr(obj, col.key) for col in key)
+
+def fetch_page(query, key, limit):
+    rows = query.limit(limit).all()
+    cursor = keyset_cursor(rows[-1], key) if rows and len(rows) == limit else None
+    return rows, cursor
+
+# Käy läpi koko kyselyn sivu kerrallaan
+def iter_keyset(query, key, after=(), page_size=1000):
+    while after is not None:
+        rows, after = fetch_page(keyset(query, key, after), key, page_size)
+        yield from rows
+
+# Halpa muutosindikaattori: arvo vaihtuu kun tietokantaan on kirjoitettu.
+# sqlitellä data_version muuttuu kun joku *toinen* yhteys committaa, joten conn:lla ei
+# saa itse kirjoittaa ja sen pitää pysyä auki pollausten välillä.
+# Muilla kannoilla katsotaan tuomarointien aikaleimoja ja aikataulua (eventtien määrä ja
+# ts_schedien max ja summa, jolloin myös yksittäisen eventin siirto huomataan).
+def change_token(conn):
+    if conn.dialect.name == "sqlite":
+        return conn.execute(sa.text("PRAGMA data_version")).scalar()
+
+    judgings = conn.execute(sa.select([
+        sa.func.max(model.EventJudging.ts),
+        sa.func.count(model.EventJudging.ts)
+    ])).first()
+
+    events = conn.execute(sa.select([
+        sa.func.count(model.Event.id),
+        sa.func.max(model.Event.ts_sched),
+        sa.func.sum(model.Event.ts_sched)
+    ])).first()
+
+    return (*judgings, *events)
+
+# Lohkojen scoret tuomarointeineen, esim. (Score.data, EventJudging.ts)
+def judged_scores_query(db, blocks, *entities):
+    return db.query(*entities)\
+            .select_from(model.Score)\
+            .join(model.Score.event)\
+            .join(model.EventJudging, sa.and_(
+                model.EventJudging.event_id == model.Score.event_id,
+                model.EventJudging.judge_id == model.Score.judge_id))\
+            .filter(model.Event.block_id.in_([
+                (b.id if isinstance(b, Block) else b) for b in blocks
+            ]))
+
+# Lohkojen välimuistien avain, muuttuu kun scoreja lisätään, poistetaan tai tuomaroidaan:
+# (scoreja, pisteitä, viimeisin tuomarointi, tuomaroituja, pisteiden tavuja yhteensä).
+# Sisältöä ei tiivistetä, joten jo tuomaroidun scoren muokkaus näkyy vain jos sen pituus
+# muuttuu tai tuomaroinnin ts päivitetään. Pisteitä muokatessa ts pitää siis aina päivittää.
+def scores_fingerprint(db, *blocks):
+    return tuple(judged_scores_query(db, blocks,
+        sa.func.count(),
+        sa.func.count(model.Score.data),
+        sa.func.max(model.EventJudging.ts),
+        sa.func.count(model.EventJudging.ts),
+        sa.func.coalesce(sa.func.sum(sa.func.length(model.Score.data)), 0)
+    ).one())
+
+# -> [(score, block_id)]
+def fetch_block_scores(db, *blocks, hide_shadows=False):
+    # block_id tulee suoraan joinista, ettei jokaisen scoren eventtiä ladata erikseen
+    return scores_query(db, *blocks, hide_shadows=hide_shadows)\
+            .add_columns(model.Event.block_id)\
             .options(joinedload(model.Score.team, innerjoin=True))\
             .all()
 
-    return [((s.team, bs[s.event.block_id].ruleset.decode(s.data) if s.has_score else None))\
-            for s in scores]
+def _decode_block_scores(blocks, scores):
+    bs = dict((b.id, b) for b in blocks)
+    return [((s.team, bs[block_id].ruleset.decode(s.data) if s.has_score else None))\
+            for s, block_id in scores]
+
+def decode_block_scores(db, *blocks, hide_shadows=False):
+    with span("block:%s" % ",".join(b.id for b in blocks)):
+        scores = fetch_block_scores(db, *blocks, hide_shadows=hide_shadows)
+        with span("decode") as c:
+            c.items = len(scores)
+            return _decode_block_scores(blocks, scores)
+
+# asyncio-versiot.
+# db voi olla AsyncSession (sqlalchemy>=1.4, esim. aiosqlite), jolloin kyselyt ajetaan
+# sen run_sync:llä, tai tavallinen Session, jolloin kyselyt ajetaan executorissa.
+# Tavallista Sessionia ei saa käyttää samaan aikaan useammasta tehtävästä, ja sqlitellä
+# engine pitää luoda connect_args={"check_same_thread": False}.
+
+async def run_sync(db, f, *args, executor=None, **kwargs):
+    if hasattr(db, "run_sync"):
+        return await db.run_sync(f, *args, **kwargs)
+
+    return await asyncio.get_running_loop().run_in_executor(executor,
+            functools.partial(f, db, *args, **kwargs))
+
+# AsyncSessionin käyttö executorin säikeestä: kyselyt kootaan säikeessä ja vasta tuloksen
+# haku (all, one, ...) ajetaan event loopissa run_sync:llä. Dekoodaus, aggregointi ja
+# järjestys jäävät säikeeseen. Kelpaa funktioille jotka käyttävät kantaa vain db.query():llä
+# ja lataavat tarvitsemansa suhteet kyselyssä (lazy load säikeessä ei toimi).
+# Tuetut Queryn metodit on lueteltu, muut nostavat AttributeErrorin.
+_QUERY_BUILDERS = frozenset(("filter", "filter_by", "join", "outerjoin", "options",
+    "order_by", "group_by", "having", "add_columns", "with_entities", "select_from",
+    "distinct", "limit", "offset"))
+_QUERY_RESULTS = frozenset(("all", "one", "one_or_none", "first", "scalar", "count"))
+
+class _AsyncQuery:
+
+    def __init__(self, bridge, calls):
+        self._bridge = bridge
+        self._calls = calls
+
+    def __getattr__(self, name):
+        if name in _QUERY_RESULTS:
+            return lambda *args, **kwargs: self._bridge.fetch(self._calls, name, args, kwargs)
+        if name in _QUERY_BUILDERS:
+            return lambda *args, **kwargs: _AsyncQuery(self._bridge,
+                    self._calls + ((name, args, kwargs),))
+        raise AttributeError("Query.%s is not supported with AsyncSession" % name)
+
+    def __iter__(self):
+        return iter(self.all())
+
+class _AsyncBridge:
+
+    def __init__(self, db, loop):
+        self.db = db
+        self.loop = loop
+
+    def query(self, *entities):
+        return _AsyncQuery(self, (("query", entities, {}),))
+
+    @staticmethod
+    def _fetch(session, calls, name, args, kwargs):
+        query = session
+        for n, a, kw in calls:
+            query = getattr(query, n)(*a, **kw)
+        return getattr(query, name)(*args, **kwargs)
+
+    def fetch(self, calls, name, args, kwargs):
+        return asyncio.run_coroutine_threadsafe(
+                self.db.run_sync(self._fetch, calls, name, args, kwargs), self.loop).result()
+
+async def fetch_scores_async(db, *blocks, hide_shadows=False, after=None):
+    return await run_sync(db, lambda db: scores_query(db, *blocks,
+        hide_shadows=hide_shadows, after=after).all())
+
+async def decode_block_scores_async(db, *blocks, hide_shadows=False, executor=None):
+    scores = await run_sync(db, fetch_block_scores, *blocks, hide_shadows=hide_shadows)
+    return await asyncio.get_running_loop().run_in_executor(executor,
+            _decode_block_scores, blocks, scores)
 
 class Ranking:
 
-    def __init__(self, tournament, id, f, *, name=None):
+    # replay: robostat.replay.Replay, jos rankingin voi laskea myös menneelle hetkelle.
+    # Jos f ottaa limit-parametrin, top-N lasketaan suoraan (ks. sort_ranking).
+    def __init__(self, tournament, id, f, *, name=None, replay=None):
         self.tournament = tournament
         self.id = id
         self.f = f
         self.name = name or id
+        self.replay = replay
+        self.top_k = "limit" in inspect.signature(f).parameters
 
-    def __call__(self, db):
-        return self.f(db)
+    # after: edellisen sivun viimeisen rivin kursori, ks. ranking_cursor.
+    # Kursori ja offset ovat vaihtoehtoisia tapoja ohittaa alku.
+    def __call__(self, db, limit=None, offset=0, after=None):
+        if after is not None and offset:
+            raise ValueError("Ranking cursor can't be combined with offset")
+
+        with span("ranking:%s" % self.id):
+            if limit is not None and after is None and self.top_k:
+                ret = self.f(db, limit=offset+limit)
+            else:
+                ret = self.f(db)
+
+        if after is not None:
+            ret = ranking_after(ret, after)
+
+        if limit is not None or offset:
+            ret = ret[offset:(None if limit is None else offset+limit)]
+
+        return ret
+
+    # Ranking lasketaan executorissa. AsyncSessionilla vain kyselyt ajetaan event loopissa,
+    # ks. _AsyncBridge.
+    async def evaluate_async(self, db, executor=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        if hasattr(db, "run_sync"):
+            db = _AsyncBridge(db, loop)
+        return await loop.run_in_executor(executor, functools.partial(self, db, **kwargs))
+
+    def _replay(self):
+        if self.replay is None:
+            raise ValueError("Ranking '%s' has no replay" % self.id)
+        return self.replay
+
+    # ranking hetkellä ts, [(team, rank)]
+    def as_of(self, db, ts):
+        with span("ranking:%s" % self.id):
+            return self._replay().as_of(db, ts)
+
+    # ks. Replay.changes
+    def changes(self, db):
+        with span("ranking:%s" % self.id):
+            return self._replay().changes(db)
 
     def __getattr__(self, name):
         return getattr(self.f, name)
 
 def aggregate_scores(scores, aggregate):
-    grouped = collections.defaultdict(list)
+    with span("aggregate") as c:
+        grouped = collections.defaultdict(list)
 
-    for team, score in scores:
-        grouped[team].append(score)
+        for team, score in scores:
+            grouped[team].append(score)
 
-    ret = {}
+        ret = {}
 
-    for team, ss in grouped.items():
-        ret[team] = aggregate(ss)
+        for team, ss in grouped.items():
+            ret[team] = aggregate(ss)
 
-    return ret
+        c.items = len(ret)
+        return ret
 
-def sort_ranking(groups):
-    return sorted(groups, key=lambda x: x[1], reverse=True)
+def _rank_key(group):
+    return group[1]
+
+def _keyed_rank_key(group):
+    return group[1].key
+
+def _team_id(group):
+    return getattr(group[0], "id", group[0])
+
+# Tasatulokset järjestetään joukkueen id:n mukaan, jotta järjestys on aina sama
+# ja rankingia voi sivuttaa kursorilla (ks. ranking_cursor)
+def sort_ranking(groups, limit=None):
+    with span("sort"):
+        # sorted ja nlargest ovat stabiileja, joten id-järjestys säilyy tasatuloksissa
+        groups = sorted(groups, key=_team_id)
+        # KeyedRankeja verrataan suoraan tuplena ilman __lt__-kutsuja
+        key = _keyed_rank_key if groups and isinstance(groups[0][1], KeyedRank) else _rank_key
+
+        if limit is not None:
+            # heapq.nlargest on sama kuin sorted(...)[:limit] mutta ei järjestä koko listaa
+            return heapq.nlargest(limit, groups, key=key)
+
+        return sorted(groups, key=key, reverse=True)
+
+# Vertailuavain sijoitusten numerointiin, ks. util.rank_positions.
+# Valmiiksi lasketut avaimet kelpaavat numpylle, muuten verrataan rank-olioita.
+def rank_key(rank):
+    if isinstance(rank, KeyedRank):
+        return rank.key
+    return getattr(rank, "sort_key", rank)
+
+# Rankingin sivutusavain (rank_key, team_id): rankingit ovat rank_keyn mukaan laskevassa
+# ja tasatuloksissa joukkueen id:n mukaan nousevassa järjestyksessä, joten kursorin
+# jälkeiset rivit löytyvät vaikka kursorin joukkue olisi poistunut listalta.
+def ranking_cursor(team, rank):
+    return rank_key(rank), team.id
+
+# [(team, rank)] järjestyksessä -> rivit kursorin jälkeen
+def ranking_after(ranking, after):
+    key, team_id = after
+    return list(itertools.dropwhile(lambda x: (rank_key(x[1]), -x[0].id) >= (key, -team_id),
+        ranking))
+
+# [(team, rank)] järjestyksessä -> [(sijoitus, (team, rank))]
+def enumerate_ranking(ranking, ties="competition", start=1):
+    ranking = list(ranking)
+    return list(zip(rank_positions([rank_key(r) for _,r in ranking], ties, start), ranking))
 
 def tiebreak_ranking(db, id):
-    ret = db.query(model.Tiebreak)\
-            .filter_by(ranking_id=id)\
-            .all()
+    with span("tiebreaks"):
+        ret = db.query(model.Tiebreak)\
+                .filter_by(ranking_id=id)\
+                .options(joinedload(model.Tiebreak.team, innerjoin=True))\
+                .all()
+
+        return dict((r.team, r.weight) for r in ret)
+
+# -> [{team_id: weight}], yksi dict jokaiselle id:lle samassa järjestyksessä.
+# Kaikki yhdellä kyselyllä eikä Team-olioita ladata.
+def tiebreak_weights(db, *ids):
+    with span("tiebreaks") as c:
+        ret = dict((id, {}) for id in ids)
+        rows = db.query(model.Tiebreak.ranking_id, model.Tiebreak.team_id, model.Tiebreak.weight)\
+                .filter(model.Tiebreak.ranking_id.in_(ids))\
+                .all()
 
-    return dict((r.team, r.weight) for r in ret)
+        for ranking_id, team_id, weight in rows:
+            ret[ranking_id][team_id] = weight or 0
+
+        c.items = len(rows)
+        return [ret[id] for id in ids]
+
+# Toisessa prosessissa lasketun rankingin sijoitus
+@functools.total_ordering
+class RankPosition:
+
+    __slots__ = "position", "text"
+
+    def __init__(self, position, text):
+        self.position = position
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return "#%d: %s" % (self.position, self.text)
+
+    def __eq__(self, other):
+        return self.position == other.position
+
+    def __lt__(self, other):
+        # pienempi sijoitus on parempi
+        return self.position > other.position
 
 class RankProxy:
 
+    __slots__ = "rank",
+
     def __init__(self, rank):
         self.rank = rank
 
@@ -146,6 +768,8 @@ class RankProxy:
 @functools.total_ordering
 class WeightedRank(RankProxy):
 
+    __slots__ = "weight",
+
     def __init__(self, weight, rank):
         super().__init__(rank)
         self.weight = weight
@@ -171,6 +795,8 @@ class WeightedRank(RankProxy):
 @functools.total_ordering
 class CombinedRank(RankProxy):
 
+    __slots__ = "ranks",
+
     def __init__(self, rank, *ranks):
         super().__init__(rank)
         self.ranks = ranks
@@ -193,14 +819,145 @@ class CombinedRank(RankProxy):
                 return r1 < r2
         return False
 
+# Sijoitus jonka vertailuavain lasketaan valmiiksi yhdeksi tupleksi: ensin varsinaisen
+# rankin sort_key (tai rank itse jos sitä ei ole) ja perään tiebreakit.
+@functools.total_ordering
+class KeyedRank(RankProxy):
+
+    __slots__ = "weights", "key"
+
+    def __init__(self, rank, weights):
+        super().__init__(rank)
+        self.weights = weights
+        sort_key = getattr(rank, "sort_key", None)
+        self.key = (*sort_key, *weights) if sort_key is not None else (rank, *weights)
+
+    def __str__(self):
+        return "%s (%s)" % (str(self.rank), ", ".join(map(str, self.weights)))
+
+    def __repr__(self):
+        return "%s (%s)" % (repr(self.rank), ", ".join(map(repr, self.weights)))
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+# primary: {team: rank}, tiebreaks: {team_id: weight} (ks. tiebreak_weights).
+# Toisin kuin combine_ranks, puuttuva tiebreak on 0 eikä "ei vertailtavissa", jolloin
+# järjestys on aina transitiivinen.
+def combine_tiebreaks(primary, *tiebreaks):
+    with span("combine"):
+        return dict((team, KeyedRank(rank, tuple(tb.get(team.id, 0) for tb in tiebreaks)))
+                for team, rank in primary.items())
+
 def combine_ranks(primary, *others):
-    combined = {}
+    with span("combine"):
+        combined = {}
+
+        for team, rank in primary.items():
+            combined[team] = [rank]
+
+        for o in others:
+            for team, ranks in combined.items():
+                ranks.append(o.get(team, None))
+
+        return dict((team, CombinedRank(*ranks)) for team, ranks in combined.items())
+
+# Usean lohkon rankit yhdistettynä joukkueittain, ks. MultiBlockAggregate.
+# Saa listan [(weight, rank)] kaikista lohkoista joissa joukkue on.
+def _max_weight(ranks):
+    # painavin lohko voittaa, saman painon lohkoista paras rank
+    return max(WeightedRank(w, r) for w, r in ranks)
+
+def _best(ranks):
+    # rankien pitää olla keskenään vertailtavia, paino ei vaikuta
+    return max(r for _, r in ranks)
+
+def _sum(ranks):
+    # aggregaattien pitää palauttaa lukuja
+    return sum(w*r for w, r in ranks)
+
+AGGREGATE_POLICIES = {
+    "max_weight": _max_weight,
+    "best": _best,
+    "sum": _sum
+}
+
+# Monen lohkon ranking yhdellä kyselyllä, esim. karsinnat + finaali:
+#     MultiBlockAggregate(
+#         (karsinnat, 1, RescueMaxRank.from_scores),
+#         (finaali, 2, RescueMaxRank.from_scores)
+#     )(db) -> {team: WeightedRank}
+# policy on AGGREGATE_POLICIES:n avain tai oma funktio [(weight, rank)] -> rank.
+class MultiBlockAggregate:
+
+    def __init__(self, *parts, policy="max_weight"):
+        if not callable(policy):
+            if policy not in AGGREGATE_POLICIES:
+                raise ValueError("Unknown aggregate policy: %s" % policy)
+            policy = AGGREGATE_POLICIES[policy]
+
+        self.parts = parts
+        self.policy = policy
+
+    @property
+    def blocks(self):
+        # sama lohko voi olla mukana usealla painolla
+        return list(collections.OrderedDict((b.id, b) for b,_,_ in self.parts).values())
 
-    for team, rank in primary.items():
-        combined[team] = [rank]
+    def __call__(self, db, hide_shadows=False):
+        blocks = self.blocks
 
-    for o in others:
-        for team, ranks in combined.items():
-            ranks.append(o.get(team, None))
+        with span("block:%s" % ",".join(b.id for b in blocks)):
+            scores = fetch_block_scores(db, *blocks, hide_shadows=hide_shadows)
+            with span("decode") as c:
+                c.items = len(scores)
+                grouped = _group_block_scores(blocks, scores)
 
-    return dict((team, CombinedRank(*ranks)) for team, ranks in combined.items())
+        with span("aggregate") as c:
+            ranks = collections.defaultdict(list)
+
+            for block, weight, aggregate in self.parts:
+                for team, ss in grouped[block.id].items():
+                    ranks[team].append((weight, aggregate(ss)))
+
+            ret = dict((team, self.policy(rs)) for team, rs in ranks.items())
+            c.items = len(ret)
+            return ret
+
+def _group_history(blocks, events, judgings, scores):
+    by_event = dict((e.id, ([], [])) for e in events)
+
+    for j in judgings:
+        by_event[j.event_id][0].append(j)
+
+    for s in scores:
+        by_event[s.event_id][1].append(s)
+
+    ret = collections.OrderedDict()
+
+    for e in events:
+        js, ss = by_event[e.id]
+        set_committed_value(e, "judgings", js)
+        set_committed_value(e, "scores", ss)
+
+        block = blocks.get(e.block_id)
+        for s in ss:
+            s.decoded_score = block.ruleset.decode(s.data)\
+                    if block is not None and s.has_score else None
+
+        ret.setdefault(e.block_id, []).append(e)
+
+    return ret
+
+# -> {block_id: {team: [score]}}
+def _group_block_scores(blocks, scores):
+    bs = dict((b.id, b) for b in blocks)
+    ret = dict((b.id, collections.defaultdict(list)) for b in blocks)
+
+    for s, block_id in scores:
+        ret[block_id][s.team].append(bs[block_id].ruleset.decode(s.data) if s.has_score else None)
+
+    return ret
@@ -1,3 +1,10 @@
+import collections
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 class DuplicateKeyError(LookupError):
     pass
 
@@ -40,5 +47,90 @@ def enumerate_rank(it, start=1, key=lambda x: x):
             idx = cnt
         yield idx, i
 
+TIE_MODES = ("competition", "dense", "ordinal", "fractional")
+
+# Sijoitukset valmiiksi järjestetyille avaimille yhdellä läpikäynnillä.
+# Tasatulokset ovat peräkkäisiä yhtäsuuria avaimia, joten järjestyksen suunnalla ei väliä.
+#   competition: 1, 2, 2, 4
+#   dense:       1, 2, 2, 3
+#   ordinal:     1, 2, 3, 4
+#   fractional:  1, 2.5, 2.5, 4
+# Numeeriset avaimet (luvut tai kokonaislukutuplet) lasketaan numpyllä jos se on asennettu,
+# muut vertaillaan sellaisenaan.
+def rank_positions(keys, ties="competition", start=1):
+    if ties not in TIE_MODES:
+        raise ValueError("Unknown tie mode: %s" % ties)
+
+    keys = list(keys)
+    if not keys:
+        return []
+
+    arr = _numeric_keys(keys)
+    if arr is not None:
+        return _rank_positions_np(arr, ties, start)
+
+    firsts = []
+    groups = []
+    group = -1
+
+    for i, k in enumerate(keys):
+        if i == 0 or k != prev:
+            first, prev = i, k
+            group += 1
+        firsts.append(first)
+        groups.append(group)
+
+    if ties == "competition":
+        return [f + start for f in firsts]
+    if ties == "dense":
+        return [g + start for g in groups]
+    if ties == "ordinal":
+        return list(range(start, start+len(keys)))
+
+    # ryhmän sijoitus on sen ensimmäisen ja viimeisen sijoituksen keskiarvo
+    sizes = collections.Counter(firsts)
+    return [f + (sizes[f]-1)/2 + start for f in firsts]
+
+def _numeric_keys(keys):
+    if np is None:
+        return None
+
+    try:
+        arr = np.asarray(keys)
+    except (ValueError, TypeError):
+        return None
+
+    # tupleissa pelkät kokonaisluvut, ettei int->float-muunnos yhdistä eri avaimia
+    if arr.ndim == 1 and arr.dtype.kind in "iubf":
+        return arr
+    if arr.ndim == 2 and arr.dtype.kind in "iub":
+        return arr
+
+    return None
+
+def _rank_positions_np(arr, ties, start):
+    n = len(arr)
+    idx = np.arange(n)
+
+    new = np.empty(n, dtype=bool)
+    new[0] = True
+    diff = arr[1:] != arr[:-1]
+    new[1:] = diff.any(axis=1) if arr.ndim == 2 else diff
+
+    if ties == "ordinal":
+        ret = idx + start
+    elif ties == "dense":
+        ret = np.cumsum(new) - 1 + start
+    else:
+        first = np.maximum.accumulate(np.where(new, idx, 0))
+        if ties == "competition":
+            ret = first + start
+        else:
+            starts = idx[new]
+            sizes = np.diff(np.append(starts, n))
+            ret = (starts + (sizes-1)/2)[np.cumsum(new) - 1] + start
+
+    return ret.tolist()
+
 def noneflt(func):
     return lambda it, **kwargs: func(filter(lambda x: x is not None, it), **kwargs)
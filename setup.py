@@ -11,6 +11,8 @@ setup(
         ],
         extras_require = {
             "dev": ["pytest"],
+            "async": ["sqlalchemy>=1.4,<2.0", "aiosqlite"],
+            "fast": ["numpy"],
             "cli": [
                 "click",
                 "pttt @ https://github.com/vfprintf/pttt/tarball/master",
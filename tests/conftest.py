@@ -16,3 +16,32 @@ def db():
     engine = create_engine("sqlite://", echo="debug")
     model.Base.metadata.create_all(engine)
     return sessionmaker(bind=engine)()
+
+# Benchmarkit ajetaan vain pyydettäessä: pytest -m benchmark
+# Tulokset kirjoitetaan benchmark_report-fixturella ja tulostetaan yhteenvedon perään.
+_benchmark_results = []
+
+@pytest.fixture
+def benchmark_report(request):
+    return lambda text: _benchmark_results.append((request.node.nodeid, text))
+
+def pytest_terminal_summary(terminalreporter):
+    if not _benchmark_results:
+        return
+
+    terminalreporter.section("benchmarks")
+    for nodeid, text in _benchmark_results:
+        terminalreporter.write_line(nodeid)
+        terminalreporter.write_line(text)
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: performance benchmark, run with -m benchmark")
+
+def pytest_collection_modifyitems(config, items):
+    if "benchmark" in (config.getoption("-m") or ""):
+        return
+
+    skip = pytest.mark.skip(reason="benchmark, run with -m benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
@@ -1,8 +1,9 @@
 import robostat
-from robostat.tournament import WeightedRank, aggregate_scores, sort_ranking, decode_block_scores,\
-        tiebreak_ranking, combine_ranks
+from robostat.tournament import MultiBlockAggregate, aggregate_scores, sort_ranking, decode_block_scores,\
+        tiebreak_weights, combine_tiebreaks
 from robostat.rulesets.xsumo import XSRuleset, XSumoScoreRank, XSumoWinsRank
 from robostat.rulesets.rescue import RescueRuleset, RescueMaxRank
+from robostat.replay import Replay
 
 xsumo_ruleset = XSRuleset()
 rescue1_ruleset = RescueRuleset.by_difficulty(1, max_time=600)
@@ -31,36 +32,39 @@ rescue1_b = robostat.block(
         name="Rescue 1 (B)"
 )
 
-@robostat.ranking("xsumo.score", name="XSumo A (Pisteet)")
-def rank_xsumo_score(db):
+@robostat.ranking("xsumo.score", name="XSumo A (Pisteet)",
+        replay=Replay(XSumoScoreRank, xsumo))
+def rank_xsumo_score(db, limit=None):
     scores = xsumo.decode_scores(db)
     ranks = aggregate_scores(scores, XSumoScoreRank.from_scores)
-    return sort_ranking(ranks.items())
+    return sort_ranking(ranks.items(), limit=limit)
 
-@robostat.ranking("xsumo.wins", name="XSumo A (Voitot)")
-def rank_xsumo_wins(db):
+@robostat.ranking("xsumo.wins", name="XSumo A (Voitot)",
+        replay=Replay(XSumoWinsRank, xsumo))
+def rank_xsumo_wins(db, limit=None):
     scores = xsumo.decode_scores(db)
     ranks = aggregate_scores(scores, XSumoWinsRank.from_scores)
-    return sort_ranking(ranks.items())
+    return sort_ranking(ranks.items(), limit=limit)
 
 @robostat.ranking("xsumo.tb", name="XSumo A (Pisteet+tiebreak)")
-def rank_xsumo_tb(db):
+def rank_xsumo_tb(db, limit=None):
     scores = xsumo.decode_scores(db)
     ranks = aggregate_scores(scores, XSumoScoreRank.from_scores)
-    tiebreaks = tiebreak_ranking(db, "xsumo.tb")
-    combined = combine_ranks(ranks, tiebreaks)
-    return sort_ranking(combined.items())
+    tiebreaks, = tiebreak_weights(db, "xsumo.tb")
+    combined = combine_tiebreaks(ranks, tiebreaks)
+    return sort_ranking(combined.items(), limit=limit)
 
-@robostat.ranking("rescue1", name="Rescue 1")
-def rank_rescue1(db):
+@robostat.ranking("rescue1", name="Rescue 1",
+        replay=Replay(RescueMaxRank, rescue1_a, rescue1_b))
+def rank_rescue1(db, limit=None):
     scores = decode_block_scores(db, rescue1_a, rescue1_b)
     ranks = aggregate_scores(scores, RescueMaxRank.from_scores)
-    return sort_ranking(ranks.items())
+    return sort_ranking(ranks.items(), limit=limit)
 
 @robostat.ranking("rescue1.weighted", name="Rescue 1 (Painotettu)")
-def rank_rescue1_weighted(db):
-    scores_a = rescue1_a.decode_scores(db)
-    scores_b = rescue1_b.decode_scores(db)
-    ranks = aggregate_scores(scores_a, WeightedRank.wrap_aggregate(2, RescueMaxRank.from_scores))
-    ranks.update(aggregate_scores(scores_b, WeightedRank.wrap_aggregate(1, RescueMaxRank.from_scores)))
-    return sort_ranking(ranks.items())
+def rank_rescue1_weighted(db, limit=None):
+    ranks = MultiBlockAggregate(
+        (rescue1_a, 2, RescueMaxRank.from_scores),
+        (rescue1_b, 1, RescueMaxRank.from_scores)
+    )(db)
+    return sort_ranking(ranks.items(), limit=limit)
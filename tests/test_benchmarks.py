@@ -0,0 +1,19 @@
+import pytest
+from benchmarks import codec
+
+@pytest.mark.parametrize("name,blob,expected", codec.GOLDEN)
+def test_codec_golden(name, blob, expected):
+    codec.check_golden(name, blob, expected)
+
+@pytest.mark.parametrize("name", list(codec.CASES))
+def test_codec_roundtrip(name):
+    codec.check_roundtrip(name, codec.sample_scores(name, 50))
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("name", list(codec.CASES))
+def test_codec_benchmark(name, benchmark_report):
+    res = codec.bench_case(name, n=100, min_time=0.1)
+    benchmark_report(codec.format_results({name: res}))
+
+    for op in ("encode", "decode", "validate"):
+        assert res[op]["ops"] > 0
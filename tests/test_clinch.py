@@ -0,0 +1,233 @@
+import itertools
+import random
+import pytest
+import robostat
+import robostat.db as model
+from robostat.clinch import xsumo_status, rescue_status, max_flow, CLINCHED, ELIMINATED, OPEN
+from robostat.rulesets.xsumo import XSRuleset, XSRoundScore, XSumoResult,\
+        XSumoScoreRank, XSumoWinsRank
+from robostat.rulesets.rescue import RescueRuleset
+from robostat.ruleset import ValidationError
+from .helpers import R, XS2, data, make_event
+from .test_tournament import tj_data
+
+xs_ruleset = XSRuleset(rounds=1)
+rescue_ruleset = RescueRuleset.by_difficulty(1, max_time=600, max_repeat=1)
+
+def test_max_flow():
+    # 0 -> 1,2 -> 3
+    edges = [(0, 1, 3), (0, 2, 2), (1, 2, 1), (1, 3, 2), (2, 3, 3)]
+    assert max_flow(4, edges, 0, 3) == 5
+    assert max_flow(4, edges[:2], 0, 3) == 0
+
+def _round_pairs():
+    ret = set()
+    for f1, f2 in itertools.product((False, True), repeat=2):
+        for r1, r2 in itertools.product("WTL", repeat=2):
+            rr1, rr2 = XSRoundScore(f1, XSumoResult(r1)), XSRoundScore(f2, XSumoResult(r2))
+            try:
+                xs_ruleset._validate_rounds(rr1, rr2)
+            except ValidationError:
+                continue
+            ret.add(((f1, r1), (f2, r2)))
+    return sorted(ret)
+
+ROUNDS = _round_pairs()
+
+def _match(rnd):
+    return XS2([rnd])
+
+def _positions(scores, rank):
+    ranks = dict((t, rank.from_scores(s)) for t,s in scores.items())
+    return dict((t, 1 + sum(r > ranks[t] for r in ranks.values())) for t in ranks)
+
+def _random_block(rnd, num_teams, num_played, num_remaining):
+    pairs = list(itertools.combinations(range(1, num_teams+1), 2)) * 2
+    rnd.shuffle(pairs)
+    matches = {}
+
+    for i, (a, b) in enumerate(pairs[:num_played+num_remaining]):
+        if i < num_played:
+            sa, sb = _match(rnd.choice(ROUNDS))
+        else:
+            sa = sb = None
+        matches[i, 1] = {a: sa, b: sb}
+
+    return matches
+
+@pytest.mark.parametrize("rank", [XSumoScoreRank, XSumoWinsRank])
+@pytest.mark.parametrize("seed", range(20))
+def test_xsumo_status_sound(rank, seed):
+    rnd = random.Random(seed)
+    matches = _random_block(rnd, 4, rnd.randint(0, 6), rnd.randint(1, 3))
+    remaining = [k for k,v in matches.items() if None in v.values()]
+    # kaikki mahdolliset lopputulokset
+    outcomes = []
+
+    for rounds in itertools.product(ROUNDS, repeat=len(remaining)):
+        final = dict((k, dict(v)) for k,v in matches.items())
+        for k, r in zip(remaining, rounds):
+            (a, _), (b, _) = sorted(final[k].items())
+            final[k][a], final[k][b] = _match(r)
+
+        scores = {}
+        for v in final.values():
+            for t, s in v.items():
+                scores.setdefault(t, []).append(s)
+        outcomes.append(_positions(scores, rank))
+
+    for n in range(1, 4):
+        status = xsumo_status(matches, xs_ruleset, n, rank)
+        for team, st in status.items():
+            if st == CLINCHED:
+                assert all(o[team] <= n for o in outcomes)
+            elif st == ELIMINATED:
+                assert all(o[team] > n for o in outcomes)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_xsumo_status_finished(seed):
+    rnd = random.Random(seed)
+    matches = _random_block(rnd, 5, 8, 0)
+    scores = {}
+    for v in matches.values():
+        for t, s in v.items():
+            scores.setdefault(t, []).append(s)
+    positions = _positions(scores, XSumoScoreRank)
+
+    for n in range(1, 5):
+        assert xsumo_status(matches, xs_ruleset, n) ==\
+                dict((t, CLINCHED if p <= n else ELIMINATED) for t,p in positions.items())
+
+def test_xsumo_status_played():
+    win = [((True, "W"), (False, "L"))]
+    tie = [((False, "T"), (False, "T"))]
+    s12, s21 = XS2(win)
+    s23, s32 = XS2(win)
+    s13, s31 = XS2(tie)
+    matches = {
+        (1, 1): {1: s12, 2: s21},
+        (2, 1): {2: s23, 3: s32},
+        (3, 1): {1: s13, 3: s31}
+    }
+
+    # 1: 4+1p, 2: 4p, 3: 1p
+    assert xsumo_status(matches, xs_ruleset, 1) == {1: CLINCHED, 2: ELIMINATED, 3: ELIMINATED}
+    assert xsumo_status(matches, xs_ruleset, 2) == {1: CLINCHED, 2: CLINCHED, 3: ELIMINATED}
+
+    matches[3, 1] = {1: None, 3: None}
+    # 3 voi voittaa ykkösen 4-0 ja nousta ykkösen kanssa tasapisteisiin
+    assert xsumo_status(matches, xs_ruleset, 1) == {1: CLINCHED, 2: OPEN, 3: OPEN}
+    # ilman kierrosten määrää pisteillä ei ole ylärajaa, pelattujen otteluiden mukaan on
+    assert xsumo_status(matches, XSRuleset(), 1) == {1: CLINCHED, 2: OPEN, 3: OPEN}
+    assert xsumo_status(matches, XSRuleset(rounds=2), 1) == {1: OPEN, 2: OPEN, 3: OPEN}
+
+def test_xsumo_status_flow():
+    # 1 on voittanut kaikki, 2..5 pelaavat keskenään: neljä ottelua, joista jokainen nostaa
+    # jonkun voittoihin. 1 pysyy silti voitoissa edellä.
+    win = [((True, "W"), (False, "L"))]
+    matches = {}
+    for i, t in enumerate((2, 3, 4, 5)):
+        s1, s2 = XS2(win)
+        matches[i, 1] = {1: s1, t: s2}
+        matches[i, 2] = {1: s1, t: s2}
+    for i, (a, b) in enumerate([(2, 3), (3, 4), (4, 5), (5, 2)], start=10):
+        matches[i, 1] = {a: None, b: None}
+
+    status = xsumo_status(matches, xs_ruleset, 1, XSumoWinsRank)
+    assert status[1] == CLINCHED
+    assert set(status[t] for t in (2, 3, 4, 5)) == {ELIMINATED}
+
+    # top-2: kukaan neljästä ei ole varma, mutta kukaan ei ole myöskään ulkona
+    status = xsumo_status(matches, xs_ruleset, 2, XSumoWinsRank)
+    assert status[1] == CLINCHED
+    assert set(status[t] for t in (2, 3, 4, 5)) == {OPEN}
+
+def _rescue(values):
+    return R(rescue_ruleset, values)
+
+def test_rescue_status():
+    matches = {
+        (1, 1): {1: _rescue({"viiva_punainen": "S", "time": 100})},
+        (2, 1): {2: _rescue({"viiva_punainen": "S", "time": 200})},
+        (3, 1): {3: _rescue({"time": 10})},
+        (4, 1): {3: None}
+    }
+
+    assert rescue_status(matches, rescue_ruleset, 1) == {1: OPEN, 2: ELIMINATED, 3: OPEN}
+    assert rescue_status(matches, rescue_ruleset, 2) == {1: CLINCHED, 2: OPEN, 3: OPEN}
+
+    matches[4, 1] = {3: _rescue({"time": 5})}
+    assert rescue_status(matches, rescue_ruleset, 1) == {1: CLINCHED, 2: ELIMINATED, 3: ELIMINATED}
+
+@pytest.fixture
+def blocks():
+    tournament = robostat.Tournament()
+    return tournament.block("xsumo", XSRuleset(rounds=1)), tournament.block("rescue", rescue_ruleset)
+
+@tj_data
+@data(lambda: [
+    make_event(teams=[1], judges=[1], block_id="rescue", ts_sched=0, arena="rescue.1"),
+    make_event(teams=[2], judges=[1], block_id="rescue", ts_sched=1, arena="rescue.1"),
+    make_event(teams=[3], judges=[1], block_id="rescue", ts_sched=2, arena="rescue.1")
+])
+def test_block_clinch_status(db, blocks):
+    _, block = blocks
+
+    def judge(event_id, values, ts):
+        judging = db.query(model.EventJudging).filter_by(event_id=event_id).one()
+        judging.scores[0].data = rescue_ruleset.encode(_rescue(values))
+        judging.ts = ts
+        db.commit()
+
+    assert block.clinch_status(db, 1) == {1: OPEN, 2: OPEN, 3: OPEN}
+
+    judge(1, {"viiva_punainen": "S", "uhri_alue": "S", "time": 10}, ts=100)
+    assert block.clinch_status(db, 1) == {1: OPEN, 2: OPEN, 3: OPEN}
+    judge(2, {"time": 10}, ts=100)
+    assert block.clinch_status(db, 1) == {1: OPEN, 2: ELIMINATED, 3: OPEN}
+    standings = block._standings
+    judge(3, {"viiva_punainen": "S", "time": 100}, ts=200)
+    assert block.clinch_status(db, 1) == {1: CLINCHED, 2: ELIMINATED, 3: ELIMINATED}
+    assert block._standings is standings
+
+    # poisto ilman aikaleimaa luetaan myös
+    score = db.query(model.Score).filter_by(event_id=1).one()
+    score.data = None
+    db.commit()
+    assert block.clinch_status(db, 1) == {1: OPEN, 2: ELIMINATED, 3: OPEN}
+
+@tj_data
+@data(lambda: [
+    make_event(teams=[1, 2], judges=[1], block_id="xsumo", ts_sched=0, arena="xsumo.1"),
+    make_event(teams=[1], judges=[1], block_id="rescue", ts_sched=0, arena="rescue.1")
+])
+def test_block_clinch_status_types(db, blocks):
+    xsumo, rescue = blocks
+    assert xsumo.clinch_status(db, 1) == {1: OPEN, 2: OPEN}
+    assert xsumo.clinch_status(db, 2) == {1: CLINCHED, 2: CLINCHED}
+    assert rescue.clinch_status(db, 1) == {1: CLINCHED}
+
+    other = robostat.Tournament().block("other", object())
+    with pytest.raises(TypeError):
+        other.clinch_status(db, 1)
+
+@tj_data
+@data(lambda: [
+    make_event(teams=[1, 2], judges=[1], block_id="xsumo", ts_sched=0, arena="xsumo.1")
+])
+def test_block_clinch_status_edit(db, blocks):
+    xsumo, _ = blocks
+
+    def judge(rounds, ts):
+        judging = db.query(model.EventJudging).filter_by(event_id=1).one()
+        for score, s in zip(sorted(judging.scores, key=lambda x: x.team_id), XS2(rounds)):
+            score.data = xsumo.ruleset.encode(s)
+        judging.ts = ts
+        db.commit()
+
+    judge([((True, "W"), (False, "L"))], ts=100)
+    assert xsumo.clinch_status(db, 1) == {1: CLINCHED, 2: ELIMINATED}
+
+    # muokkaus samalla aikaleimalla näkyy, kun pisteiden pituus muuttuu
+    judge([((False, "L"), (True, "W"))] * 2, ts=100)
+    assert xsumo.clinch_status(db, 1) == {1: ELIMINATED, 2: CLINCHED}
@@ -0,0 +1,82 @@
+import pytest
+import robostat.db as model
+from robostat.explain import capture, assert_indexed
+from .helpers import data, make_event
+
+teams_data = data(lambda: [
+    model.Team(id=1, name="Joukkue A"),
+    model.Team(id=2, name="Joukkue B"),
+    model.Team(id=3, name="Joukkue C"),
+    model.Judge(id=1, name="Tuomari A"),
+    make_event(teams=[1, 2], judges=[1], block_id="xsumo", ts_sched=0, arena="xsumo.1"),
+    make_event(teams=[2, 3], judges=[1], block_id="xsumo", ts_sched=1, arena="xsumo.1"),
+    make_event(teams=[3, 1], judges=[1], block_id="xsumo", ts_sched=2, arena="xsumo.1")
+])
+
+@teams_data
+def test_ranking_indexed(db, tournament):
+    with capture() as c:
+        tournament.rankings["xsumo.tb"](db)
+
+    reports = c.reports()
+    assert len(reports) == 2
+    assert [r.paths for r in reports] == [
+        [("ranking:xsumo.tb", "block:xsumo")],
+        [("ranking:xsumo.tb", "tiebreaks")]
+    ]
+    assert_indexed(c, "scores", "events")
+
+@teams_data
+def test_team_history_indexed(db, tournament):
+    with capture() as c:
+        tournament.team_history(db, 1)
+
+    assert len(c.reports()) == 3
+    assert_indexed(c, "scores", "events", "event_teams", "event_judging")
+
+@teams_data
+def test_judge_queue_indexed(db):
+    from robostat.tournament import judge_queue
+
+    with capture() as c:
+        judge_queue(db, 1, limit=10)
+
+    assert_indexed(c, "event_judging", "events", "event_teams")
+    assert "USING INDEX ix_event_judging_judge_id_ts" in c.reports()[0].plan[0][2]
+
+@teams_data
+def test_scan_suggestion(db):
+    with capture() as c:
+        db.query(model.Score).filter(model.Score.judge_id == 1).all()
+        db.query(model.Score).filter(model.Score.judge_id == 2).all()
+
+    r, = c.reports()
+    assert r.count == 2
+    assert not r.ok
+    assert r.scans() == [("scores", None)]
+    assert r.suggestions == ["CREATE INDEX ix_scores_judge_id ON scores(judge_id)"]
+
+    with pytest.raises(AssertionError):
+        assert_indexed(c, "scores")
+    assert_indexed(c, "events")
+
+@teams_data
+def test_order_suggestion(db):
+    with capture() as c:
+        db.query(model.EventJudging)\
+                .filter(model.EventJudging.event_id == 1)\
+                .order_by(model.EventJudging.ts)\
+                .all()
+
+    r, = c.reports()
+    assert "Temp B-tree for ORDER BY" in r.issues
+    assert r.suggestions == [
+        "CREATE INDEX ix_event_judging_event_id_ts ON event_judging(event_id, ts)"
+    ]
+
+    # olemassaolevaa indeksiä ei ehdoteta
+    with capture() as c:
+        db.query(model.Event).order_by(model.Event.id).all()
+
+    r, = c.reports()
+    assert r.suggestions == []
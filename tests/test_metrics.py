@@ -0,0 +1,67 @@
+import time
+from robostat import metrics
+from robostat.metrics import Registry, MetricsWriter
+from .test_tournament import tj_data, xsumo_events
+
+def test_exposition():
+    reg = Registry()
+    c = reg.counter("test_events", "Events", ["kind"])
+    h = reg.histogram("test_duration_seconds", "Duration", buckets=(0.1, 1))
+
+    c.labels("a").inc()
+    c.labels(kind="a").inc(2)
+    c.labels('b"\n').inc()
+    h.observe(0.05)
+    h.observe(0.5)
+    h.observe(5)
+
+    assert reg.expose() == "\n".join([
+        "# TYPE test_events counter",
+        "# HELP test_events Events",
+        'test_events_total{kind="a"} 3',
+        'test_events_total{kind="b\\"\\n"} 1',
+        "# TYPE test_duration_seconds histogram",
+        "# HELP test_duration_seconds Duration",
+        'test_duration_seconds_bucket{le="0.1"} 1',
+        'test_duration_seconds_bucket{le="1.0"} 2',
+        'test_duration_seconds_bucket{le="+Inf"} 3',
+        "test_duration_seconds_count 3",
+        "test_duration_seconds_sum 5.55",
+        "# EOF",
+        ""
+    ])
+
+def _value(metric, *labels):
+    return metric._values.get(tuple(labels), 0)
+
+@tj_data
+@xsumo_events
+def test_ranking_metrics(db, tournament):
+    before = _value(metrics.rankings, "xsumo.score")
+    decoded = _value(metrics.decoded_scores)
+
+    metrics.enable()
+    try:
+        tournament.rankings["xsumo.score"](db)
+    finally:
+        metrics.disable()
+
+    assert _value(metrics.rankings, "xsumo.score") == before + 1
+    assert _value(metrics.decoded_scores) == decoded + 6
+
+    # ei päivity kun mittarit on pois päältä
+    tournament.rankings["xsumo.score"](db)
+    assert _value(metrics.rankings, "xsumo.score") == before + 1
+
+def test_writer(tmp_path):
+    reg = Registry()
+    reg.counter("test_events", "Events").inc()
+    path = str(tmp_path / "metrics.txt")
+
+    writer = MetricsWriter(path, 0.05, registry=reg)
+    writer.start()
+    time.sleep(0.2)
+    writer.stop()
+
+    with open(path) as f:
+        assert "test_events_total 1\n" in f.read()
@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import create_engine
+import robostat.db as model
+from robostat import migrate
+from robostat.migrate import Migration, MigrationError
+
+NEW_INDEXES = {
+    "ix_scores_team_id",
+    "ix_events_block_id_ts_sched",
+    "ix_event_judging_judge_id_ts",
+    "ix_tiebreaks_ranking_id_weight",
+    "ix_event_teams_team_id_event_id"
+}
+
+def indexes(engine):
+    return set(r[0] for r in engine.execute("SELECT name FROM sqlite_master WHERE type='index'"))
+
+# Tietokanta sellaisena kuin vanha `rsx create` sen loi
+@pytest.fixture
+def old_engine(tmp_path):
+    engine = create_engine("sqlite:///%s" % (tmp_path / "db.sqlite3"))
+    model.Base.metadata.create_all(engine)
+    engine.execute("DROP TABLE schema_version")
+    for ix in NEW_INDEXES:
+        engine.execute("DROP INDEX %s" % ix)
+    return engine
+
+def test_migrate(old_engine):
+    assert migrate.get_version(old_engine) == 0
+    assert [m.version for m in migrate.pending(old_engine)] == [1, 2]
+    assert [m.version for m in migrate.pending(old_engine, 1)] == [1]
+
+    applied = []
+    assert migrate.migrate(old_engine, log=applied.append) == applied
+    assert [m.version for m in applied] == [1, 2]
+    assert migrate.get_version(old_engine) == migrate.LATEST
+    assert NEW_INDEXES <= indexes(old_engine)
+
+    assert migrate.pending(old_engine) == []
+    assert migrate.migrate(old_engine) == []
+
+def test_migrate_resume(old_engine, monkeypatch):
+    broken = migrate.LATEST + 1
+    monkeypatch.setattr(migrate, "MIGRATIONS", [
+        *migrate.MIGRATIONS,
+        Migration(broken, "Broken", [
+            "CREATE INDEX IF NOT EXISTS ix_test ON teams(is_shadow)",
+            "CREATE INDEX ix_test_broken ON no_such_table(x)"
+        ])
+    ])
+    monkeypatch.setattr(migrate, "LATEST", broken)
+
+    with pytest.raises(MigrationError):
+        migrate.migrate(old_engine, broken)
+
+    # aiemmat ehti mennä läpi, rikkinäinen perutaan kokonaan
+    assert migrate.get_version(old_engine) == broken - 1
+    assert NEW_INDEXES <= indexes(old_engine)
+    assert "ix_test" not in indexes(old_engine)
+
+    migrate.MIGRATIONS[-1].statements.pop()
+    assert [m.version for m in migrate.migrate(old_engine, broken)] == [broken]
+    assert migrate.get_version(old_engine) == broken
+    assert "ix_test" in indexes(old_engine)
+
+def test_create_stamps(tmp_path):
+    engine = create_engine("sqlite:///%s" % (tmp_path / "db.sqlite3"))
+    model.Base.metadata.create_all(engine)
+    migrate.stamp(engine)
+
+    assert NEW_INDEXES <= indexes(engine)
+    assert migrate.get_version(engine) == migrate.LATEST
+    assert migrate.pending(engine) == []
+
+    migrate.stamp(engine, migrate.LATEST + 1)
+    with pytest.raises(MigrationError):
+        migrate.pending(engine)
@@ -0,0 +1,92 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import robostat
+from robostat.registry import TournamentRegistry, compile_init, _cache_path
+
+path = os.path.dirname(os.path.realpath(__file__))
+init_file = os.path.join(path, "init1.py")
+
+def test_replace_default_tournament_is_context_local():
+    outer = robostat.default_tournament
+    inner = robostat.Tournament()
+    seen = []
+    ready = threading.Event()
+    done = threading.Event()
+
+    def other():
+        with robostat.replace_default_tournament(inner):
+            ready.set()
+            done.wait()
+            seen.append(robostat.default_tournament)
+
+    t = threading.Thread(target=other)
+    t.start()
+    ready.wait()
+
+    # toisen säikeen vaihto ei näy tässä
+    assert robostat.default_tournament is outer
+    done.set()
+    t.join()
+
+    assert seen == [inner]
+    assert robostat.default_tournament is outer
+
+def test_registry_cache():
+    registry = TournamentRegistry()
+
+    with ThreadPoolExecutor(4) as pool:
+        inits = list(pool.map(registry.get, [init_file]*8))
+
+    assert all(i is inits[0] for i in inits)
+    assert registry[init_file] is inits[0].tournament
+    assert "xsumo" in inits[0].tournament.blocks
+    assert "xsumo" not in robostat.default_tournament.blocks
+
+    # muuttunut tiedosto ladataan uudestaan
+    st = os.stat(init_file)
+    os.utime(init_file, ns=(st.st_atime_ns, st.st_mtime_ns+1))
+    try:
+        reloaded = registry.get(init_file)
+    finally:
+        os.utime(init_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert reloaded is not inits[0]
+    assert reloaded.tournament is not inits[0].tournament
+
+def test_registry_separate_tournaments(tmp_path):
+    other = tmp_path / "init2.py"
+    other.write_text("import robostat\nrobostat.block('other', ruleset=None)\n")
+
+    registry = TournamentRegistry()
+
+    with ThreadPoolExecutor(2) as pool:
+        t1, t2 = pool.map(registry.__getitem__, [init_file, str(other)])
+
+    assert set(t2.blocks) == {"other"}
+    assert "other" not in t1.blocks
+    assert "xsumo" in t1.blocks
+
+def test_compile_init_cache(tmp_path):
+    fname = str(tmp_path / "init.py")
+    with open(fname, "w") as f:
+        f.write("x = 1\n")
+
+    code = compile_init(fname)
+    assert os.path.exists(_cache_path(fname))
+
+    ctx = {}
+    exec(compile_init(fname), ctx)
+    assert ctx["x"] == 1
+
+    # sama sisältö eri mtimella kelpaa, muuttunut sisältö käännetään uudestaan
+    st = os.stat(fname)
+    os.utime(fname, ns=(st.st_atime_ns, st.st_mtime_ns+1))
+    assert compile_init(fname).co_consts == code.co_consts
+
+    with open(fname, "w") as f:
+        f.write("x = 2\n")
+
+    ctx = {}
+    exec(compile_init(fname), ctx)
+    assert ctx["x"] == 2
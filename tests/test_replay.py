@@ -0,0 +1,162 @@
+import time
+import itertools
+import random
+import pytest
+import robostat
+import robostat.db as model
+from robostat.replay import Replay, RankChange
+from robostat.rulesets.xsumo import XSRuleset, XSumoScoreRank, XSumoWinsRank
+from robostat.rulesets.rescue import RescueMaxRank
+from benchmarks.synth import Synth, define
+from .helpers import R, XS2, data, make_event
+from .test_tournament import tj_data, xsumo_events, rescue_events
+
+WIN = [((True, "W"), (False, "L"))]
+TIE = [((False, "T"), (False, "T"))]
+
+def judge(db, ruleset, event_id, scores, ts):
+    judging = db.query(model.EventJudging).filter_by(event_id=event_id).one()
+    for score, s in zip(sorted(judging.scores, key=lambda x: x.team_id), scores):
+        score.data = ruleset.encode(s)
+    judging.ts = ts
+    db.commit()
+
+# ranking suoraan kannasta: hetken ts jälkeen tuomaroidut ovat pelaamattomia
+def brute_ranks(db, blocks, rank, ts):
+    rows = db.query(model.Score, model.EventJudging.ts, model.Event.block_id)\
+            .join(model.Score.event)\
+            .join(model.EventJudging, (model.EventJudging.event_id == model.Score.event_id)
+                    & (model.EventJudging.judge_id == model.Score.judge_id))\
+            .filter(model.Event.block_id.in_([b.id for b in blocks]))\
+            .all()
+
+    rulesets = dict((b.id, b.ruleset) for b in blocks)
+    scores = {}
+    for s, judged, block_id in rows:
+        played = s.data is not None and (judged is None or judged <= ts)
+        scores.setdefault(s.team_id, []).append(
+                rulesets[block_id].decode(s.data) if played else None)
+
+    return dict((t, rank.from_scores(ss)) for t,ss in scores.items())
+
+def positions(ranks):
+    return dict((t, 1 + sum(o > r for o in ranks.values())) for t,r in ranks.items())
+
+@tj_data
+@xsumo_events
+def test_xsumo_as_of(db, tournament):
+    ranking = tournament.rankings["xsumo.score"]
+    ruleset = tournament.blocks["xsumo"].ruleset
+
+    judge(db, ruleset, 1, XS2(WIN), ts=100)
+    judge(db, ruleset, 2, XS2(TIE), ts=200)
+    # 3 voittaa ykkösen samalla hetkellä
+    s3, s1 = XS2(WIN)
+    judge(db, ruleset, 3, [s1, s3], ts=200)
+
+    assert [(t.id, str(r)) for t,r in ranking.as_of(db, 0)] ==\
+            [(1, "0 (0/0/0/2)"), (2, "0 (0/0/0/2)"), (3, "0 (0/0/0/2)")]
+    assert [(t.id, str(r)) for t,r in ranking.as_of(db, 150)][0] == (1, "4 (1/0/0/1)")
+    assert [(t.id, str(r)) for t,r in ranking.as_of(db, 200)] ==\
+            [(t.id, str(r)) for t,r in ranking(db)]
+
+    initial, changes = ranking.changes(db)
+    assert initial == [(1, 1), (2, 1), (3, 1)]
+    assert changes == [
+        RankChange(100, 2, 1, 2),
+        RankChange(100, 3, 1, 2),
+        RankChange(200, 1, 1, 2),
+        RankChange(200, 2, 2, 3),
+        RankChange(200, 3, 2, 1)
+    ]
+
+@tj_data
+@rescue_events
+def test_rescue_as_of(db, tournament):
+    ranking = tournament.rankings["rescue1"]
+    rescue1_a, rescue1_b = tournament.blocks["rescue1.a"], tournament.blocks["rescue1.b"]
+    ruleset = rescue1_a.ruleset
+
+    judge(db, ruleset, 1, [R(ruleset, {"time": 10})], ts=10)
+    judge(db, ruleset, 2, [R(ruleset, {"viiva_punainen": "S", "time": 100})], ts=20)
+    judge(db, ruleset, 3, [R(ruleset, {"viiva_punainen": "S", "time": 50})], ts=30)
+
+    for ts in (0, 10, 20, 30):
+        expected = brute_ranks(db, [rescue1_a, rescue1_b], RescueMaxRank, ts)
+        assert dict((t.id, r.sort_key) for t,r in ranking.as_of(db, ts)) ==\
+                dict((t, r.sort_key) for t,r in expected.items())
+
+    _, changes = ranking.changes(db)
+    assert changes == [
+        RankChange(10, 2, 1, 2),
+        RankChange(20, 1, 1, 2),
+        RankChange(20, 2, 2, 1),
+        RankChange(30, 1, 2, 1),
+        RankChange(30, 2, 1, 2)
+    ]
+
+@tj_data
+@xsumo_events
+def test_replay_edit(db, tournament):
+    ranking = tournament.rankings["xsumo.score"]
+    ruleset = tournament.blocks["xsumo"].ruleset
+
+    judge(db, ruleset, 1, XS2(WIN), ts=100)
+    assert ranking.as_of(db, 100)[0][0].id == 1
+
+    # muokkaus samalla aikaleimalla, pisteiden pituus muuttuu
+    s1, s2 = XS2([((False, "L"), (True, "W"))] * 2)
+    judge(db, ruleset, 1, [s1, s2], ts=100)
+    assert ranking.as_of(db, 100)[0][0].id == 2
+
+def test_no_replay(db, tournament):
+    with pytest.raises(ValueError):
+        tournament.rankings["xsumo.tb"].as_of(db, 0)
+
+@data(lambda: [model.Team(id=i, name="Joukkue %d" % i) for i in range(1, 7)]
+        + [model.Judge(id=1, name="Tuomari")])
+@pytest.mark.parametrize("rank", [XSumoScoreRank, XSumoWinsRank])
+def test_replay_random(db, rank):
+    rnd = random.Random(0)
+    block = robostat.Tournament().block("xsumo", XSRuleset())
+    replay = Replay(rank, block, checkpoint=4)
+
+    pairs = list(itertools.combinations(range(1, 7), 2))
+    db.add_all(make_event(teams=list(p), judges=[1], block_id="xsumo", ts_sched=i, arena="a")
+            for i,p in enumerate(pairs))
+    db.commit()
+
+    rounds = [((True, "W"), (False, "L")), ((False, "T"), (False, "T")),
+            ((False, "L"), (True, "W")), ((True, "L"), (False, "L"))]
+    for event in db.query(model.Event).all():
+        if rnd.random() < 0.8:
+            judge(db, block.ruleset, event.id, XS2([rnd.choice(rounds) for _ in range(2)]),
+                    ts=rnd.randrange(0, 20))
+
+    initial, changes = replay.changes(db)
+    current = dict(initial)
+    assert current == positions(brute_ranks(db, [block], rank, -1))
+
+    for ts in range(-1, 21):
+        expected = brute_ranks(db, [block], rank, ts)
+        assert dict((t, r.sort_key) for t,r in replay.ranks_as_of(db, ts).items()) ==\
+                dict((t, r.sort_key) for t,r in expected.items())
+
+        for c in changes:
+            if c.ts == ts:
+                assert current[c.team_id] == c.old
+                current[c.team_id] = c.new
+        assert current == positions(expected)
+
+@pytest.mark.benchmark
+def test_replay_benchmark(db, benchmark_report):
+    synth = Synth(teams=60, blocks=1)
+    synth.populate(db)
+    synth.judge(db)
+    ranking = define(1, robostat.Tournament()).rankings["xs.0.score"]
+
+    start = time.perf_counter()
+    _, changes = ranking.changes(db)
+    elapsed = time.perf_counter() - start
+    benchmark_report("%d changes in %.3fs" % (len(changes), elapsed))
+    assert elapsed < 1, "changes() took %.3fs" % elapsed
@@ -1,3 +1,4 @@
+import pickle
 import itertools
 import pytest
 from robostat.ruleset import ValidationError
@@ -115,3 +116,26 @@ def test_ranking(ruleset):
     max_ranks = dict((t, rescue.RescueMaxRank.from_scores(s)) for t,s in scores.items())
 
     assert max_ranks["A"] > max_ranks["B"] > max_ranks["C"] > max_ranks["D"] > max_ranks["E"]
+
+def test_rank_views_and_pickle(ruleset):
+    a = R(ruleset, {"viiva_punainen": "S", "time": 100})
+    b = R(ruleset, {"time": 50})
+    rank = rescue.RescueMaxRank.from_scores([b, None, a])
+
+    assert rank.best is a
+    assert rank.other_scores == [b, None]
+    assert rank.other_scores is rank.other_scores
+    assert rank.played_scores == [b, a]
+    assert str(rank) == "%s [%s, None]" % (a, b)
+    assert not hasattr(rank, "__dict__")
+
+    unplayed = rescue.RescueMaxRank.from_scores([None, None])
+    assert unplayed.other_scores == [None]
+    assert unplayed < rank
+
+    again = pickle.loads(pickle.dumps(rank))
+    assert type(again) is rescue.RescueMaxRank
+    assert again == rank
+    assert again.sort_key == rank.sort_key
+    assert again.best is again.all[2]
+    assert str(again) == str(rank)
@@ -1,4 +1,9 @@
+import io
 import os
+import sys
+import json
+import subprocess
+import time
 import pytest
 from click.testing import CliRunner
 from robostat.rsx.main import main as rsx
@@ -145,3 +150,186 @@ def test_del(runner):
     res = runner.del_("team", "Tropos")
     assert res.exit_code == 0
     assert "[-] Tropos" in res.output
+
+def test_lazy_commands():
+    # show ei saa importata muiden komentojen moduuleja
+    code = "\n".join([
+        "import sys",
+        "from robostat.rsx.main import main",
+        "main(['show', '--help'], standalone_mode=False)",
+        "assert 'robostat.rsx.show' in sys.modules",
+        "assert 'robostat.rsx.timetable' not in sys.modules",
+        "assert 'robostat.rsx.modify' not in sys.modules"
+    ])
+
+    res = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(path),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert res.returncode == 0, res.stderr.decode("utf8")
+
+def test_daemon(runner, tmp_path):
+    sock = str(tmp_path / "rsx.sock")
+    server = subprocess.Popen([
+        sys.executable, "-c", "from robostat.rsx.main import main; main()",
+        "serve", "-s", sock, "-i", init_file
+    ], cwd=os.path.dirname(path))
+
+    try:
+        for _ in range(100):
+            if os.path.exists(sock):
+                break
+            time.sleep(0.1)
+
+        daemon = lambda *args: runner.runner.invoke(rsx, [*args, "--daemon", sock])
+
+        res = daemon("show", "-d", runner.db_file, "-i", init_file, "--table-format", "plain",
+                "blocks")
+        assert res.exit_code == 0, res.output
+        assert res.output == runner.show("blocks").output
+
+        res = daemon("del", "-d", runner.db_file, "team", "Tropos")
+        assert res.exit_code == 1
+        assert "No such team" in res.output
+
+        res = daemon("metrics")
+        assert res.exit_code == 0
+        assert 'robostat_cache_lookups_total{cache="init",result="hit"}' in res.output
+        assert res.output.endswith("# EOF\n")
+    finally:
+        server.terminate()
+        server.wait()
+
+def test_daemon_cwd(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    import robostat.db as model
+    from robostat.rsx import common
+    from robostat.rsx.daemon import run_request
+
+    # palvelin pitää enginet auki komentojen välillä
+    monkeypatch.setattr(common, "engine_cache", {})
+
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        engine = create_engine("sqlite:///%s" % (tmp_path / name / "db.sqlite3"))
+        model.Base.metadata.create_all(engine)
+        db = sessionmaker(bind=engine)()
+        db.add(model.Team(id=1, name="Team%s" % name.upper()))
+        db.commit()
+        db.close()
+        engine.dispose()
+
+    def show(cwd):
+        out, err = io.StringIO(), io.StringIO()
+        code = run_request({"argv": ["show", "-d", "db.sqlite3", "-f", "csv", "teams"],
+            "cwd": str(cwd)}, out, err)
+        assert code == 0, err.getvalue()
+        return out.getvalue()
+
+    for _ in range(2):
+        assert "TeamA" in show(tmp_path / "a")
+        assert "TeamB" in show(tmp_path / "b")
+
+    assert len(common.engine_cache) == 2
+
+def test_watch_rejected(tmp_path):
+    from robostat.rsx.daemon import run_request
+
+    out, err = io.StringIO(), io.StringIO()
+    code = run_request({"argv": ["show", "-d", "db.sqlite3", "--watch", "teams"],
+        "cwd": str(tmp_path)}, out, err)
+    assert code == 2
+    assert "--watch can't be used through the daemon" in err.getvalue()
+
+    res = CliRunner().invoke(rsx, ["explain", "-d", "db.sqlite3", "-w", "teams"])
+    assert res.exit_code == 2
+    assert "--watch can't be used with explain" in res.output
+
+def test_show_formats(runner):
+    res = runner.show("blocks")
+    assert res.exit_code == 0
+    n_blocks = len(res.output.strip().split("\n")) - 1
+
+    res = runner.show("blocks", "-f", "csv")
+    lines = res.output.strip().split("\n")
+    assert lines[0] == "Id,Name,Time,Judging"
+    assert len(lines) == n_blocks + 1
+
+    res = runner.show("blocks", "-f", "tsv")
+    assert res.output.split("\n")[0] == "Id\tName\tTime\tJudging"
+
+    res = runner.show("blocks", "-f", "ndjson")
+    rows = [json.loads(l) for l in res.output.strip().split("\n")]
+    assert len(rows) == n_blocks
+    assert all(set(r) == {"id", "name", "time", "judging"} for r in rows)
+
+    res = runner.show("blocks", "--batch", "1")
+    assert res.exit_code == 0
+    assert len(res.output.strip().split("\n")) == n_blocks + 1
+
+def test_show_watch(tmp_path):
+    from sqlalchemy import create_engine
+    import robostat.db as model
+    from robostat.rsx.common import SQLAParam
+    from robostat.rsx.show import ShowOpt, LiveFormatter, watch
+
+    db_url = "sqlite:///%s" % (tmp_path / "db.sqlite3")
+    model.Base.metadata.create_all(create_engine(db_url))
+    db = SQLAParam(create_engine(db_url))
+    other = create_engine(db_url)
+    calls = []
+
+    # toinen yhteys kirjoittaa, jonka jälkeen watch ajaa komennon uudestaan
+    def show(opt):
+        calls.append(opt.db.query(model.Team).count())
+        if len(calls) == 1:
+            other.execute(model.Team.__table__.insert(), name="Joukkue")
+        elif len(calls) == 2:
+            raise KeyboardInterrupt
+
+    watch(show, ShowOpt(db, None, LiveFormatter("plain"), None, False), interval=0)
+    assert calls == [0, 1]
+    db.close()
+
+def test_live_formatter(capsys):
+    from robostat.rsx.show import LiveFormatter
+
+    fmt = LiveFormatter("plain")
+    fmt.write_table(["A"], [["x"], ["y"]])
+    assert capsys.readouterr().out == "A\nx\ny\n"
+
+    # vain muuttunut rivi kirjoitetaan uudestaan
+    fmt.write_table(["A"], [["x"], ["z"]])
+    assert capsys.readouterr().out == "\x1b[1A\r\x1b[2Kz\x1b[1B\r"
+
+    fmt.write_table(["A"], [["x"]])
+    assert capsys.readouterr().out == "\x1b[3A\x1b[J" + "A\nx\n"
+
+def test_bench(runner):
+    res = runner.runner.invoke(rsx, ["bench", "-n", "6", "-m", "1", "-r", "1", "--played", "0.5",
+        "-o", "bench.json"])
+    assert res.exit_code == 0, res.output
+
+    with open("bench.json") as f:
+        out = json.load(f)
+
+    assert out["params"]["teams"] == 6
+    assert "populate" in out["results"]
+    assert "ranking.xs.0.tb" in out["results"]
+    assert "show.ranking.rescue1" in out["results"]
+
+    res = runner.runner.invoke(rsx, ["bench", "-n", "6", "-m", "1", "-r", "1", "--played", "0.5",
+        "-o", "bench2.json", "--compare", "bench.json"])
+    assert res.exit_code == 0, res.output
+    assert "Ratio" in res.output
+
+def test_explain(runner):
+    res = runner.runner.invoke(rsx, ["explain", "-d", runner.db_file, "-i", init_file,
+        "ranking", "xsumo.tb"])
+    assert res.exit_code == 0, res.output
+    assert "ranking:xsumo.tb > block:xsumo" in res.output
+    assert "no issues" in res.output
+
+def test_migrate(runner):
+    res = runner.runner.invoke(rsx, ["migrate", "-d", runner.db_file])
+    assert res.exit_code == 0, res.output
+    assert "up to date" in res.output
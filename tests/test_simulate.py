@@ -0,0 +1,106 @@
+import pytest
+import robostat.db as model
+from robostat.rulesets.xsumo import XSumoScoreRank, XSumoWinsRank
+from .helpers import XS2, data
+from .test_tournament import tj_data, xsumo_events
+
+pytest.importorskip("numpy")
+from robostat.simulate import block_state, simulate
+
+WIN = [((True, "W"), (False, "L"))]
+TIE = [((False, "T"), (False, "T"))]
+
+def set_scores(db, tournament, results):
+    ruleset = tournament.blocks["xsumo"].ruleset
+
+    for event_id, rounds in results.items():
+        scores = db.query(model.Score)\
+                .filter_by(event_id=event_id)\
+                .order_by(model.Score.team_id)\
+                .all()
+        for score, s in zip(scores, XS2(rounds)):
+            score.data = ruleset.encode(s)
+
+    db.commit()
+
+@tj_data
+@xsumo_events
+def test_block_state(db, tournament):
+    set_scores(db, tournament, {1: WIN})
+    state = block_state(db, tournament.blocks["xsumo"])
+
+    assert state.team_ids == [1, 2, 3]
+    s1, s2 = XS2(WIN)
+    assert state.base.tolist() == [[int(s1), 1, 0], [int(s2), 0, 0], [0, 0, 0]]
+    assert state.history == [[int(s1)], [int(s2)], []]
+    assert sorted(map(sorted, state.remaining)) == [[0, 2], [1, 2]]
+
+@tj_data
+@xsumo_events
+def test_simulate_played(db, tournament):
+    set_scores(db, tournament, {1: WIN, 2: WIN, 3: TIE})
+    state = block_state(db, tournament.blocks["xsumo"])
+    res = simulate(state, XSumoScoreRank, n=100)
+
+    ranks = tournament.rankings["xsumo.score"](db)
+    expected = dict((t.id, i) for i,(t,_) in enumerate(ranks, start=1))
+    assert res.expected_position() == expected
+    assert res.top(1) == dict((t, float(p == 1)) for t,p in expected.items())
+
+@tj_data
+@xsumo_events
+def test_simulate_dominant(db, tournament):
+    # 1 voitti kakkosen, 2 voitti kolmosen: 1 voittaa aina kolmosen
+    set_scores(db, tournament, {1: WIN, 2: WIN})
+    state = block_state(db, tournament.blocks["xsumo"])
+
+    for rank in (XSumoScoreRank, XSumoWinsRank):
+        res = simulate(state, rank, n=500, seed=1, workers=1, chunk_size=128)
+        assert res.positions.sum(axis=1).tolist() == [500, 500, 500]
+        assert res.top(1)[1] == 1.0
+        assert res.top(2)[3] == 0.0
+        assert res.expected_position() == {1: 1.0, 2: 2.0, 3: 3.0}
+
+@tj_data
+@xsumo_events
+def test_simulate_tiebreaks(db, tournament):
+    set_scores(db, tournament, {1: TIE, 2: TIE, 3: TIE})
+    state = block_state(db, tournament.blocks["xsumo"])
+
+    res = simulate(state, XSumoScoreRank, n=10)
+    assert res.expected_position() == {1: 1.0, 2: 1.0, 3: 1.0}
+
+    res = simulate(state, XSumoScoreRank, n=10, tiebreaks={3: 1})
+    assert res.expected_position() == {1: 2.0, 2: 2.0, 3: 1.0}
+
+    with pytest.raises(ValueError):
+        simulate(state, XSumoScoreRank, n=0)
+
+@tj_data
+@xsumo_events
+@data(lambda: [
+    model.Team(id=5, name="Joukkue E"),
+    model.Team(id=6, name="Joukkue F")
+])
+def test_simulate_seed(db, tournament):
+    db.add_all([
+        model.Event(block_id="xsumo", ts_sched=3+i, arena="xsumo.1")
+        for i in range(4)
+    ])
+    db.commit()
+
+    for event, teams in zip(db.query(model.Event).filter(model.Event.id > 3).order_by(model.Event.id),
+            [(5, 6), (1, 5), (2, 6), (3, 5)]):
+        event.team_ids.extend(teams)
+        event.judge_ids.append(1)
+    db.commit()
+
+    set_scores(db, tournament, {1: WIN, 2: TIE, 4: [((True, "W"), (True, "L"))]})
+    state = block_state(db, tournament.blocks["xsumo"])
+    assert len(state.remaining) == 4
+
+    a = simulate(state, XSumoScoreRank, n=1000, seed=123, workers=1, chunk_size=300)
+    b = simulate(state, XSumoScoreRank, n=1000, seed=123, workers=2, chunk_size=300)
+    assert (a.positions == b.positions).all()
+    assert (a.positions.sum(axis=1) == 1000).all()
+    assert 0 < a.top(4)[2] < 1
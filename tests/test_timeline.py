@@ -0,0 +1,114 @@
+import types
+import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+import robostat.db as model
+from robostat.timeline import Timeline
+from robostat.tournament import change_token
+from .helpers import make_event
+
+UTC = datetime.timezone.utc
+HELSINKI = datetime.timezone(datetime.timedelta(hours=2))
+
+# 1.1.2020 00:00 UTC
+DAY = 1577836800
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine("sqlite:///%s" % (tmp_path / "db.sqlite3"))
+    model.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([
+        model.Team(id=1, name="Joukkue A"),
+        model.Team(id=2, name="Joukkue B"),
+        model.Judge(id=1, name="Tuomari A"),
+        make_event(teams=[1, 2], judges=[1], block_id="xsumo", ts_sched=DAY+600, arena="a"),
+        make_event(teams=[2, 1], judges=[1], block_id="xsumo", ts_sched=DAY+1200, arena="a"),
+        make_event(teams=[1], judges=[1], block_id="rescue", ts_sched=DAY+900, arena="b"),
+        # edellinen päivä UTC:nä, sama päivä Helsingissä
+        make_event(teams=[2], judges=[1], block_id="rescue", ts_sched=DAY-3600, arena="a")
+    ])
+    db.commit()
+    db.close()
+    return engine
+
+def test_timeline(engine):
+    tl = Timeline(engine, tz=UTC)
+    assert tl.refresh()
+    assert not tl.refresh()
+
+    assert tl.current("a", DAY+599) is None
+    assert tl.current("a", DAY+600).ts_sched == DAY+600
+    assert tl.current("a", DAY+1199).ts_sched == DAY+600
+    assert tl.current("a", DAY+5000).ts_sched == DAY+1200
+    assert tl.current("b", DAY+1000).teams == [(1, "Joukkue A")]
+    assert tl.current("c", DAY) is None
+
+    assert [e.ts_sched for e in tl.next("a", DAY+600)] == [DAY+1200]
+    assert [e.ts_sched for e in tl.next("a", DAY, n=5)] == [DAY+600, DAY+1200]
+    assert [e.ts_sched for e in tl.previous("a", DAY+1300)] == [DAY+600]
+    assert [e.ts_sched for e in tl.previous("a", DAY+1300, n=5)] == [DAY-3600, DAY+600]
+    assert [e.ts_sched for e in tl.window("a", DAY+600, DAY+1200)] == [DAY+600]
+
+    # edellisen päivän suoritus ei ole enää käynnissä
+    assert tl.current("a", DAY+1) is None
+    assert [e.ts_sched for e in tl.schedule("a", DAY)] == [DAY+600, DAY+1200]
+    assert [e.ts_sched for e in tl.schedule("a", datetime.date(2019, 12, 31))] == [DAY-3600]
+
+    tl.close()
+
+def test_timeline_tz(engine):
+    tl = Timeline(engine, tz=HELSINKI)
+    tl.refresh()
+
+    # Helsingissä kaikki on samaa päivää
+    assert tl.current("a", DAY+1).ts_sched == DAY-3600
+    assert [e.ts_sched for e in tl.schedule("a", DAY)] == [DAY-3600, DAY+600, DAY+1200]
+    tl.close()
+
+def test_timeline_duration(engine):
+    tl = Timeline(engine, tz=UTC, duration=300)
+    tl.refresh()
+
+    assert tl.current("a", DAY+899).ts_sched == DAY+600
+    assert tl.current("a", DAY+900) is None
+    assert [e.ts_sched for e in tl.previous("a", DAY+900)] == [DAY+600]
+    tl.close()
+
+def test_timeline_refresh(engine):
+    tl = Timeline(engine, tz=UTC)
+    tl.refresh()
+
+    # toinen yhteys kirjoittaa
+    db = sessionmaker(bind=engine)()
+    db.add(make_event(teams=[1], judges=[1], block_id="rescue", ts_sched=DAY+1800, arena="b"))
+    db.commit()
+    db.close()
+
+    assert tl.refresh()
+    assert [e.ts_sched for e in tl.next("b", DAY+900)] == [DAY+1800]
+    assert not tl.refresh()
+    tl.close()
+
+# Muiden kantojen token sqlitellä
+class OtherDialect:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.dialect = types.SimpleNamespace(name="postgresql")
+
+    def execute(self, *args):
+        return self.conn.execute(*args)
+
+def test_change_token_schedule(engine):
+    e = model.Event.__table__
+
+    with engine.connect() as conn:
+        conn = OtherDialect(conn)
+        token = change_token(conn)
+        assert change_token(conn) == token
+
+        # siirto muuttaa tokenia vaikka eventtien määrä ja viimeisin aika pysyvät samoina
+        conn.execute(e.update().where(e.c.id == 3).values(ts_sched=DAY+950))
+        assert change_token(conn) != token
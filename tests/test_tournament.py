@@ -1,9 +1,17 @@
+import asyncio
+import threading
 import pytest
-from sqlalchemy.orm import subqueryload
+from sqlalchemy import create_engine
+from sqlalchemy.orm import subqueryload, sessionmaker
 from sqlalchemy.exc import IntegrityError
 import robostat
 import robostat.db as model
-from robostat.util import enumerate_rank
+import robostat.util
+from robostat.util import enumerate_rank, rank_positions
+from robostat.tournament import sort_ranking, fetch_page, EVENT_KEY, SCORE_KEY,\
+        decode_block_scores, decode_block_scores_async, profile, tiebreak_weights,\
+        combine_tiebreaks, KeyedRank, enumerate_ranking, MultiBlockAggregate, WeightedRank,\
+        judge_queue, ranking_cursor, tiebreak_ranking, _AsyncBridge
 from robostat.rulesets.xsumo import XSRuleset
 from .helpers import XS2, R, data, make_event
 
@@ -196,6 +204,116 @@ def test_hide_shadows(db, tournament):
     assert tournament.blocks["rescue1.a"].events_query(db, hide_shadows=True).count() == 2
     assert tournament.blocks["rescue1.a"].events_query(db, hide_shadows=False).count() == 3
 
+@tj_data
+@rescue_events
+def test_multi_block_aggregate(db, tournament):
+    a, b = tournament.blocks["rescue1.a"], tournament.blocks["rescue1.b"]
+    ruleset = a.ruleset
+
+    # joukkue 1: A:ssa hyvä, B:ssä huono; joukkue 2 toisin päin
+    for block_id, team_id, values in (
+            ("rescue1.a", 1, {"viiva_punainen": "S", "time": 10}),
+            ("rescue1.b", 1, {"time": 10}),
+            ("rescue1.a", 2, {"time": 20}),
+            ("rescue1.b", 2, {"viiva_punainen": "S", "viiva_palat": (0, 1, 0), "time": 20})):
+        score = db.query(model.Score).join(model.Score.event)\
+                .filter(model.Event.block_id == block_id, model.Score.team_id == team_id).one()
+        score.data = ruleset.encode(R(ruleset, values))
+    db.commit()
+
+    points = lambda ss: max((int(s) for s in ss if s is not None), default=0)
+
+    with profile() as p:
+        ranks = MultiBlockAggregate((a, 1, points), (b, 2, points))(db)
+
+    # molemmat lohkot yhdellä kyselyllä
+    assert p.stats[("block:rescue1.a,rescue1.b",)].queries == 1
+    assert p.stats[("block:rescue1.a,rescue1.b", "decode")].items == 4
+
+    t1, t2 = sorted(ranks, key=lambda t: t.id)
+    assert isinstance(ranks[t1], WeightedRank)
+    assert (ranks[t1].weight, ranks[t1].rank) == (2, 0)
+    assert (ranks[t2].weight, ranks[t2].rank) == (2, 30)
+
+    ranks = MultiBlockAggregate((a, 1, points), (b, 2, points), policy="best")(db)
+    assert (ranks[t1], ranks[t2]) == (20, 30)
+
+    ranks = MultiBlockAggregate((a, 1, points), (b, 2, points), policy="sum")(db)
+    assert (ranks[t1], ranks[t2]) == (20, 60)
+
+    ranks = MultiBlockAggregate((a, 1, points), policy=lambda rs: len(rs))(db)
+    assert (ranks[t1], ranks[t2]) == (1, 1)
+
+    with pytest.raises(ValueError):
+        MultiBlockAggregate((a, 1, points), policy="avg")
+
+@tj_data
+@xsumo_events
+@rescue_events
+def test_team_history(db, tournament):
+    ruleset = tournament.blocks["rescue1.a"].ruleset
+    score = db.query(model.Score).join(model.Score.event)\
+            .filter(model.Event.block_id == "rescue1.a", model.Score.team_id == 1).one()
+    score.data = ruleset.encode(R(ruleset, {"viiva_punainen": "S", "time": 10}))
+    db.commit()
+    db.expire_all()
+
+    with profile() as p:
+        history = tournament.team_history(db, 1)
+        # kaikki ladattu valmiiksi
+        events = [e for es in history.values() for e in es]
+        judges = [j.judge.name for e in events for j in e.judgings]
+        teams = [t.name for e in events for t in e.teams]
+        decoded = [s.decoded_score for e in events for s in e.scores]
+
+    assert p.stats[("team:1",)].queries == 3
+    assert p.stats[()].queries == 3
+
+    assert list(history) == ["xsumo", "rescue1.a", "rescue1.b"]
+    assert [e.ts_sched for e in history["xsumo"]] == [0, 2]
+    assert all(1 in e.team_ids for e in events)
+    assert len(judges) == 4
+    assert "Joukkue C" in teams
+
+    # xsumossa myös vastustajan scoret
+    assert [len(e.scores) for e in events] == [2, 2, 1, 1]
+    assert sum(d is not None for d in decoded) == 1
+    assert int(history["rescue1.a"][0].scores[0].decoded_score) == 20
+
+    assert tournament.team_history(db, 100) == {}
+
+@tj_data
+@xsumo_events
+@rescue_events
+def test_judge_queue(db):
+    db.query(model.EventJudging)\
+            .filter_by(event_id=1, judge_id=1)\
+            .update({"ts": 100})
+    db.commit()
+    db.expire_all()
+
+    with profile() as p:
+        overdue, upcoming = judge_queue(db, 1, now=1)
+        teams = [sorted(t.id for t in j.event.teams) for j in overdue + upcoming]
+
+    # judgingit ja joukkueet, ei lazy loadeja
+    assert p.stats[()].queries == 2
+
+    # xsumo 1 on jo tuomaroitu
+    assert [(j.event.block_id, j.event.ts_sched) for j in overdue] == [("rescue1.a", 0)]
+    assert [(j.event.block_id, j.event.ts_sched) for j in upcoming] == [
+        ("xsumo", 1),
+        ("rescue1.b", 1),
+        ("xsumo", 2)
+    ]
+    assert teams == [[1], [2, 3], [1], [1, 3]]
+
+    overdue, upcoming = judge_queue(db, 1, now=1, limit=2)
+    assert len(overdue) == 1 and len(upcoming) == 1
+
+    assert judge_queue(db, 2, now=100)[1] == []
+    assert judge_queue(db, 100) == ([], [])
+
 @tj_data
 def test_weighted_ranking(db, tournament):
     event_a = make_event(teams=[1], judges=[1], block_id="rescue1.a", ts_sched=0, arena="rescue.1")
@@ -248,3 +366,346 @@ def test_tiebreak_with_scores(db, tournament):
     ranks = ranking(db)
     assert [t.id for t,_ in ranks] == [1, 2, 3]
     assert [i for i,_ in enumerate_rank(ranks, key=lambda x:x[1])] == [1, 2, 3]
+
+@tj_data
+@data(lambda: [
+    model.Tiebreak(ranking_id="a", team_id=1, weight=3),
+    model.Tiebreak(ranking_id="a", team_id=2, weight=2),
+    model.Tiebreak(ranking_id="b", team_id=2, weight=5)
+])
+def test_tiebreak_weights(db):
+    with profile() as p:
+        a, b, c = tiebreak_weights(db, "a", "b", "c")
+
+    assert p.stats[("tiebreaks",)].queries == 1
+    assert a == {1: 3, 2: 2}
+    assert b == {2: 5}
+    assert c == {}
+
+    # joukkueet ladataan samalla kyselyllä
+    db.expunge_all()
+    with profile() as p:
+        ranks = dict((t.id, w) for t,w in tiebreak_ranking(db, "a").items())
+
+    assert p.stats[("tiebreaks",)].queries == 1
+    assert ranks == {1: 3, 2: 2}
+
+def test_combine_tiebreaks():
+    class T:
+        def __init__(self, id):
+            self.id = id
+
+    t1, t2, t3 = T(1), T(2), T(3)
+    combined = combine_tiebreaks({t1: 1, t2: 1, t3: 2}, {1: 1, 2: 2}, {3: 7})
+
+    assert combined[t1].key == (1, 1, 0)
+    assert combined[t2].key == (1, 2, 0)
+    assert combined[t3].key == (2, 0, 7)
+    assert [t for t,_ in sort_ranking(combined.items())] == [t3, t2, t1]
+    assert [t for t,_ in sort_ranking(combined.items(), limit=2)] == [t3, t2]
+
+    # puuttuva tiebreak on 0
+    missing = combine_tiebreaks({t1: 1, t3: 1}, {1: 0})
+    assert missing[t1] == missing[t3]
+
+    # sort_key littistetään avaimeen
+    from robostat.rulesets.xsumo import XSumoScoreRank
+    r = XSumoScoreRank()
+    r.score, r.wins = 3, 1
+    assert KeyedRank(r, (4,)).key == (3, 1, 0, 4)
+
+@pytest.mark.parametrize("keys", [
+    [5, 3, 3, 1],
+    [5.0, 3.5, 3.5, 1.0],
+    [(2, 1), (1, 5), (1, 5), (0, 0)],
+    ["a", "b", "b", "b"],
+    [(1, (2, 3)), (1, (2, 3)), (0,)]
+])
+@pytest.mark.parametrize("numpy", [True, False])
+def test_rank_positions(keys, numpy, monkeypatch):
+    if not numpy:
+        monkeypatch.setattr(robostat.util, "np", None)
+
+    expected = [i for i,_ in enumerate_rank(keys)]
+    assert rank_positions(keys) == expected
+    assert rank_positions(keys, "ordinal") == list(range(1, len(keys)+1))
+
+    dense = rank_positions(keys, "dense")
+    assert dense[0] == 1 and max(dense) == len(set(keys))
+    assert all(b-a in (0, 1) for a,b in zip(dense, dense[1:]))
+
+    frac = rank_positions(keys, "fractional")
+    assert sum(frac) == sum(range(1, len(keys)+1))
+
+    assert rank_positions([], "dense") == []
+    assert rank_positions([7], "fractional") == [1]
+
+def test_rank_positions_modes():
+    keys = [9, 7, 7, 5, 3, 3, 3]
+    assert rank_positions(keys) == [1, 2, 2, 4, 5, 5, 5]
+    assert rank_positions(keys, "dense") == [1, 2, 2, 3, 4, 4, 4]
+    assert rank_positions(keys, "ordinal") == [1, 2, 3, 4, 5, 6, 7]
+    assert rank_positions(keys, "fractional") == [1, 2.5, 2.5, 4, 6, 6, 6]
+    assert rank_positions(keys, start=0) == [0, 1, 1, 3, 4, 4, 4]
+
+    with pytest.raises(ValueError):
+        rank_positions(keys, "olympic")
+
+@tj_data
+@xsumo_events
+def test_enumerate_ranking(db, tournament):
+    ranks = tournament.rankings["xsumo.score"](db)
+    expected = list(enumerate_rank(ranks, key=lambda x:x[1]))
+
+    assert enumerate_ranking(ranks) == expected
+    assert [p for p,_ in enumerate_ranking(ranks, "ordinal")] == [1, 2, 3]
+    assert [p for p,_ in enumerate_ranking(ranks, "fractional")] == [2, 2, 2]
+
+def test_sort_ranking_limit():
+    groups = [("a", 1), ("b", 5), ("c", 3), ("d", 5), ("e", 0), ("f", 3)]
+    full = sort_ranking(groups)
+
+    for k in range(len(groups)+2):
+        assert sort_ranking(groups, limit=k) == full[:k]
+
+    # tasatulokset joukkueen mukaan järjestyksestä riippumatta
+    assert full == sort_ranking(reversed(groups))
+    assert [t for t,_ in full] == ["b", "d", "c", "f", "a", "e"]
+
+@tj_data
+@xsumo_events
+def test_ranking_limit(db, tournament):
+    ranking = tournament.rankings["xsumo.score"]
+    full = ranking(db)
+
+    assert ranking(db, limit=2) == full[:2]
+    assert ranking(db, limit=2, offset=1) == full[1:3]
+    assert ranking(db, offset=2) == full[2:]
+
+def test_ranking_top_k(db):
+    tournament = robostat.Tournament()
+    calls = []
+
+    @tournament.ranking("top")
+    def rank_top(db, limit=None):
+        calls.append(limit)
+        return sort_ranking([("a", 1), ("b", 3), ("c", 2)], limit=limit)
+
+    @tournament.ranking("full")
+    def rank_full(db):
+        return sort_ranking([("a", 1), ("b", 3), ("c", 2)])
+
+    assert tournament.rankings["top"](db, limit=1, offset=1) == [("c", 2)]
+    assert tournament.rankings["full"](db, limit=1, offset=1) == [("c", 2)]
+    assert tournament.rankings["top"](db) == [("b", 3), ("c", 2), ("a", 1)]
+    assert calls == [2, None]
+
+@tj_data
+@xsumo_events
+def test_keyset_pages(db, tournament):
+    block = tournament.blocks["xsumo"]
+    all_scores = block.scores_query(db, after=()).all()
+    all_events = block.events_query(db, after=()).all()
+
+    for key, query, everything in (
+            (SCORE_KEY, block.scores_query, all_scores),
+            (EVENT_KEY, block.events_query, all_events)):
+        got, cursor = [], ()
+        while cursor is not None:
+            rows, cursor = fetch_page(query(db, after=cursor), key, 2)
+            got.extend(rows)
+        assert got == everything
+
+@tj_data
+@xsumo_events
+def test_ranking_after(db, tournament):
+    ranking = tournament.rankings["xsumo.score"]
+    full = ranking(db)
+
+    pages, cursor = [], None
+    while True:
+        page = ranking(db, after=cursor, limit=1)
+        if not page:
+            break
+        pages.extend(page)
+        cursor = ranking_cursor(*page[-1])
+    assert pages == full
+
+    # kaikki ovat tasapisteissä: tasatulokset id:n mukaan, ja kursori on avain eikä
+    # joukkue, joten listalta puuttuva joukkue kelpaa
+    key, _ = ranking_cursor(*full[0])
+    assert [t.id for t,_ in full] == [1, 2, 3]
+    assert ranking(db, after=(key, 0)) == full
+    assert ranking(db, after=(key, 2)) == full[2:]
+    assert ranking(db, after=(key, 99)) == []
+
+    with pytest.raises(ValueError):
+        ranking(db, after=(key, 1), offset=1)
+
+def test_evaluate_rankings_parallel(tmp_path, tournament):
+    db_url = "sqlite:///%s" % (tmp_path / "db.sqlite3")
+    engine = create_engine(db_url)
+    model.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+
+    @tj_data
+    @xsumo_events
+    @rescue_events
+    def fill(db):
+        pass
+
+    fill(db=db)
+
+    scores = db.query(model.Score).filter_by(event_id=1).order_by(model.Score.team_id).all()
+    s1, s2 = XS2([((True, "W"), (False, "L"))])
+    scores[0].data = tournament.blocks["xsumo"].ruleset.encode(s1)
+    scores[1].data = tournament.blocks["xsumo"].ruleset.encode(s2)
+    db.commit()
+
+    ranks = tournament.evaluate_rankings(db_url, workers=2)
+    assert set(ranks) == set(tournament.rankings)
+
+    for id, ranking in tournament.rankings.items():
+        expected = list(enumerate_rank(ranking(db), key=lambda x:x[1]))
+        assert [t.id for t,_ in ranks[id]] == [t.id for _,(t,_) in expected]
+        assert [r.position for _,r in ranks[id]] == [i for i,_ in expected]
+        assert [str(r) for _,r in ranks[id]] == [str(r) for _,(_,r) in expected]
+
+def rescue_db(path, tournament):
+    # Session ajetaan executorin säikeessä
+    engine = create_engine("sqlite:///%s" % path, connect_args={"check_same_thread": False})
+    model.Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+
+    @tj_data
+    @rescue_events
+    def fill(db):
+        pass
+
+    fill(db=db)
+
+    ruleset = tournament.blocks["rescue1.a"].ruleset
+    score = tournament.blocks["rescue1.a"].scores_query(db).first()
+    score.data = ruleset.encode(R(ruleset, {"viiva_punainen": "S", "time": 100}))
+    db.commit()
+
+    return db
+
+def test_async_api(tmp_path, tournament):
+    db = rescue_db(tmp_path / "db.sqlite3", tournament)
+    block_a, block_b = tournament.blocks["rescue1.a"], tournament.blocks["rescue1.b"]
+
+    async def run():
+        return (
+            await block_a.decode_scores_async(db),
+            await decode_block_scores_async(db, block_a, block_b),
+            await tournament.rankings["rescue1"].evaluate_async(db, limit=1)
+        )
+
+    scores, block_scores, ranks = asyncio.run(run())
+
+    assert [(t.id, str(s)) for t,s in scores] == [(t.id, str(s))
+            for t,s in block_a.decode_scores(db)]
+    assert [(t.id, str(s)) for t,s in block_scores] == [(t.id, str(s))
+            for t,s in decode_block_scores(db, block_a, block_b)]
+    assert ranks == tournament.rankings["rescue1"](db, limit=1)
+
+# AsyncSessionin run_sync tavallisen Sessionin päällä
+class LoopSession:
+
+    def __init__(self, db):
+        self.db = db
+        self.threads = set()
+
+    async def run_sync(self, f, *args, **kwargs):
+        self.threads.add(threading.get_ident())
+        return f(self.db, *args, **kwargs)
+
+def test_async_ranking_executor(tmp_path, tournament):
+    db = rescue_db(tmp_path / "db.sqlite3", tournament)
+    session = LoopSession(db)
+    threads = {}
+    other = robostat.Tournament()
+
+    @other.ranking("rescue1")
+    def rank_rescue1(db, limit=None):
+        threads["ranking"] = threading.get_ident()
+        return tournament.rankings["rescue1"].f(db, limit=limit)
+
+    async def run():
+        threads["loop"] = threading.get_ident()
+        return await other.rankings["rescue1"].evaluate_async(session, limit=1)
+
+    ranks = asyncio.run(run())
+
+    assert ranks == tournament.rankings["rescue1"](db, limit=1)
+    # kyselyt event loopissa, ranking executorissa
+    assert session.threads == {threads["loop"]}
+    assert threads["ranking"] != threads["loop"]
+
+def test_async_bridge_attributes():
+    query = _AsyncBridge(None, None).query(model.Team).filter(model.Team.id == 1).limit(1)
+
+    # vain tunnetut metodit, ominaisuudet eivät muutu metodikutsuiksi
+    with pytest.raises(AttributeError):
+        query.statement
+    assert not hasattr(query, "column_descriptions")
+    assert not hasattr(query, "delete")
+
+def test_async_session(tmp_path, tournament):
+    pytest.importorskip("aiosqlite")
+    sa_asyncio = pytest.importorskip("sqlalchemy.ext.asyncio")
+
+    path = tmp_path / "db.sqlite3"
+    db = rescue_db(path, tournament)
+    block_a, block_b = tournament.blocks["rescue1.a"], tournament.blocks["rescue1.b"]
+    ranking = tournament.rankings["rescue1"]
+
+    async def run():
+        engine = sa_asyncio.create_async_engine("sqlite+aiosqlite:///%s" % path)
+        try:
+            async with sa_asyncio.AsyncSession(engine) as adb:
+                return (
+                    await block_a.decode_scores_async(adb),
+                    await decode_block_scores_async(adb, block_a, block_b),
+                    await ranking.evaluate_async(adb),
+                    await ranking.evaluate_async(adb, limit=1)
+                )
+        finally:
+            await engine.dispose()
+
+    scores, block_scores, ranks, top = asyncio.run(run())
+
+    assert [(t.id, str(s)) for t,s in scores] == [(t.id, str(s))
+            for t,s in block_a.decode_scores(db)]
+    assert [(t.id, str(s)) for t,s in block_scores] == [(t.id, str(s))
+            for t,s in decode_block_scores(db, block_a, block_b)]
+    assert [(t.id, str(r)) for t,r in ranks] == [(t.id, str(r)) for t,r in ranking(db)]
+    assert [(t.id, str(r)) for t,r in top] == [(t.id, str(r)) for t,r in ranking(db, limit=1)]
+
+@tj_data
+@xsumo_events
+def test_profile(db, tournament):
+    with profile() as p:
+        tournament.rankings["xsumo.tb"](db)
+
+    stats = p.stats
+    assert stats[("ranking:xsumo.tb",)].calls == 1
+    # lohkon pisteet yhdellä kyselyllä (ei erillisiä Score.team-latauksia), tiebreakit toisella
+    assert stats[("ranking:xsumo.tb", "block:xsumo")].queries == 1
+    assert stats[("ranking:xsumo.tb", "tiebreaks")].queries == 1
+    assert stats[("ranking:xsumo.tb",)].queries == 2
+    assert stats[("ranking:xsumo.tb", "block:xsumo", "decode")].items == 6
+    assert [(d, n) for d,n,_ in p.tree()] == [
+        (0, "ranking:xsumo.tb"),
+        (1, "block:xsumo"),
+        (2, "decode"),
+        (1, "aggregate"),
+        (1, "tiebreaks"),
+        (1, "combine"),
+        (1, "sort")
+    ]
+
+    # kuuntelija poistuu kontekstin jälkeen
+    tournament.rankings["xsumo.tb"](db)
+    assert stats[("ranking:xsumo.tb",)].calls == 1